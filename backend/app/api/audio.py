@@ -0,0 +1,53 @@
+from fastapi import APIRouter, HTTPException, Request, Response, status
+from fastapi.responses import FileResponse
+import os
+
+from app.llm.audio_store import AudioStore
+
+router = APIRouter()
+
+AUDIO_MEDIA_TYPES = {
+    ".wav": "audio/wav",
+    ".mp3": "audio/mpeg",
+    ".pcm": "audio/L16",
+    ".opus": "audio/ogg"
+}
+
+# GET /audio/{filename} - 获取本地保存的TTS音频
+@router.get("/{filename}")
+def get_audio(filename: str, request: Request):
+    """
+    获取本地音频文件
+    
+    - 文件名为内容哈希，内容不会变化，ETag 即哈希值，可长期缓存
+    - 支持 If-None-Match（返回304）和 Range 分段请求（返回206）
+    """
+    parsed = AudioStore.parse_filename(filename)
+    if parsed is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="音频不存在"
+        )
+    digest, extension = parsed
+    path = AudioStore.path_for(digest, extension)
+    if not path.exists():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="音频不存在或已过期"
+        )
+    
+    etag = f'"{digest}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable"
+    }
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    # 记录访问时间，供存储清理按最近使用排序
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    
+    return FileResponse(path, media_type=AUDIO_MEDIA_TYPES[extension], headers=headers)
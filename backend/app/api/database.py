@@ -1,16 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
 from datetime import datetime
 from typing import Dict, Any
 
 from app.db.session import get_db, init_database, test_database_connection
+from app.db.async_session import get_async_db
 from app.models.role import Role
 from app.models.user import User
 from app.models.chat_sessions import ChatSessions
 from app.models.chat_messages import ChatMessages
 from app.models.role_settings import RoleSettings
-from app.services.role_service import RoleService
+from app.services.role_service import RoleService, AsyncRoleService
+from app.services.role_catalog import role_catalog
 
 router = APIRouter()
 
@@ -339,6 +342,9 @@ def initialize_database(db: Session = Depends(get_db)):
         except Exception as e:
             print(f"角色设定数据初始化过程中发生错误: {str(e)}")
         
+        # 角色与角色设定已变化，清空角色目录缓存
+        role_catalog.clear()
+        
         return {
             "success": True,
             "message": "数据库初始化完成",
@@ -393,19 +399,19 @@ def test_connection():
         )
 
 @router.get("/status")
-def get_database_status(db: Session = Depends(get_db)):
+async def get_database_status(db: AsyncSession = Depends(get_async_db)):
     """
-    获取数据库状态信息
+    获取数据库状态信息（只读查询走只读副本）
     
     Returns:
         数据库状态信息
     """
     try:
-        role_service = RoleService(db)
+        role_service = AsyncRoleService(db)
         
         # 统计各表数据量
-        roles_count = len(role_service.get_roles(limit=1000))  # 简单统计
-        system_roles_count = len(role_service.get_system_roles())
+        roles_count = len(await role_service.get_roles(limit=1000))  # 简单统计
+        system_roles_count = len(await role_service.get_system_roles())
         
         return {
             "success": True,
@@ -446,6 +452,7 @@ def reset_database(confirm: bool = False, db: Session = Depends(get_db)):
         # 删除所有角色数据
         db.query(Role).delete()
         db.commit()
+        role_catalog.clear()
         
         # 重新初始化基础数据
         return initialize_database(db)
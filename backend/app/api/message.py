@@ -1,54 +1,55 @@
 from fastapi import APIRouter, HTTPException, Query, Depends, status
-from sqlalchemy.orm import Session
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Dict, Any
 
 from app.schemas.message import MessageCreate, MessageResponse, VoiceMessageRequest, VoiceMessageResponse
-from app.services.message_service import MessageService
-from app.db.session import get_db
+from app.services.message_service import AsyncMessageService
+from app.db.async_session import get_async_db
 from app.api.user import get_current_user
 
 router = APIRouter()
 
 # POST /messages - 发送消息
 @router.post("/", response_model=MessageResponse)
-def create_message(
+async def create_message(
     message: MessageCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user)
 ):
     """发送消息（传 session_id、role=0/1、content、metadata）"""
-    return MessageService.create_message(db, current_user.id, message)
+    return await AsyncMessageService.create_message(db, current_user.id, message)
 
 # GET /messages - 获取某个会话的消息列表
 @router.get("/", response_model=List[MessageResponse])
-def get_messages(
+async def get_messages(
     session_id: int = Query(..., description="会话ID"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user)
 ):
     """获取某个会话的消息列表"""
-    result = MessageService.get_messages_by_session(db, current_user.id, session_id)
+    result = await AsyncMessageService.get_messages_by_session(db, current_user.id, session_id)
     return result["messages"]
 
 # GET /messages/{message_id} - 获取单个消息详情
 @router.get("/{message_id}", response_model=MessageResponse)
-def get_message(
+async def get_message(
     message_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user)
 ):
     """获取单个消息详情"""
-    return MessageService.get_message_by_id(db, current_user.id, message_id)
+    return await AsyncMessageService.get_message_by_id(db, current_user.id, message_id)
 
 # DELETE /messages/{message_id} - 删除消息
 @router.delete("/{message_id}")
-def delete_message(
+async def delete_message(
     message_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user)
 ):
     """删除消息"""
-    success = MessageService.delete_message(db, current_user.id, message_id)
+    success = await AsyncMessageService.delete_message(db, current_user.id, message_id)
     if success:
         return {"message": "消息删除成功"}
     else:
@@ -61,7 +62,7 @@ def delete_message(
 @router.post("/voice", response_model=VoiceMessageResponse)
 async def process_voice_message(
     request: VoiceMessageRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user)
 ):
     """
@@ -87,7 +88,7 @@ async def process_voice_message(
     }
     """
     try:
-        result = await MessageService.process_voice_message(
+        result = await AsyncMessageService.process_voice_message(
             db=db,
             user_id=current_user.id,
             session_id=request.session_id,
@@ -109,3 +110,42 @@ async def process_voice_message(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"语音对话处理失败: {str(e)}"
         )
+
+
+# POST /messages/voice/stream - 流式处理语音对话（SSE）
+@router.post("/voice/stream")
+async def stream_voice_message(
+    request: VoiceMessageRequest,
+    db: AsyncSession = Depends(get_async_db),
+    current_user = Depends(get_current_user)
+):
+    """
+    流式处理语音对话消息（Server-Sent Events）
+    
+    LLM 每生成一个片段即推送给前端；回复按句切分后并发合成语音，
+    音频片段按句子顺序推送，前端可边收边播。生成结束后保存对话记录。
+    
+    事件格式（每条为 `data: <json>`）：
+    {"type": "delta", "content": "增量文本"}
+    {"type": "audio", "index": 0, "text": "第一句。", "audio_url": "https://..."}
+    {"type": "done", "ai_text": "完整回复", "audio_segments": ["https://..."],
+     "session_id": 1, "user_message_id": 10, "assistant_message_id": 11, "status": "success"}
+    {"type": "error", "detail": "错误信息"}
+    """
+    # 在开始推流前完成会话权限校验，确保404等错误以正常HTTP状态码返回
+    llm, role_name = await AsyncMessageService.prepare_voice_llm(db, current_user.id, request.session_id, request.text)
+    
+    return StreamingResponse(
+        AsyncMessageService.stream_voice_message(
+            user_id=current_user.id,
+            session_id=request.session_id,
+            user_text=request.text,
+            llm=llm,
+            role_name=role_name
+        ),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
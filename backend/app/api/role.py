@@ -1,24 +1,24 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
 from typing import List, Optional
 
-from app.db.session import get_db
+from app.db.async_session import get_async_db
 from app.schemas.role import RoleCreate, RoleUpdate, RoleResponse
-from app.services.role_service import RoleService
+from app.services.role_service import AsyncRoleService
 
 router = APIRouter()
 
-def get_role_service(db: Session = Depends(get_db)) -> RoleService:
+def get_role_service(db: AsyncSession = Depends(get_async_db)) -> AsyncRoleService:
     """获取角色服务实例"""
-    return RoleService(db)
+    return AsyncRoleService(db)
 
 @router.get("/", response_model=List[RoleResponse])
-def get_roles(
+async def get_roles(
     skip: int = 0, 
     limit: int = 100, 
     user_id: Optional[int] = None,
-    role_service: RoleService = Depends(get_role_service)
+    role_service: AsyncRoleService = Depends(get_role_service)
 ):
     """
     获取角色列表
@@ -33,7 +33,7 @@ def get_roles(
         角色列表
     """
     try:
-        roles = role_service.get_roles(skip=skip, limit=limit, user_id=user_id)
+        roles = await role_service.get_roles(skip=skip, limit=limit, user_id=user_id)
         return [
             RoleResponse(
                 id=role.id,
@@ -50,10 +50,10 @@ def get_roles(
         )
 
 @router.post("/", response_model=RoleResponse, status_code=status.HTTP_201_CREATED)
-def create_role(
+async def create_role(
     role: RoleCreate, 
     user_id: int = 0,  # 默认系统角色
-    role_service: RoleService = Depends(get_role_service)
+    role_service: AsyncRoleService = Depends(get_role_service)
 ):
     """
     创建新角色
@@ -67,7 +67,7 @@ def create_role(
         创建的角色信息
     """
     try:
-        db_role = role_service.create_role(role, user_id=user_id)
+        db_role = await role_service.create_role(role, user_id=user_id)
         return RoleResponse(
             id=db_role.id,
             name=db_role.name,
@@ -87,9 +87,9 @@ def create_role(
         )
 
 @router.get("/{role_id}", response_model=RoleResponse)
-def get_role(
+async def get_role(
     role_id: int, 
-    role_service: RoleService = Depends(get_role_service)
+    role_service: AsyncRoleService = Depends(get_role_service)
 ):
     """
     获取指定角色
@@ -102,7 +102,7 @@ def get_role(
         角色信息
     """
     try:
-        db_role = role_service.get_role_by_id(role_id)
+        db_role = await role_service.get_role_by_id(role_id)
         if not db_role:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -123,11 +123,11 @@ def get_role(
         )
 
 @router.put("/{role_id}", response_model=RoleResponse)
-def update_role(
+async def update_role(
     role_id: int, 
     role: RoleUpdate, 
     user_id: Optional[int] = None,
-    role_service: RoleService = Depends(get_role_service)
+    role_service: AsyncRoleService = Depends(get_role_service)
 ):
     """
     更新角色
@@ -142,7 +142,7 @@ def update_role(
         更新后的角色信息
     """
     try:
-        db_role = role_service.update_role(role_id, role, user_id=user_id)
+        db_role = await role_service.update_role(role_id, role, user_id=user_id)
         if not db_role:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -168,10 +168,10 @@ def update_role(
         )
 
 @router.delete("/{role_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_role(
+async def delete_role(
     role_id: int, 
     user_id: Optional[int] = None,
-    role_service: RoleService = Depends(get_role_service)
+    role_service: AsyncRoleService = Depends(get_role_service)
 ):
     """
     删除角色
@@ -182,7 +182,7 @@ def delete_role(
         role_service: 角色服务实例
     """
     try:
-        success = role_service.delete_role(role_id, user_id=user_id)
+        success = await role_service.delete_role(role_id, user_id=user_id)
         if not success:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -200,7 +200,7 @@ def delete_role(
         )
 
 @router.get("/system/roles", response_model=List[RoleResponse])
-def get_system_roles(role_service: RoleService = Depends(get_role_service)):
+async def get_system_roles(role_service: AsyncRoleService = Depends(get_role_service)):
     """
     获取系统预设角色
     
@@ -211,7 +211,7 @@ def get_system_roles(role_service: RoleService = Depends(get_role_service)):
         系统角色列表
     """
     try:
-        roles = role_service.get_system_roles()
+        roles = await role_service.get_system_roles()
         return [
             RoleResponse(
                 id=role.id,
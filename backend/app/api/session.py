@@ -1,11 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 import logging
 
-from app.db.session import get_db
+from app.db.async_session import get_async_db
 from app.api.user import get_current_user
-from app.services.session_service import SessionService
+from app.services.session_service import AsyncSessionService
 from app.schemas.session import SessionCreate, SessionResponse
 from app.models.chat_sessions import ChatSessions
 from app.models.chat_messages import ChatMessages
@@ -17,14 +17,14 @@ router = APIRouter()
 
 # POST /sessions - 创建新会话（绑定角色）
 @router.post("/", response_model=SessionResponse, status_code=status.HTTP_201_CREATED)
-def create_session(
+async def create_session(
     session: SessionCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user)
 ):
     """创建新会话"""
     # 调用服务层创建会话
-    db_session = SessionService.create_session(db, current_user.id, session)
+    db_session = await AsyncSessionService.create_session(db, current_user.id, session)
     
     # 转换为响应模型
     return SessionResponse(
@@ -36,11 +36,11 @@ def create_session(
 
 # GET /sessions - 获取会话列表
 @router.get("/", response_model=List[SessionResponse])
-def get_sessions(
+async def get_sessions(
     skip: int = Query(0, ge=0, description="跳过的记录数"),
     limit: int = Query(100, ge=1, le=1000, description="返回的记录数"),
     user_id: Optional[int] = Query(None, description="用户ID筛选（管理员功能）"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user)
 ):
     """获取会话列表，可按用户ID筛选"""
@@ -56,9 +56,9 @@ def get_sessions(
     # 获取会话列表
     if user_id is None:
         # 默认获取当前用户的会话
-        sessions = SessionService.get_sessions_by_user(db, current_user.id, skip, limit)
+        sessions = await AsyncSessionService.get_sessions_by_user(db, current_user.id, skip, limit)
     else:
-        sessions = SessionService.get_sessions_by_user(db, user_id, skip, limit)
+        sessions = await AsyncSessionService.get_sessions_by_user(db, user_id, skip, limit)
     
     # 转换为响应模型
     return [
@@ -73,14 +73,14 @@ def get_sessions(
 
 # GET /sessions/{session_id} - 获取单个会话详情
 @router.get("/{session_id}", response_model=SessionResponse)
-def get_session(
+async def get_session(
     session_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user)
 ):
     """获取单个会话详情"""
     # 获取会话详情（只能获取自己的会话）
-    session = SessionService.get_session_by_id(db, session_id, current_user.id)
+    session = await AsyncSessionService.get_session_by_id(db, session_id, current_user.id)
     
     # 转换为响应模型
     return SessionResponse(
@@ -92,20 +92,20 @@ def get_session(
 
 # DELETE /sessions/{session_id} - 删除会话
 @router.delete("/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_session(
+async def delete_session(
     session_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user)
 ):
     """删除会话"""
     # 删除会话（只能删除自己的会话）
-    SessionService.delete_session(db, session_id, current_user.id)
+    await AsyncSessionService.delete_session(db, session_id, current_user.id)
 
 # GET /sessions/role/{role_id} - 获取或创建用户与角色的会话
 @router.get("/role/{role_id}", response_model=SessionResponse, summary="获取或创建用户与角色的会话")
-def get_or_create_user_role_session(
+async def get_or_create_user_role_session(
     role_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user)
 ):
     """
@@ -114,7 +114,7 @@ def get_or_create_user_role_session(
     - 如果没有会话，创建新的会话
     - 每个用户与每个角色只能有一个会话
     """
-    session = SessionService.get_or_create_user_role_session(
+    session = await AsyncSessionService.get_or_create_user_role_session(
         db=db, 
         user_id=current_user.id, 
         role_id=role_id
@@ -129,11 +129,11 @@ def get_or_create_user_role_session(
 
 # GET /sessions/{session_id}/messages - 获取会话的消息列表（支持分页）
 @router.get("/{session_id}/messages")
-def get_session_messages(
+async def get_session_messages(
     session_id: int,
     page: int = Query(1, ge=1, description="页码，从1开始"),
     page_size: int = Query(10, ge=1, le=100, description="每页消息数量，最大100"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user)
 ):
     """
@@ -144,21 +144,45 @@ def get_session_messages(
     - 支持分页参数控制返回数量
     - 只能获取用户自己的会话消息
     """
-    from app.services.message_service import MessageService
-    return MessageService.get_messages_by_session(db, current_user.id, session_id, page, page_size)
+    from app.services.message_service import AsyncMessageService
+    return await AsyncMessageService.get_messages_by_session(db, current_user.id, session_id, page, page_size)
+
+# GET /sessions/{session_id}/messages/cursor - 游标分页获取会话的消息列表
+@router.get("/{session_id}/messages/cursor")
+async def get_session_messages_by_cursor(
+    session_id: int,
+    cursor: Optional[str] = Query(None, description="分页游标，取自上一次返回的 before_cursor / after_cursor"),
+    direction: str = Query("before", pattern="^(before|after)$", description="before-更早的消息，after-更新的消息"),
+    page_size: int = Query(10, ge=1, le=100, description="每页消息数量，最大100"),
+    with_total: bool = Query(False, description="是否返回消息总数（带缓存）"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user = Depends(get_current_user)
+):
+    """
+    游标分页获取指定会话的消息列表
+    
+    特点：
+    - 按时间倒序返回（最新消息在前）
+    - 以 (created_at, id) 为游标，长会话中向前翻页的开销与第一页相同
+    - 默认不统计总数，需要时传 with_total=true
+    """
+    from app.services.message_service import AsyncMessageService
+    return await AsyncMessageService.get_messages_by_cursor(
+        db, current_user.id, session_id, cursor, direction, page_size, with_total
+    )
 
 @router.put("/{session_id}/update-time", status_code=status.HTTP_200_OK)
-def update_session_time(
+async def update_session_time(
     session_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user)
 ):
     """更新会话的最后消息时间"""
     # 首先验证会话是否属于当前用户
-    SessionService.get_session_by_id(db, session_id, current_user.id)
+    await AsyncSessionService.get_session_by_id(db, session_id, current_user.id)
     
     # 更新最后消息时间
-    success = SessionService.update_last_message_time(db, session_id)
+    success = await AsyncSessionService.update_last_message_time(db, session_id)
     
     if not success:
         raise HTTPException(
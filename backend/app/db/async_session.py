@@ -0,0 +1,220 @@
+from contextvars import ContextVar
+from http.cookies import SimpleCookie
+from sqlalchemy import Delete, Insert, Update
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from starlette.datastructures import MutableHeaders
+import itertools
+import logging
+import math
+import os
+import threading
+import time
+from typing import Any, AsyncGenerator, Dict, List, Optional
+
+from app.db.session import DB_HOST, DB_PORT, DB_USER, DB_PASSWORD, DB_NAME, engine as sync_engine
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 异步数据库URL (MySQL+aiomysql 驱动)，测试时可通过环境变量改为 sqlite+aiosqlite:///...
+ASYNC_DATABASE_URL = os.getenv(
+    "ASYNC_DATABASE_URL",
+    f"mysql+aiomysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}?charset=utf8mb4"
+)
+
+# 只读副本：DB_REPLICA_HOSTS=host1:3306,host2:3306（账号与库名同主库），
+# 或用 ASYNC_DATABASE_REPLICA_URLS 直接指定逗号分隔的连接串；都不配置时所有查询走主库
+if os.getenv("ASYNC_DATABASE_REPLICA_URLS"):
+    ASYNC_DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("ASYNC_DATABASE_REPLICA_URLS").split(",") if url.strip()]
+else:
+    ASYNC_DATABASE_REPLICA_URLS = [
+        f"mysql+aiomysql://{DB_USER}:{DB_PASSWORD}@{host.strip()}/{DB_NAME}?charset=utf8mb4"
+        for host in os.getenv("DB_REPLICA_HOSTS", "").split(",") if host.strip()
+    ]
+
+# 客户端写入后在该时间内的读请求仍走主库，避开副本复制延迟
+REPLICA_STICKY_SECONDS = float(os.getenv("DB_REPLICA_STICKY_SECONDS", "5"))
+# 客户端最近一次写入时间（Unix 秒）由客户端携带：浏览器通过 Cookie 自动回传，
+# 其他客户端可把响应头中的值放到同名请求头里。任何 worker 都能据此判断，不依赖进程内状态
+STICKY_COOKIE = "db_last_write"
+STICKY_HEADER = "X-DB-Last-Write"
+
+
+def _create_engine(url: str) -> AsyncEngine:
+    if url.startswith("sqlite"):
+        return create_async_engine(url, echo=False)
+    return create_async_engine(
+        url,
+        echo=True,
+        pool_pre_ping=True,  # 连接池预检查
+        pool_recycle=3600,   # 连接回收时间
+        max_overflow=20,     # 最大溢出连接数
+        pool_size=10         # 连接池大小
+    )
+
+
+class DatabaseRouter:
+    """
+    主库 / 只读副本路由
+    写操作和最近写入过的客户端读主库，标记为只读的会话读副本（轮询选择）
+    """
+
+    def __init__(self, primary_url: str, replica_urls: List[str], sticky_seconds: float = REPLICA_STICKY_SECONDS):
+        self.primary = _create_engine(primary_url)
+        self.replicas = [_create_engine(url) for url in replica_urls]
+        self.sticky_seconds = sticky_seconds
+        self._next_replica = itertools.cycle(range(len(self.replicas)))
+        self._lock = threading.Lock()
+
+    def pick_replica(self) -> AsyncEngine:
+        with self._lock:
+            return self.replicas[next(self._next_replica)]
+
+    def is_sticky(self, last_write_at: Optional[float]) -> bool:
+        """客户端最近一次写入是否仍在复制延迟窗口内"""
+        return last_write_at is not None and time.time() - last_write_at < self.sticky_seconds
+
+    @staticmethod
+    def _pool_stats(engine) -> Dict[str, Any]:
+        pool = engine.pool
+        stats = {"pool": type(pool).__name__, "status": pool.status()}
+        for name in ("size", "checkedin", "checkedout", "overflow"):
+            if hasattr(pool, name):
+                stats[name] = getattr(pool, name)()
+        return stats
+
+    def pool_stats(self) -> Dict[str, Dict[str, Any]]:
+        """各引擎连接池状态"""
+        stats = {"primary": self._pool_stats(self.primary.sync_engine)}
+        for index, replica in enumerate(self.replicas):
+            stats[f"replica_{index}"] = self._pool_stats(replica.sync_engine)
+        stats["sync"] = self._pool_stats(sync_engine)
+        return stats
+
+    async def dispose(self):
+        for engine in [self.primary, *self.replicas]:
+            await engine.dispose()
+
+
+db_router = DatabaseRouter(ASYNC_DATABASE_URL, ASYNC_DATABASE_REPLICA_URLS)
+# 主库引擎
+async_engine = db_router.primary
+
+
+class RoutingSession(Session):
+    """
+    按语句类型选择引擎：flush / INSERT / UPDATE / DELETE 以及写过数据之后的查询走主库，
+    通过 use_replica 标记为只读的会话，其余查询走同一个副本
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self._flushing or isinstance(clause, (Insert, Update, Delete)):
+            self.info["has_written"] = True
+            return db_router.primary.sync_engine
+        if self.info.get("read_only") and not self.info.get("has_written") and db_router.replicas:
+            if "replica" not in self.info:
+                self.info["replica"] = db_router.pick_replica()
+            return self.info["replica"].sync_engine
+        return db_router.primary.sync_engine
+
+
+# 异步会话工厂；提交后不过期对象，避免在事件循环中隐式触发懒加载查询
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    sync_session_class=RoutingSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
+
+# 当前请求的写入状态 {"last_write_at": 客户端携带的时间, "written_at": 本次请求的写入时间}，
+# 由 ReplicaStickinessMiddleware 在每个请求开始时设置
+_request_writes: ContextVar[Optional[Dict[str, Optional[float]]]] = ContextVar("db_request_writes", default=None)
+
+
+def _parse_timestamp(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def client_last_write() -> Optional[float]:
+    """当前客户端最近一次写入时间（含本次请求），不在请求中时返回 None"""
+    state = _request_writes.get()
+    if state is None:
+        return None
+    times = [value for value in (state["last_write_at"], state["written_at"]) if value is not None]
+    return max(times) if times else None
+
+
+def use_replica(db: AsyncSession) -> AsyncSession:
+    """
+    将会话后续的只读查询路由到副本；当前客户端最近写入过时仍读主库（读己之写）
+    只读的服务方法在查询前调用
+    """
+    if not db_router.is_sticky(client_last_write()):
+        db.info["read_only"] = True
+    return db
+
+
+def mark_written():
+    """写操作提交后调用，响应中带上写入时间，该客户端之后一小段时间内的读请求走主库"""
+    state = _request_writes.get()
+    if state is not None:
+        state["written_at"] = time.time()
+
+
+class ReplicaStickinessMiddleware:
+    """
+    读己之写：从 Cookie / 请求头读取客户端最近一次写入时间，请求中发生写入时在响应里回写
+    流式响应在响应头发出之后才写库，无法再设置 Cookie，这类接口的后续读取可能落到副本
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not db_router.replicas:
+            await self.app(scope, receive, send)
+            return
+
+        headers = {key.decode("latin-1").lower(): value.decode("latin-1") for key, value in scope["headers"]}
+        cookie = SimpleCookie()
+        cookie.load(headers.get("cookie", ""))
+        last_write_at = _parse_timestamp(headers.get(STICKY_HEADER.lower()))
+        if last_write_at is None and STICKY_COOKIE in cookie:
+            last_write_at = _parse_timestamp(cookie[STICKY_COOKIE].value)
+        state = {"last_write_at": last_write_at, "written_at": None}
+
+        async def send_with_write_time(message):
+            if message["type"] == "http.response.start" and state["written_at"] is not None:
+                value = f"{state['written_at']:.3f}"
+                response_headers = MutableHeaders(scope=message)
+                response_headers.append(STICKY_HEADER, value)
+                response_headers.append(
+                    "set-cookie",
+                    f"{STICKY_COOKIE}={value}; Max-Age={math.ceil(db_router.sticky_seconds)}; Path=/; HttpOnly; SameSite=Lax"
+                )
+            await send(message)
+
+        token = _request_writes.set(state)
+        try:
+            await self.app(scope, receive, send_with_write_time)
+        finally:
+            _request_writes.reset(token)
+
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """
+    获取异步数据库会话
+    """
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+        except SQLAlchemyError as e:
+            logger.error(f"异步数据库会话错误: {str(e)}")
+            await db.rollback()
+            raise
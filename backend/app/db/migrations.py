@@ -0,0 +1,197 @@
+"""
+
+数据库版本化迁移：schema_version 表记录已执行到的版本，启动时按顺序执行尚未执行的迁移
+表结构变更时在 MIGRATIONS 末尾追加新的迁移，已发布的迁移不要再修改
+
+    python -m app.db.migrations            执行迁移
+    python -m app.db.migrations --check    用 EXPLAIN 检查热点查询是否走索引
+
+"""
+import argparse
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+from app.db import session as db_session
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION_TABLE = "schema_version"
+
+
+def _import_models():
+    # 导入所有模型以确保它们被注册到Base.metadata
+    from app.models.role import Role
+    from app.models.chat_sessions import ChatSessions
+    from app.models.chat_messages import ChatMessages
+    from app.models.user import User
+    from app.models.role_settings import RoleSettings
+    from app.models.content_embeddings import ContentEmbeddings
+
+
+def _add_column_if_missing(conn: Connection, table_name: str, column_name: str):
+    existing_columns = {column["name"] for column in inspect(conn).get_columns(table_name)}
+    if column_name in existing_columns:
+        return
+    column = db_session.Base.metadata.tables[table_name].columns[column_name]
+    column_type = column.type.compile(dialect=conn.dialect)
+    conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type} NULL"))
+    logger.info(f"数据表 {table_name} 新增列 {column_name}")
+
+
+def _create_index_if_missing(conn: Connection, table_name: str, index_name: str):
+    existing_indexes = {index["name"] for index in inspect(conn).get_indexes(table_name)}
+    if index_name in existing_indexes:
+        return
+    table = db_session.Base.metadata.tables[table_name]
+    index = next(index for index in table.indexes if index.name == index_name)
+    index.create(bind=conn)
+    logger.info(f"数据表 {table_name} 新增索引 {index_name}")
+
+
+def _baseline(conn: Connection):
+    """初始表结构（已存在的表不会被修改）"""
+    db_session.Base.metadata.create_all(bind=conn)
+
+
+def _session_summary_columns(conn: Connection):
+    """chat_sessions 增加滚动摘要列"""
+    _add_column_if_missing(conn, "chat_sessions", "summary")
+    _add_column_if_missing(conn, "chat_sessions", "summary_message_id")
+
+
+def _chat_query_indexes(conn: Connection):
+    """聊天热点查询的复合索引"""
+    _create_index_if_missing(conn, "chat_messages", "ix_chat_messages_session_created")
+    _create_index_if_missing(conn, "chat_sessions", "ix_chat_sessions_user_role")
+    _create_index_if_missing(conn, "chat_sessions", "ix_chat_sessions_user_created")
+
+
+def _session_version_column(conn: Connection):
+    """chat_sessions 增加会话内容版本号，供进程内缓存校验"""
+    _add_column_if_missing(conn, "chat_sessions", "version")
+
+
+# (版本号, 说明, 迁移函数)，版本号必须递增
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "初始表结构", _baseline),
+    (2, "会话滚动摘要列", _session_summary_columns),
+    (3, "聊天查询复合索引", _chat_query_indexes),
+    (4, "会话内容版本号", _session_version_column),
+]
+
+
+def _ensure_version_table(conn: Connection):
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {SCHEMA_VERSION_TABLE} ("
+        "version INTEGER NOT NULL PRIMARY KEY, "
+        "description VARCHAR(100) NOT NULL, "
+        "applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+    ))
+
+
+def current_version(conn: Connection) -> int:
+    _ensure_version_table(conn)
+    version = conn.execute(text(f"SELECT MAX(version) FROM {SCHEMA_VERSION_TABLE}")).scalar()
+    return version or 0
+
+
+def run_migrations(bind: Optional[Engine] = None) -> int:
+    """
+    执行所有尚未执行的迁移，每个迁移在独立事务中执行并记录版本
+    :return: 迁移后的版本号
+    """
+    bind = bind or db_session.engine
+    _import_models()
+    with bind.begin() as conn:
+        version = current_version(conn)
+
+    for target, description, migrate in MIGRATIONS:
+        if target <= version:
+            continue
+        with bind.begin() as conn:
+            migrate(conn)
+            conn.execute(
+                text(f"INSERT INTO {SCHEMA_VERSION_TABLE} (version, description) VALUES (:version, :description)"),
+                {"version": target, "description": description}
+            )
+        logger.info(f"数据库迁移到版本 {target}: {description}")
+        version = target
+    return version
+
+
+# 热点查询，EXPLAIN 检查时使用；参数取值不影响执行计划
+HOT_QUERIES: Dict[str, Tuple[str, Dict]] = {
+    "recent_messages": (
+        "SELECT * FROM chat_messages WHERE session_id = :session_id "
+        "ORDER BY created_at DESC LIMIT 10",
+        {"session_id": 1}
+    ),
+    "message_cursor": (
+        "SELECT * FROM chat_messages WHERE session_id = :session_id "
+        "AND created_at <= :created_at AND (created_at < :created_at OR id < :id) "
+        "ORDER BY created_at DESC, id DESC LIMIT 11",
+        {"session_id": 1, "created_at": "2025-01-01 00:00:00", "id": 1}
+    ),
+    "user_role_session": (
+        "SELECT * FROM chat_sessions WHERE user_id = :user_id AND role_id = :role_id LIMIT 1",
+        {"user_id": 1, "role_id": 1}
+    ),
+    "user_sessions": (
+        "SELECT * FROM chat_sessions WHERE user_id = :user_id "
+        "ORDER BY created_at DESC LIMIT 100",
+        {"user_id": 1}
+    ),
+    "user_chat_history": (
+        "SELECT cm.*, r.name, u.username FROM chat_sessions cs "
+        "JOIN chat_messages cm ON cs.id = cm.session_id "
+        "LEFT JOIN role r ON r.id = cs.role_id "
+        "LEFT JOIN user u ON u.id = cs.user_id "
+        "WHERE cs.user_id = :user_id ORDER BY cm.created_at DESC, cm.id DESC LIMIT 10",
+        {"user_id": 1}
+    ),
+}
+
+
+def full_scan_tables(conn: Connection, sql: str, params: Optional[Dict] = None) -> List[str]:
+    """
+    EXPLAIN 查询，返回被全表扫描的表名
+    支持 MySQL（type = ALL）和 SQLite（SCAN 且未使用索引）
+    """
+    params = params or {}
+    scanned = []
+    if conn.dialect.name == "sqlite":
+        for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"), params).mappings():
+            detail = row["detail"]
+            if detail.startswith("SCAN ") and "INDEX" not in detail:
+                scanned.append(detail.split()[1])
+    else:
+        for row in conn.execute(text(f"EXPLAIN {sql}"), params).mappings():
+            if row["type"] == "ALL":
+                scanned.append(row["table"])
+    return scanned
+
+
+def check_query_plans(bind: Optional[Engine] = None) -> Dict[str, List[str]]:
+    """
+    检查所有热点查询的执行计划
+    :return: {查询名: 被全表扫描的表名列表}，全部走索引时列表为空
+    """
+    bind = bind or db_session.engine
+    with bind.connect() as conn:
+        return {name: full_scan_tables(conn, sql, params) for name, (sql, params) in HOT_QUERIES.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="数据库迁移")
+    parser.add_argument("--check", action="store_true", help="检查热点查询的执行计划")
+    args = parser.parse_args()
+
+    if args.check:
+        plans = check_query_plans()
+        for name, tables in plans.items():
+            print(f"{name}: {'全表扫描 ' + ', '.join(tables) if tables else '使用索引'}")
+        raise SystemExit(1 if any(plans.values()) else 0)
+    print(f"当前数据库版本: {run_migrations()}")
@@ -66,19 +66,13 @@ def create_database_if_not_exists():
 
 def create_tables():
     """
-    创建所有数据表
+    创建所有数据表并执行尚未执行的版本化迁移（见 app/db/migrations.py）
     """
     try:
-        # 导入所有模型以确保它们被注册到Base.metadata
-        from app.models.role import Role
-        from app.models.chat_sessions import ChatSessions
-        from app.models.chat_messages import ChatMessages
-        from app.models.user import User
-        from app.models.role_settings import RoleSettings
+        from app.db.migrations import run_migrations
         
-        # 创建所有表
-        Base.metadata.create_all(bind=engine)
-        logger.info("数据表创建成功")
+        version = run_migrations(engine)
+        logger.info(f"数据表创建成功，当前版本 {version}")
         
     except Exception as e:
         logger.error(f"创建数据表失败: {str(e)}")
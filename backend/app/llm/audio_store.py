@@ -0,0 +1,195 @@
+"""
+
+本地音频存储：TTS 返回的临时音频只下载一次，按内容哈希保存到本地目录，
+由 /api/audio/{文件名} 提供带 Range / ETag 支持的访问，后台定期清理
+
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import time
+from pathlib import Path
+from urllib.parse import urlparse
+
+from sqlalchemy import select
+
+from app.db.session import SessionLocal
+from app.models.chat_messages import ChatMessages
+from .clients import ProviderClients
+
+logger = logging.getLogger(__name__)
+
+
+class AudioStore():
+    ROOT = Path(os.getenv("AUDIO_STORAGE_DIR", Path(__file__).resolve().parents[2] / "storage" / "audio"))
+    # 对外访问地址前缀；前后端不同源时可配置为后端完整地址，如 http://127.0.0.1:8000
+    PUBLIC_BASE_URL = os.getenv("AUDIO_PUBLIC_BASE_URL", "")
+    ROUTE_PREFIX = "/api/audio/"
+    MAX_AGE_SECONDS = float(os.getenv("AUDIO_STORAGE_MAX_AGE_DAYS", "30")) * 86400
+    MAX_TOTAL_BYTES = int(float(os.getenv("AUDIO_STORAGE_MAX_MB", "2048")) * 1024 * 1024)
+    GC_INTERVAL_SECONDS = 3600
+    # 新写入的文件在此时间内不参与容量清理，避免删除尚未写入聊天记录的音频
+    GC_GRACE_SECONDS = 3600
+    REFERENCE_SCAN_BATCH = 1000
+    ALLOWED_EXTENSIONS = {".wav", ".mp3", ".pcm", ".opus"}
+    FILENAME_PATTERN = re.compile(r"^([0-9a-f]{64})(\.[a-z0-9]+)$")
+
+    @classmethod
+    def parse_filename(cls, filename: str):
+        """
+        校验文件名并拆分为 (哈希, 扩展名)，非法文件名返回 None
+        """
+        match = cls.FILENAME_PATTERN.match(filename)
+        if not match or match.group(2) not in cls.ALLOWED_EXTENSIONS:
+            return None
+        return match.group(1), match.group(2)
+
+    @classmethod
+    def path_for(cls, digest: str, extension: str) -> Path:
+        # 按哈希前两位分目录，避免单目录文件过多
+        return cls.ROOT / digest[:2] / f"{digest}{extension}"
+
+    @classmethod
+    def url_for(cls, digest: str, extension: str) -> str:
+        return f"{cls.PUBLIC_BASE_URL}{cls.ROUTE_PREFIX}{digest}{extension}"
+
+    @classmethod
+    def is_local_url(cls, url: str) -> bool:
+        return cls.ROUTE_PREFIX in (url or "")
+
+    @classmethod
+    def exists(cls, url: str) -> bool:
+        """
+        本地音频URL对应的文件是否仍然存在（可能已被清理）
+        """
+        parsed = cls.parse_filename(url.rsplit("/", 1)[-1])
+        return parsed is not None and cls.path_for(*parsed).exists()
+
+    @staticmethod
+    def _extension_from_url(url: str) -> str:
+        extension = os.path.splitext(urlparse(url).path)[1].lower()
+        return extension if extension in AudioStore.ALLOWED_EXTENSIONS else ".wav"
+
+    @classmethod
+    def save_bytes(cls, data: bytes, extension: str = ".wav") -> str:
+        """
+        保存音频内容，返回本地访问URL；相同内容只保存一份
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = cls.path_for(digest, extension)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # 先写临时文件再原子替换，避免读到写了一半的文件
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        return cls.url_for(digest, extension)
+
+    @classmethod
+    def save_from_url(cls, url: str) -> str:
+        response = ProviderClients.http_session().get(url, timeout=30)
+        response.raise_for_status()
+        return cls.save_bytes(response.content, cls._extension_from_url(url))
+
+    @classmethod
+    async def asave_from_url(cls, url: str) -> str:
+        response = await ProviderClients.async_http_client().get(url)
+        response.raise_for_status()
+        # 写文件是阻塞IO，放到线程中执行，避免阻塞事件循环
+        return await asyncio.to_thread(cls.save_bytes, response.content, cls._extension_from_url(url))
+
+    @classmethod
+    def referenced_filenames(cls, db) -> set:
+        """
+        收集聊天记录元数据（audio_url / audio_segments）仍引用的本地音频文件名
+        按主键分批扫描，避免一次性加载全部消息
+        """
+        referenced = set()
+        last_id = 0
+        while True:
+            rows = db.execute(
+                select(ChatMessages.id, ChatMessages.message_metadata)
+                .where(ChatMessages.id > last_id, ChatMessages.message_metadata.isnot(None))
+                .order_by(ChatMessages.id)
+                .limit(cls.REFERENCE_SCAN_BATCH)
+            ).all()
+            if not rows:
+                return referenced
+            for _, metadata in rows:
+                if not isinstance(metadata, dict):
+                    continue
+                urls = [metadata.get("audio_url")] + list(metadata.get("audio_segments") or [])
+                for url in urls:
+                    if isinstance(url, str) and cls.is_local_url(url):
+                        referenced.add(url.rsplit("/", 1)[-1])
+            last_id = rows[-1][0]
+
+    @classmethod
+    def gc(cls, max_age_seconds: float = None, max_total_bytes: int = None, referenced: set = None):
+        """
+        清理聊天记录不再引用的音频：超过保留期的直接删除，总量仍超出上限时按写入时间从旧到新删除
+        被引用的文件始终保留，保证历史消息中的 audio_url 可以播放
+        :param referenced: 被引用的文件名集合，为空时从数据库读取
+        :return: 清理统计
+        """
+        max_age_seconds = cls.MAX_AGE_SECONDS if max_age_seconds is None else max_age_seconds
+        max_total_bytes = cls.MAX_TOTAL_BYTES if max_total_bytes is None else max_total_bytes
+        if not cls.ROOT.exists():
+            return {"removed": 0, "freed_bytes": 0, "remaining_bytes": 0}
+        if referenced is None:
+            # 读取失败时抛出异常，本轮不删除任何文件
+            with SessionLocal() as db:
+                referenced = cls.referenced_filenames(db)
+
+        now = time.time()
+        files = []
+        removed = 0
+        freed = 0
+        total = 0
+        for path in cls.ROOT.glob("*/*"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            # 不使用 atime：很多文件系统以 noatime 挂载，访问时间不可靠
+            age = now - stat.st_mtime
+            if path.suffix == ".tmp":
+                # 未完成的临时文件
+                if age > cls.GC_GRACE_SECONDS:
+                    path.unlink(missing_ok=True)
+                    removed += 1
+                    freed += stat.st_size
+                continue
+            if path.name in referenced:
+                total += stat.st_size
+            elif age > max_age_seconds:
+                path.unlink(missing_ok=True)
+                removed += 1
+                freed += stat.st_size
+            else:
+                total += stat.st_size
+                if age > cls.GC_GRACE_SECONDS:
+                    files.append((stat.st_mtime, stat.st_size, path))
+
+        for _, size, path in sorted(files):
+            if total <= max_total_bytes:
+                break
+            path.unlink(missing_ok=True)
+            removed += 1
+            freed += size
+            total -= size
+
+        if removed:
+            logger.info(f"音频存储清理完成: 删除 {removed} 个文件, 释放 {freed} 字节")
+        if total > max_total_bytes:
+            logger.warning(f"音频存储超出容量上限: 被引用或新写入的音频共 {total} 字节")
+        return {"removed": removed, "freed_bytes": freed, "remaining_bytes": total}
@@ -0,0 +1,162 @@
+"""
+
+模型服务客户端注册表：api_keys.json 只在启动或文件变更时读取一次，
+SDK 客户端与 HTTP 连接池在进程内长期复用
+
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+import dashscope
+import httpx
+import requests
+from openai import OpenAI
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderClients():
+    CONFIG_PATH = Path(__file__).parent / "api_keys.json"
+    DASHSCOPE_HTTP_URL = "https://dashscope.aliyuncs.com/api/v1/"
+    CONFIG_CHECK_INTERVAL = 5.0  # 检查配置文件修改时间的最小间隔（秒）
+    # 每个服务在单个进程内允许的最大并发请求数
+    PROVIDER_CONCURRENCY = {"llm": 64, "tts": 32}
+
+    _lock = threading.RLock()
+    _config = None
+    _config_mtime = None
+    _last_check = 0.0
+    _openai_client = None
+    _http_session = None
+    _async_loop = None
+    _async_client = None
+    _semaphores = {}
+
+    @classmethod
+    def get_config(cls):
+        """
+        获取API配置；配置文件修改后自动重新加载并重建客户端
+        """
+        now = time.monotonic()
+        if cls._config is not None and now - cls._last_check < cls.CONFIG_CHECK_INTERVAL:
+            return cls._config
+        with cls._lock:
+            mtime = os.stat(cls.CONFIG_PATH).st_mtime
+            cls._last_check = now
+            if cls._config is None or mtime != cls._config_mtime:
+                with open(cls.CONFIG_PATH, 'r', encoding='utf-8') as f:
+                    cls._config = json.load(f)
+                cls._config_mtime = mtime
+                cls._reset_clients()
+            return cls._config
+
+    @classmethod
+    def _reset_clients(cls):
+        if cls._openai_client is not None:
+            cls._openai_client.close()
+        cls._openai_client = None
+        dashscope.api_key = cls._config["api_key"]
+        dashscope.base_http_api_url = cls.DASHSCOPE_HTTP_URL
+
+    @classmethod
+    def openai_client(cls) -> OpenAI:
+        """
+        OpenAI 兼容接口客户端（内部持有 keep-alive 连接池）
+        """
+        config = cls.get_config()
+        with cls._lock:
+            if cls._openai_client is None:
+                cls._openai_client = OpenAI(
+                    api_key=config["api_key"],
+                    base_url=config["base_url"]
+                )
+            return cls._openai_client
+
+    @classmethod
+    def dashscope_api_key(cls) -> str:
+        """
+        DashScope SDK 使用的 API Key（同时确保 SDK 全局配置已就绪）
+        """
+        return cls.get_config()["api_key"]
+
+    @classmethod
+    def http_session(cls) -> requests.Session:
+        """
+        通用 HTTP 会话，用于下载转写结果、音频文件等
+        """
+        with cls._lock:
+            if cls._http_session is None:
+                cls._http_session = requests.Session()
+            return cls._http_session
+
+    @classmethod
+    def _bind_loop(cls):
+        """
+        异步客户端与信号量绑定到当前事件循环，事件循环变化时（如测试中）关闭旧客户端并重新创建
+        """
+        loop = asyncio.get_running_loop()
+        if cls._async_loop is not loop:
+            old_loop, old_client = cls._async_loop, cls._async_client
+            cls._async_loop = loop
+            cls._async_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(60.0, connect=10.0),
+                limits=httpx.Limits(max_connections=sum(cls.PROVIDER_CONCURRENCY.values()), max_keepalive_connections=32)
+            )
+            cls._semaphores = {}
+            if old_client is not None:
+                cls._close_detached(old_client, old_loop, loop)
+
+    @staticmethod
+    def _close_detached(client: httpx.AsyncClient, old_loop, loop):
+        """
+        关闭已被替换的客户端，释放其连接池：旧事件循环仍在运行时在旧循环中关闭，否则在当前循环中关闭
+        """
+        if old_loop is not None and old_loop.is_running() and not old_loop.is_closed():
+            asyncio.run_coroutine_threadsafe(ProviderClients._aclose_quietly(client), old_loop)
+        else:
+            loop.create_task(ProviderClients._aclose_quietly(client))
+
+    @staticmethod
+    async def _aclose_quietly(client: httpx.AsyncClient):
+        try:
+            await client.aclose()
+        except Exception as e:
+            # 旧事件循环已关闭时底层连接可能无法正常关闭，忽略即可
+            logger.debug(f"关闭旧的异步HTTP客户端失败: {e}")
+
+    @classmethod
+    async def aclose(cls):
+        """
+        关闭当前事件循环上的异步客户端（应用退出时调用）
+        """
+        client, cls._async_client, cls._async_loop = cls._async_client, None, None
+        cls._semaphores = {}
+        if client is not None:
+            await client.aclose()
+
+    @classmethod
+    def async_http_client(cls) -> httpx.AsyncClient:
+        """
+        非阻塞 HTTP 客户端（keep-alive 连接池，进程内共享）
+        """
+        cls._bind_loop()
+        return cls._async_client
+
+    @classmethod
+    @asynccontextmanager
+    async def provider_limit(cls, provider: str):
+        """
+        按服务限制并发请求数，超出时排队等待而不是占用线程
+        """
+        cls._bind_loop()
+        semaphore = cls._semaphores.get(provider)
+        if semaphore is None:
+            semaphore = cls._semaphores[provider] = asyncio.Semaphore(cls.PROVIDER_CONCURRENCY[provider])
+        async with semaphore:
+            yield
@@ -0,0 +1,120 @@
+"""
+
+上下文构建：在明确的 token 预算内拼装 系统提示词 + 对话摘要 + 角色设定片段 + 历史对话，
+预算不足时优先丢弃最早的历史对话
+
+"""
+import math
+import os
+import re
+
+# 中日韩字符（含全角标点）按每字约 1 token 估算，其余字符按每 4 个约 1 token 估算
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+# 每条消息的角色标记等格式开销
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    本地估算文本 token 数（无需调用分词接口，误差在可接受范围内）
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def estimate_message_tokens(message: dict) -> int:
+    return estimate_tokens(message.get("content", "")) + MESSAGE_OVERHEAD_TOKENS
+
+
+class ContextBuilder():
+    DEFAULT_TOKEN_BUDGET = int(os.getenv("LLM_CONTEXT_TOKEN_BUDGET", "4000"))
+
+    def __init__(self, system_prompt: str, token_budget: int = None, system_tokens: int = None):
+        """
+        :param system_prompt: 系统提示词（始终保留）
+        :param token_budget: 发送给模型的上下文 token 上限（不含模型回复）
+        :param system_tokens: 预先估算的系统提示词 token 数，为空时现场估算
+        """
+        self.system_prompt = system_prompt
+        self.system_tokens = system_tokens if system_tokens is not None else estimate_tokens(system_prompt)
+        self.token_budget = token_budget or self.DEFAULT_TOKEN_BUDGET
+        self.summary = None
+        self.role_clips = []
+        self.history = []
+
+    def set_summary(self, summary: str):
+        """
+        更早对话的滚动摘要，代替被丢弃的原始历史
+        """
+        self.summary = summary.strip() if summary else None
+        return self
+
+    def add_role_clips(self, clips, tokens=None):
+        """
+        角色设定片段，按重要程度排序，预算不足时从末尾开始舍弃
+        :param tokens: 与 clips 一一对应的预估 token 数，为空时现场估算
+        """
+        tokens = tokens or [estimate_tokens(clip) for clip in clips]
+        self.role_clips.extend((clip, cost) for clip, cost in zip(clips, tokens) if clip)
+        return self
+
+    def add_history(self, messages):
+        """
+        历史对话，按时间正序的 {"role", "content"} 列表
+        """
+        self.history.extend(message for message in messages if message.get("content"))
+        return self
+
+    def _fit_section(self, title: str, items, budget: int):
+        """
+        在预算内尽量多地放入 (片段, token数)，返回 (拼接后的文本, 消耗的token)
+        """
+        if not items:
+            return "", 0
+        header = f"\n\n**{title}**：\n"
+        used = estimate_tokens(header)
+        lines = []
+        for item, tokens in items:
+            cost = tokens + 1
+            if used + cost > budget:
+                break
+            lines.append(item)
+            used += cost
+        if not lines:
+            return "", 0
+        return header + "\n".join(lines), used
+
+    def build(self, reserve_tokens: int = 0):
+        """
+        生成消息列表：[system, ...历史对话]
+        :param reserve_tokens: 为本轮用户输入预留的 token 数
+        """
+        remaining = self.token_budget - reserve_tokens
+
+        system_content = self.system_prompt
+        remaining -= self.system_tokens + MESSAGE_OVERHEAD_TOKENS
+        if self.summary:
+            summary_section = f"\n\n**此前对话摘要**：\n{self.summary}"
+            system_content += summary_section
+            remaining -= estimate_tokens(summary_section)
+
+        # 角色设定最多占剩余预算的一半，保证历史对话仍有空间
+        clips_text, used = self._fit_section("角色设定补充", self.role_clips, max(remaining, 0) // 2)
+        remaining -= used
+        messages = [{"role": "system", "content": system_content + clips_text}]
+
+        # 从最新的历史对话开始倒序放入，预算耗尽后更早的对话被丢弃
+        kept = []
+        for message in reversed(self.history):
+            cost = estimate_message_tokens(message)
+            if cost > remaining:
+                break
+            kept.append(message)
+            remaining -= cost
+        # 不以助手回复开头，避免出现缺少提问的半轮对话
+        while kept and kept[-1]["role"] == "assistant":
+            kept.pop()
+        messages.extend(reversed(kept))
+        return messages
@@ -1,26 +1,147 @@
+import asyncio
+import logging
 import os
-from openai import OpenAI
+import queue
+import threading
+import time
+from concurrent.futures import Future
 import json
 from pathlib import Path
+from .clients import ProviderClients
+
+logger = logging.getLogger(__name__)
 
 class Embedding():
+    MODEL = "text-embedding-v4"
+    MAX_BATCH_SIZE = 10         # text-embedding-v4 单次请求最多10条文本
+    COALESCE_WINDOW = 0.01      # 合并并发单条请求的等待窗口（秒）
+    TIMEOUT = float(os.getenv("EMBEDDING_TIMEOUT", "30"))  # 同步等待向量化结果的上限（秒）
+    _coalescer = None
+    _coalescer_lock = threading.Lock()
+
     @classmethod
     def _load_config(cls):
-        """加载API配置"""
-        config_path = Path(__file__).parent / "api_keys.json"
-        with open(config_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    
+        """加载API配置（进程内缓存，文件修改后自动重新加载）"""
+        return ProviderClients.get_config()
+
     @classmethod
     def embedding(cls, text: str):
-        config = cls._load_config()
-        client = OpenAI(
-            api_key=config["api_key"],
-            base_url=config["base_url"]
-        )
-
-        completion = client.embeddings.create(
-            model="text-embedding-v4",
-            input=text
-        )
-        return json.loads(completion.model_dump_json())["data"][0]["embedding"]
+        """
+        单条文本向量化；并发的单条请求会在短时间窗口内合并为一次批量调用
+        超过 TIMEOUT 仍未返回时抛出 concurrent.futures.TimeoutError，调用方按向量化失败处理
+        """
+        return cls._get_coalescer().submit(text).result(timeout=cls.TIMEOUT)
+
+    @classmethod
+    async def aembedding(cls, text: str):
+        """
+        单条文本向量化（异步），同样经过合并器，等待结果时不阻塞事件循环
+        """
+        return await asyncio.wrap_future(cls._get_coalescer().submit(text))
+
+    @classmethod
+    def embed_batch(cls, texts):
+        """
+        批量文本向量化，按接口上限自动分批
+        :return: 与 texts 顺序一致的向量列表
+        """
+        texts = list(texts)
+        if not texts:
+            return []
+        client = ProviderClients.openai_client()
+
+        vectors = []
+        for start in range(0, len(texts), cls.MAX_BATCH_SIZE):
+            completion = client.embeddings.create(
+                model=cls.MODEL,
+                input=texts[start:start + cls.MAX_BATCH_SIZE]
+            )
+            data = sorted(json.loads(completion.model_dump_json())["data"], key=lambda item: item["index"])
+            vectors.extend(item["embedding"] for item in data)
+        return vectors
+
+    @classmethod
+    def _get_coalescer(cls):
+        if cls._coalescer is None:
+            with cls._coalescer_lock:
+                if cls._coalescer is None:
+                    cls._coalescer = EmbeddingCoalescer(cls.embed_batch, cls.MAX_BATCH_SIZE, cls.COALESCE_WINDOW)
+        return cls._coalescer
+
+
+class EmbeddingCoalescer():
+    """
+    请求合并器：后台线程收集并发提交的单条文本，
+    在等待窗口内凑满一批（或窗口结束）后发起一次批量调用
+    """
+
+    def __init__(self, batch_fn, max_batch_size: int, window: float):
+        """
+        :param batch_fn: 批量向量化函数，输入文本列表，返回顺序一致的向量列表
+        :param max_batch_size: 单批最大文本数
+        :param window: 收到第一条请求后最多等待的时间（秒）
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.window = window
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="embedding-coalescer", daemon=True)
+        self._worker.start()
+
+    def submit(self, text: str) -> Future:
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def _collect(self):
+        """
+        收集一批请求；已被调用方取消的请求（例如 aembedding 的等待任务被取消）直接丢弃
+        """
+        batch = []
+        deadline = None
+        while len(batch) < self.max_batch_size:
+            try:
+                if deadline is None:
+                    item = self._queue.get()
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if deadline is None:
+                deadline = time.monotonic() + self.window
+            # 标记为运行中后调用方无法再取消，之后设置结果不会抛出 InvalidStateError
+            if item[1].set_running_or_notify_cancel():
+                batch.append(item)
+        return batch
+
+    def _dispatch(self, batch):
+        # 同一批内的重复文本只请求一次
+        unique_texts = list(dict.fromkeys(text for text, _ in batch))
+        try:
+            vectors = dict(zip(unique_texts, self.batch_fn(unique_texts)))
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for text, future in batch:
+            if text in vectors:
+                future.set_result(vectors[text])
+            else:
+                future.set_exception(RuntimeError(f"批量向量化返回的结果数少于请求数: {len(vectors)}/{len(unique_texts)}"))
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if not batch:
+                continue
+            try:
+                self._dispatch(batch)
+            except Exception as e:
+                # 后台线程退出后所有请求都不会再返回，任何异常都不能让循环结束
+                logger.error(f"向量化请求合并器分发结果失败: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
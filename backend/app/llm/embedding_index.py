@@ -0,0 +1,148 @@
+"""
+
+内存向量索引：连续的 float32 矩阵（行向量预先归一化）+ 并行的 id 数组
+查询时一次矩阵-向量乘积 + argpartition 取 top-k
+
+"""
+import os
+import threading
+
+import numpy as np
+
+
+def snapshot_tmp_path(path) -> str:
+    """
+    快照临时文件路径：按进程和线程区分，多个 worker 同时保存同一快照时不会写进同一个临时文件
+    """
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+class EmbeddingIndex():
+    def __init__(self, dim: int = None, initial_capacity: int = 64):
+        """
+        :param dim: 向量维度，为空时在首次写入时确定
+        :param initial_capacity: 初始容量，写满后按倍数扩容，保证追加为均摊O(1)
+        """
+        self.dim = dim
+        self._capacity = initial_capacity
+        self._size = 0
+        self._vectors = None
+        self._ids = np.empty(initial_capacity, dtype=np.int64)
+        self._positions = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, item_id):
+        return int(item_id) in self._positions
+
+    @property
+    def ids(self):
+        return self._ids[:self._size]
+
+    @property
+    def vectors(self):
+        if self._vectors is None:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return self._vectors[:self._size]
+
+    @staticmethod
+    def _normalize(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors.reshape(1, -1)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def _ensure_capacity(self, needed: int):
+        if self._vectors is None:
+            self._capacity = max(self._capacity, needed)
+            self._vectors = np.empty((self._capacity, self.dim), dtype=np.float32)
+            self._ids = np.empty(self._capacity, dtype=np.int64)
+            return
+        if needed <= self._capacity:
+            return
+        while self._capacity < needed:
+            self._capacity *= 2
+        vectors = np.empty((self._capacity, self.dim), dtype=np.float32)
+        vectors[:self._size] = self._vectors[:self._size]
+        ids = np.empty(self._capacity, dtype=np.int64)
+        ids[:self._size] = self._ids[:self._size]
+        self._vectors, self._ids = vectors, ids
+
+    def add(self, ids, vectors):
+        """
+        批量写入向量；已存在的id会被覆盖
+        """
+        vectors = self._normalize(vectors)
+        ids = [int(i) for i in ids]
+        if len(ids) != len(vectors):
+            raise ValueError("ids 与 vectors 数量不一致")
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"向量维度不一致: 期望 {self.dim}, 实际 {vectors.shape[1]}")
+            self._ensure_capacity(self._size + len(ids))
+            for item_id, vector in zip(ids, vectors):
+                position = self._positions.get(item_id)
+                if position is None:
+                    position = self._size
+                    self._size += 1
+                    self._positions[item_id] = position
+                    self._ids[position] = item_id
+                self._vectors[position] = vector
+
+    def remove(self, item_id):
+        """
+        删除向量：用最后一行填补空位，保持矩阵连续
+        """
+        with self._lock:
+            position = self._positions.pop(int(item_id), None)
+            if position is None:
+                return False
+            last = self._size - 1
+            if position != last:
+                self._vectors[position] = self._vectors[last]
+                self._ids[position] = self._ids[last]
+                self._positions[int(self._ids[position])] = position
+            self._size -= 1
+            return True
+
+    def search(self, query_vector, k: int = 1):
+        """
+        余弦相似度 top-k 检索
+        :return: (ids, scores)，按相似度降序
+        """
+        with self._lock:
+            if self._size == 0:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            query = self._normalize(query_vector)[0]
+            scores = self._vectors[:self._size] @ query
+            ids = self._ids[:self._size].copy()
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return ids[top], scores[top]
+
+    def save(self, path):
+        """
+        保存快照：先写临时文件再替换，读取方不会看到写了一半的文件
+        """
+        with self._lock:
+            arrays = {"kind": np.array("flat"), "ids": self.ids.copy(), "vectors": self.vectors.copy()}
+        tmp_path = snapshot_tmp_path(path)
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            ids, vectors = data["ids"], data["vectors"]
+        index = cls(dim=vectors.shape[1] if len(vectors) else None, initial_capacity=max(len(ids), 64))
+        if len(ids):
+            index.add(ids, vectors)
+        return index
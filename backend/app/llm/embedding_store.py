@@ -0,0 +1,187 @@
+"""
+
+文本向量持久化：每条聊天消息 / 角色设定切片只向量化一次
+
+回填历史数据：
+    python -m app.llm.embedding_store --batch-size 100
+
+"""
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from sqlalchemy import Delete, and_, delete, insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.db.session import SessionLocal
+from app.models.chat_messages import ChatMessages
+from app.models.content_embeddings import ContentEmbeddings
+from app.models.role_settings import RoleSettings
+from .embedding_api import Embedding
+from .vector_snapshot import VectorSnapshot
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingStore():
+    CHAT_MESSAGE = "chat_message"
+    ROLE_SETTING = "role_setting"
+
+    # 消息写入后在后台线程中向量化，不阻塞请求
+    _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="embedding-store")
+
+    @staticmethod
+    def encode(vector) -> bytes:
+        return np.asarray(vector, dtype='<f4').tobytes()
+
+    @staticmethod
+    def decode(data: bytes) -> np.ndarray:
+        return np.frombuffer(data, dtype='<f4')
+
+    @classmethod
+    def load(cls, db: Session, source_type: str, source_ids, model: str = None):
+        """
+        批量读取已保存的向量：先查内存映射快照，快照之后新增的向量再查数据库
+        :return: {source_id: np.ndarray}
+        """
+        source_ids = [int(i) for i in source_ids]
+        if not source_ids:
+            return {}
+        vectors = VectorSnapshot.lookup(source_type, source_ids, model)
+        missing = [source_id for source_id in source_ids if source_id not in vectors]
+        if not missing:
+            return vectors
+        rows = db.query(ContentEmbeddings.source_id, ContentEmbeddings.vector).filter(
+            ContentEmbeddings.source_type == source_type,
+            ContentEmbeddings.model == (model or Embedding.MODEL),
+            ContentEmbeddings.source_id.in_(missing)
+        ).all()
+        vectors.update({row.source_id: cls.decode(row.vector) for row in rows})
+        return vectors
+
+    @classmethod
+    def save(cls, db: Session, source_type: str, items, model: str = None):
+        """
+        批量保存向量，已存在的记录（唯一约束冲突）逐行跳过，不影响同批的其他向量
+        :param items: [(source_id, vector)]
+        """
+        model = model or Embedding.MODEL
+        rows = []
+        for source_id, vector in items:
+            vector = np.asarray(vector, dtype=np.float32)
+            rows.append({
+                "source_type": source_type,
+                "source_id": int(source_id),
+                "model": model,
+                "dim": vector.shape[0],
+                "vector": cls.encode(vector)
+            })
+        if not rows:
+            return
+        # MySQL: INSERT IGNORE，SQLite: INSERT OR IGNORE；并发写入同一条记录时只跳过重复的那一行
+        stmt = insert(ContentEmbeddings).prefix_with("IGNORE", dialect="mysql").prefix_with("OR IGNORE", dialect="sqlite")
+        try:
+            db.execute(stmt, rows)
+            db.commit()
+        except SQLAlchemyError as e:
+            # 保存失败不影响本次使用，下次读取时重新计算
+            db.rollback()
+            logger.error(f"保存向量失败: source_type={source_type}, count={len(rows)}, error={str(e)}")
+
+    @staticmethod
+    def delete_statement(source_type: str, source_ids) -> Delete:
+        """
+        删除来源记录的向量（所有模型版本），与删除来源记录放在同一事务中执行
+        已导出的快照中仍保留这些向量，直到下一次重建快照
+        """
+        return delete(ContentEmbeddings).where(
+            ContentEmbeddings.source_type == source_type,
+            ContentEmbeddings.source_id.in_([int(i) for i in source_ids])
+        )
+
+    @classmethod
+    def embed_and_save(cls, db: Session, source_type: str, items):
+        """
+        获取文本向量：优先读取已保存的结果，只对缺失的文本调用向量化接口
+        :param items: [(source_id, text)]
+        :return: {source_id: np.ndarray}
+        """
+        vectors = cls.load(db, source_type, [source_id for source_id, _ in items])
+        missing = [(int(source_id), text) for source_id, text in items if int(source_id) not in vectors]
+        if missing:
+            if len(missing) == 1:
+                # 单条文本走合并器，与其他并发请求共用一次上游调用
+                embedded = [Embedding.embedding(missing[0][1])]
+            else:
+                embedded = Embedding.embed_batch([text for _, text in missing])
+            computed = [(source_id, vector) for (source_id, _), vector in zip(missing, embedded)]
+            cls.save(db, source_type, computed)
+            vectors.update({source_id: np.asarray(vector, dtype=np.float32) for source_id, vector in computed})
+        return vectors
+
+    @classmethod
+    def schedule_message(cls, message_id: int, text: str):
+        """
+        在后台为新消息计算并保存向量
+        """
+        return cls._executor.submit(cls._embed_in_background, cls.CHAT_MESSAGE, message_id, text)
+
+    @classmethod
+    def _embed_in_background(cls, source_type: str, source_id: int, text: str):
+        db = SessionLocal()
+        try:
+            cls.embed_and_save(db, source_type, [(source_id, text)])
+        except Exception as e:
+            logger.error(f"后台向量化失败: source_type={source_type}, source_id={source_id}, error={str(e)}")
+        finally:
+            db.close()
+
+    @classmethod
+    def backfill(cls, db: Session, batch_size: int = 100):
+        """
+        为尚未向量化的历史用户消息和角色设定切片补齐向量
+        :return: 各来源新写入的数量
+        """
+        sources = [
+            (cls.CHAT_MESSAGE, ChatMessages, ChatMessages.query_content),
+            (cls.ROLE_SETTING, RoleSettings, RoleSettings.setting_text),
+        ]
+        result = {}
+        for source_type, model_class, text_column in sources:
+            count = 0
+            last_id = 0
+            while True:
+                rows = db.query(model_class.id, text_column).outerjoin(
+                    ContentEmbeddings,
+                    and_(
+                        ContentEmbeddings.source_type == source_type,
+                        ContentEmbeddings.source_id == model_class.id,
+                        ContentEmbeddings.model == Embedding.MODEL
+                    )
+                ).filter(
+                    model_class.id > last_id,
+                    text_column != "",
+                    ContentEmbeddings.id.is_(None)
+                ).order_by(model_class.id).limit(batch_size).all()
+                if not rows:
+                    break
+                cls.embed_and_save(db, source_type, [(row[0], row[1]) for row in rows])
+                count += len(rows)
+                last_id = rows[-1][0]
+                logger.info(f"{source_type} 已回填 {count} 条向量")
+            result[source_type] = count
+        return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="回填聊天消息与角色设定的文本向量")
+    parser.add_argument("--batch-size", type=int, default=100, help="每批处理的记录数")
+    args = parser.parse_args()
+
+    session = SessionLocal()
+    try:
+        print(EmbeddingStore.backfill(session, batch_size=args.batch_size))
+    finally:
+        session.close()
@@ -10,6 +10,7 @@ import os
 import json
 import requests
 from pathlib import Path
+from .clients import ProviderClients
 
 
 
@@ -17,15 +18,12 @@ from pathlib import Path
 class Fun_ASR():
     @classmethod
     def _load_config(cls):
-        """加载API配置"""
-        config_path = Path(__file__).parent / "api_keys.json"
-        with open(config_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        """加载API配置（进程内缓存，文件修改后自动重新加载）"""
+        return ProviderClients.get_config()
     
     @classmethod
     def transcribe(cls, audio_url):
-        config = cls._load_config()
-        dashscope.api_key = config["api_key"]
+        cls._load_config()  # 确保 dashscope.api_key 已配置
         task_response = Transcription.async_call(
             model='fun-asr',
             file_urls=[audio_url]
@@ -38,10 +36,12 @@ class Fun_ASR():
         if transcribe_response.status_code == HTTPStatus.OK:
             json_response = json.loads(json.dumps(transcribe_response.output, indent=4, ensure_ascii=False))
             transcription_url = json_response['results'][0]['transcription_url']
-            return requests.get(transcription_url).json()['transcripts'][0]['text']
+            return ProviderClients.http_session().get(transcription_url).json()['transcripts'][0]['text']
         else:
             print('ERROR:status_code: ', transcribe_response.status_code)
             return 0
 
 
-Fun_ASR.transcribe("https://dashscope.oss-cn-beijing.aliyuncs.com/samples/audio/paraformer/hello_world_female2.wav")
+# 测试代码已移除，避免在导入时执行
+# if __name__ == "__main__":
+#     print(Fun_ASR.transcribe("https://dashscope.oss-cn-beijing.aliyuncs.com/samples/audio/paraformer/hello_world_female2.wav"))
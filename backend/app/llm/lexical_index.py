@@ -0,0 +1,244 @@
+"""
+
+本地倒排索引（BM25）与混合检索
+中文按字切分为 bigram（单字成段时保留单字），英文 / 数字按词切分，
+专有名词、咒语等向量检索容易漏掉的精确词面（「守护神咒」「Expecto Patronum」）由倒排索引召回，
+再与向量检索的结果做倒数排名融合（RRF）
+
+"""
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 连续的汉字（含扩展A区）或连续的字母数字
+_TOKEN_PATTERN = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff]+|[a-z0-9]+")
+
+
+def tokenize(text: str):
+    """
+    切分为检索词：汉字段切为相邻两字的 bigram，英文单词与数字整体作为一个词
+    """
+    tokens = []
+    for segment in _TOKEN_PATTERN.findall((text or "").lower()):
+        if not segment[0].isascii() and len(segment) > 1:
+            tokens.extend(segment[i:i + 2] for i in range(len(segment) - 1))
+        else:
+            tokens.append(segment)
+    return tokens
+
+
+class BM25Index():
+    """
+    内存倒排索引：词 -> {文档id: 词频}，接口与 EmbeddingIndex 一致（add / remove / search）
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings = {}
+        self._lengths = {}
+        self._terms = {}
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def __contains__(self, doc_id):
+        return int(doc_id) in self._lengths
+
+    @property
+    def ids(self):
+        with self._lock:
+            return list(self._lengths)
+
+    def _remove_locked(self, doc_id: int):
+        terms = self._terms.pop(doc_id, None)
+        if terms is None:
+            return False
+        for term in terms:
+            postings = self._postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+        self._total_length -= self._lengths.pop(doc_id)
+        return True
+
+    def add(self, doc_ids, texts):
+        """
+        批量写入文档；已存在的id会被覆盖
+        """
+        with self._lock:
+            for doc_id, text in zip(doc_ids, texts):
+                doc_id = int(doc_id)
+                self._remove_locked(doc_id)
+                counts = Counter(tokenize(text))
+                for term, tf in counts.items():
+                    self._postings.setdefault(term, {})[doc_id] = tf
+                length = sum(counts.values())
+                self._terms[doc_id] = tuple(counts)
+                self._lengths[doc_id] = length
+                self._total_length += length
+
+    def remove(self, doc_id):
+        with self._lock:
+            return self._remove_locked(int(doc_id))
+
+    def search(self, query: str, k: int = 10, min_coverage: float = 0.0, allowed=None):
+        """
+        BM25 top-k 检索
+        :param min_coverage: 文档命中的查询词（去重）占比下限，过滤只碰巧命中个别常见词的结果
+        :param allowed: 可返回的id集合，在打分时过滤，不在集合中的文档不会占用 top-k 名额；为空时不限制
+        :return: (ids, scores, coverages)，按得分降序
+        """
+        terms = set(tokenize(query))
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32), np.empty(0, dtype=np.float32))
+        if not terms:
+            return empty
+        scores = {}
+        matched = Counter()
+        with self._lock:
+            count = len(self._lengths)
+            if count == 0:
+                return empty
+            average_length = self._total_length / count or 1.0
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    if allowed is not None and doc_id not in allowed:
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / average_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+                    matched[doc_id] += 1
+        results = [
+            (doc_id, score, matched[doc_id] / len(terms))
+            for doc_id, score in scores.items()
+            if matched[doc_id] / len(terms) >= min_coverage
+        ]
+        results.sort(key=lambda item: -item[1])
+        results = results[:k]
+        if not results:
+            return empty
+        ids, scores, coverages = zip(*results)
+        return np.asarray(ids, dtype=np.int64), np.asarray(scores, dtype=np.float32), np.asarray(coverages, dtype=np.float32)
+
+
+def reciprocal_rank_fusion(rankings, k: int = 60, top_k: int = None):
+    """
+    倒数排名融合：score(d) = Σ 1 / (k + rank)，只依赖名次，不需要对 BM25 与余弦分数做归一化
+    :param rankings: 多路检索结果，每路为按相关度降序的id序列
+    :return: [(id, 融合得分)]，按得分降序
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            item_id = int(item_id)
+            fused[item_id] = fused.get(item_id, 0.0) + 1.0 / (k + rank)
+    results = sorted(fused.items(), key=lambda item: -item[1])
+    return results[:top_k] if top_k is not None else results
+
+
+class HybridSearch():
+    """
+    BM25 + 向量的混合检索
+    词面检索足够确定（查询词足够多、且最佳结果命中全部查询词）时直接返回，不再调用向量化接口
+    """
+    TOP_K = int(os.getenv("HYBRID_TOP_K", "3"))
+    # 单路候选数，融合前每路各取这么多
+    CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+    RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+    # 词面结果的查询词覆盖率下限，以及可以跳过向量检索的覆盖率
+    MIN_COVERAGE = float(os.getenv("HYBRID_MIN_COVERAGE", "0.5"))
+    LEXICAL_ONLY_COVERAGE = float(os.getenv("HYBRID_LEXICAL_ONLY_COVERAGE", "1.0"))
+    # 可以跳过向量检索的最少查询词数；一两个字的短提问很容易全部命中，单凭覆盖率不足以确定
+    LEXICAL_ONLY_MIN_TERMS = int(os.getenv("HYBRID_LEXICAL_ONLY_MIN_TERMS", "3"))
+    MIN_SCORE = float(os.getenv("HYBRID_MIN_SCORE", "0.4"))
+
+    @classmethod
+    def lexical(cls, lexical_index: BM25Index, query: str, allowed=None):
+        """
+        词面检索
+        :return: (ids, 是否足够确定可以跳过向量检索)
+        """
+        ids, _, coverages = lexical_index.search(query, k=cls.CANDIDATES, min_coverage=cls.MIN_COVERAGE, allowed=allowed)
+        confident = (
+            len(ids) > 0
+            and coverages[0] >= cls.LEXICAL_ONLY_COVERAGE
+            and len(set(tokenize(query))) >= cls.LEXICAL_ONLY_MIN_TERMS
+        )
+        return [int(doc_id) for doc_id in ids], confident
+
+    @classmethod
+    def semantic(cls, vector_index, query_vector, allowed=None, min_score: float = None):
+        """向量检索，只保留相似度不低于阈值的结果"""
+        min_score = cls.MIN_SCORE if min_score is None else min_score
+        ids, scores = vector_index.search(np.asarray(query_vector, dtype=np.float32).flatten(), k=cls.CANDIDATES)
+        return [int(doc_id) for doc_id, score in zip(ids, scores)
+                if score >= min_score and (allowed is None or int(doc_id) in allowed)]
+
+    @classmethod
+    def fuse(cls, lexical_ids, semantic_ids, top_k: int = None):
+        return [doc_id for doc_id, _ in reciprocal_rank_fusion(
+            [ranking for ranking in (lexical_ids, semantic_ids) if ranking], k=cls.RRF_K, top_k=top_k or cls.TOP_K
+        )]
+
+    @classmethod
+    def search(cls, lexical_index: BM25Index, vector_index, query: str, embed, top_k: int = None, allowed=None):
+        """
+        :param embed: 查询向量化函数，只有词面检索不够确定时才调用
+        :param allowed: 可返回的id集合，为空时不限制
+        :return: id列表，按融合得分降序
+        """
+        lexical_ids, confident = cls.lexical(lexical_index, query, allowed)
+        if confident:
+            return lexical_ids[:top_k or cls.TOP_K]
+        try:
+            semantic_ids = cls.semantic(vector_index, embed(query), allowed)
+        except Exception as e:
+            # 向量化接口不可用时只用词面结果
+            logger.warning(f"向量检索失败，只使用词面检索结果: {e}")
+            semantic_ids = []
+        return cls.fuse(lexical_ids, semantic_ids, top_k)
+
+
+class LexicalIndexRegistry():
+    """
+    按用户维护的聊天记录倒排索引，LRU淘汰不活跃用户；倒排索引由最近的历史消息增量构建，不做持久化，
+    Rag 每次检索前把索引修剪到当前历史窗口，索引大小不会随聊天记录无限增长
+    """
+    max_indexes = 1024
+    _indexes = OrderedDict()
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, user_id) -> BM25Index:
+        with cls._lock:
+            index = cls._indexes.get(user_id)
+            if index is None:
+                index = cls._indexes[user_id] = BM25Index()
+            cls._indexes.move_to_end(user_id)
+            while len(cls._indexes) > cls.max_indexes:
+                cls._indexes.popitem(last=False)
+            return index
+
+    @classmethod
+    def remove(cls, user_id, doc_id):
+        """从用户索引中删除消息；用户尚无索引时不做任何事"""
+        with cls._lock:
+            index = cls._indexes.get(user_id)
+        return index.remove(doc_id) if index is not None else False
+
+    @classmethod
+    def drop(cls, user_id):
+        with cls._lock:
+            cls._indexes.pop(user_id, None)
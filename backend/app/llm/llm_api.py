@@ -4,27 +4,29 @@ import dashscope
 from .prompt import Prompt
 import json
 from pathlib import Path
+from .clients import ProviderClients
+from .context_builder import estimate_message_tokens
 
 
 class LLM():
-    def __init__(self, role_name: str, system_prompt: str, max_turns: int):
+    def __init__(self, role_name: str, system_prompt: str, max_turns: int, max_context_tokens: int = None):
 
         """
         :param role_name: 角色名
         :param system_prompt: 系统提示词
         :param max_turns: 最大对话轮数
+        :param max_context_tokens: 上下文 token 上限，为空时只按消息条数裁剪
         """
         self.llm_name = 'qwen-flash'
         self.role_name = role_name
         self.system_prompt = system_prompt
         self.max_turns = max_turns
+        self.max_context_tokens = max_context_tokens
         self.message = [{"role": "system", "content": self.system_prompt}]
     
     def _load_config(self):
-        """加载API配置"""
-        config_path = Path(__file__).parent / "api_keys.json"
-        with open(config_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        """加载API配置（进程内缓存，文件修改后自动重新加载）"""
+        return ProviderClients.get_config()
 
     def update_max_turns(self,max_turns):
         """
@@ -38,18 +40,19 @@ class LLM():
         """
         self.system_prompt = system_prompt
 
-    def generate_output(self, query):
-        dashscope.base_http_api_url = "https://dashscope.aliyuncs.com/api/v1/"
+    def stream_output(self, query):
+        """
+        流式生成回复，逐个产出增量文本片段；生成结束后写入对话记忆
+        """
         self.update_chat_memory({"role": "user", "content": query})
         answer_content = ''
         config = self._load_config()
         completion = Generation.call(
             # 若没有配置环境变量，请用阿里云百炼API Key将下行替换为：api_key = "sk-xxx",
             # api_key=os.getenv("API_KEY"),
-            # api_key="sk-dcd129793262482cab9c357fb2d007fc",
             api_key=config["api_key"],
             # 可按需更换为其它深度思考模型
-            model="qwen-flash",
+            model=self.llm_name,
             messages=self.message,
             result_format="message",  # Qwen3开源版模型只支持设定为"message"；为了更好的体验，其它模型也推荐您优先设定为"message"
             enable_thinking=False,
@@ -62,17 +65,78 @@ class LLM():
             if chunk["status_code"]!=200:
                 error_msg = f"API调用失败！状态码: {chunk.get('status_code')}, 错误信息: {chunk.get('message', '未知错误')}"
                 raise Exception(error_msg)
-            answer_content += chunk.output.choices[0].message.content
+            delta = chunk.output.choices[0].message.content
+            if delta:
+                answer_content += delta
+                yield delta
         self.update_chat_memory({"role": "assistant", "content": answer_content})
-        return answer_content
+
+    def generate_output(self, query):
+        return ''.join(self.stream_output(query))
+
+    def context_tokens(self):
+        return sum(estimate_message_tokens(message) for message in self.message)
 
     def update_chat_memory(self,message):
         self.message.append(message)
-        if len(self.message) > self.max_turns:
-            self.message.reverse()
-            self.message.pop(-2)
-            self.message.pop(-2)
-            self.message.reverse()
+        # 超出条数或 token 上限时，从最早的历史对话开始丢弃（保留系统提示词和最新一条消息）
+        while len(self.message) > 2 and (
+            len(self.message) > self.max_turns
+            or (self.max_context_tokens and self.context_tokens() > self.max_context_tokens)
+        ):
+            del self.message[1]
+            # 不以助手回复开头，避免出现缺少提问的半轮对话
+            while len(self.message) > 2 and self.message[1]["role"] == "assistant":
+                del self.message[1]
+
+class AsyncLLM(LLM):
+    """
+    异步版本：直接通过 DashScope HTTP SSE 接口流式生成，不占用线程池
+    """
+    GENERATION_URL = ProviderClients.DASHSCOPE_HTTP_URL + "services/aigc/text-generation/generation"
+
+    async def astream_output(self, query):
+        """
+        异步流式生成回复，逐个产出增量文本片段；生成结束后写入对话记忆
+        """
+        self.update_chat_memory({"role": "user", "content": query})
+        answer_content = ''
+        config = self._load_config()
+        headers = {
+            "Authorization": f"Bearer {config['api_key']}",
+            "Content-Type": "application/json",
+            "X-DashScope-SSE": "enable"
+        }
+        payload = {
+            "model": self.llm_name,
+            "input": {"messages": self.message},
+            "parameters": {
+                "result_format": "message",
+                "enable_thinking": False,
+                "incremental_output": True
+            }
+        }
+        client = ProviderClients.async_http_client()
+        async with ProviderClients.provider_limit("llm"):
+            async with client.stream("POST", self.GENERATION_URL, json=payload, headers=headers) as response:
+                if response.status_code != 200:
+                    body = await response.aread()
+                    raise Exception(f"API调用失败！状态码: {response.status_code}, 错误信息: {body.decode('utf-8', 'ignore')}")
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    chunk = json.loads(line[len("data:"):])
+                    if chunk.get("code"):
+                        raise Exception(f"API调用失败！错误码: {chunk.get('code')}, 错误信息: {chunk.get('message', '未知错误')}")
+                    delta = chunk["output"]["choices"][0]["message"]["content"]
+                    if delta:
+                        answer_content += delta
+                        yield delta
+        self.update_chat_memory({"role": "assistant", "content": answer_content})
+
+    async def agenerate_output(self, query):
+        return ''.join([delta async for delta in self.astream_output(query)])
+
 # 测试代码已移除，避免在导入时执行
 # if __name__ == "__main__":
 #     llm = LLM("哈利波特", Prompt.harry_potter, 20)
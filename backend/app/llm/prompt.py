@@ -88,6 +88,15 @@ class Prompt():
     * “愿你好，我的朋友。我注意到你似乎在思考。你愿意与我探讨一个话题吗？比方说，你认为一个人怎样才能过上善良的生活？” 
     * “你说你渴望‘智慧’。这很有趣。那么，首先你能否告诉我，在你看来，‘智慧’到底是什么？它与‘知识’有何不同？”
     """
+
+    conversation_summary = """
+    你是一名对话记录整理员。请将给出的角色扮演对话整理为一段简洁的中文摘要，供后续对话延续上下文使用。
+    **要求**：
+    1. 保留用户透露的个人信息、偏好、约定和尚未解决的问题。
+    2. 保留角色已经讲述过的重要经历、做出的承诺和情绪变化。
+    3. 如果提供了“已有摘要”，请在其基础上合并新的对话内容，删除过时或重复的信息。
+    4. 使用第三人称叙述，不超过300字，只输出摘要正文。
+    """
     @classmethod
     def get_info(cls):
 
@@ -1,82 +1,112 @@
-import numpy as np
-from sql import CyberSQL
-from embedding_api import Embedding
+from .sql import CyberSQL
+from .embedding_api import Embedding
+from .ann_index import EmbeddingIndexRegistry
+from .embedding_store import EmbeddingStore
+from .lexical_index import HybridSearch, LexicalIndexRegistry
+from app.db.session import SessionLocal
 
 
 class Rag():
     def __init__(self, user_id, role_name):
-        self.cybersql = CyberSQL()  # 初始化数据库
+        self.cybersql = CyberSQL()  # 聊天记录查询，使用共享连接池
         self.user_id = user_id      # user_id
         self.role_name = role_name
-
-    def get_content(self, query: str) -> str:
+        self.index = EmbeddingIndexRegistry.get(user_id)  # 用户级向量索引，跨请求复用
+        self.lexical = LexicalIndexRegistry.get(user_id)  # 用户级倒排索引
+        self._history = None
+
+    def get_content(self, query: str, top_k: int = None) -> str:
+        """
+        混合检索相关的历史回答，多条之间换行分隔，没有结果时返回空格
+        """
         try:
-            from numpy.linalg import norm
-
-            # 获取查询的嵌入向量
-            query_vector = np.array(Embedding.embedding(query)).flatten()
-
-            # 获取历史查询
-            history_query = self.get_history_query()
-            if not history_query:
-                return " "
-
-            # 计算相似度（使用余弦相似度）
-            similarity = []
-            for hv in history_query:
-                history_vector = np.array(Embedding.embedding(hv)).flatten()
-
-                # 计算余弦相似度
-                if norm(query_vector) > 0 and norm(history_vector) > 0:
-                    cos_sim = np.dot(query_vector, history_vector) / (norm(query_vector) * norm(history_vector))
-                else:
-                    cos_sim = 0
-
-                similarity.append(cos_sim)
-
-            # 找到最相似的历史查询
-            max_similarity_index = np.argmax(similarity)
-            max_similarity_value = similarity[max_similarity_index]
-
-            print(f"最大余弦相似度: {max_similarity_value:.4f}")
-
-            # 设置相似度阈值，避免返回不相关的结果
-            if max_similarity_value < 0.4:  # 调整阈值
+            answers = self.retrieve(query, top_k)
+            if not answers:
                 print("未找到足够相似的历史对话")
                 return " "
-
-            # 获取对应的答案
-            history_answer = self.get_history_answer()
-            return history_answer[int(max_similarity_index)]
+            return "\n".join(answers)
 
         except Exception as e:
             print(f"获取内容时出错: {e}")
             return " "
+        finally:
+            self.cybersql.close()
 
-    def get_history_query(self):
-
-        history_chat = self.cybersql.get_user_chat_history_json(self.user_id, limit=100)  # 获取历史对话数据
-        latest_conversations = history_chat["latest_conversations"]
-        history_query = []
-        for talks in latest_conversations:
-            for conversations in talks['conversations']:
-                history_query.append(conversations["user_query"]["content"])
+    def retrieve(self, query: str, top_k: int = None):
+        """
+        BM25 倒排索引 + 向量索引混合检索历史问答，按倒数排名融合后返回 top-k 答案
+        词面检索足够确定时不调用向量化接口
+        """
+        # 一次查询同时取回问题与答案
+        history_pairs = self.get_history_pairs()
+        if not history_pairs:
+            return []
+        self.sync_lexical(history_pairs)
+
+        # 只返回当前历史窗口内的答案（已删除或过旧的消息会被跳过）
+        answers = {message_id: answer for message_id, _, answer in history_pairs}
+        self.trim_index(answers)
+
+        def embed(text):
+            # 只对索引中尚未出现的历史问题做向量化，已有向量直接复用
+            self.sync_index(history_pairs)
+            return Embedding.embedding(text)
+
+        message_ids = HybridSearch.search(self.lexical, self.index, query, embed, top_k=top_k, allowed=answers)
+        return [answers[message_id] for message_id in message_ids]
+
+    def sync_lexical(self, history_pairs):
+        """
+        增量更新倒排索引：问题与答案一起建索引，专有名词出现在任意一方都能命中
+        """
+        missing = [(message_id, f"{history_query} {answer}") for message_id, history_query, answer in history_pairs
+                   if message_id not in self.lexical]
+        if missing:
+            self.lexical.add([message_id for message_id, _ in missing], [text for _, text in missing])
+
+    def trim_index(self, window):
+        """
+        从向量索引和倒排索引中移除不在历史窗口内的消息：已删除、已移出窗口，
+        或来自其他进程保存的较旧快照；索引大小因此不超过历史窗口
+        """
+        for index in (self.index, self.lexical):
+            for message_id in [int(message_id) for message_id in index.ids if int(message_id) not in window]:
+                index.remove(message_id)
+
+    def sync_index(self, history_pairs):
+        """
+        增量更新向量索引：新出现的历史消息优先读取已保存的向量，缺失时才计算
+        """
+        missing = [(message_id, history_query) for message_id, history_query, _ in history_pairs
+                   if message_id not in self.index]
+        if not missing:
+            return
+        db = SessionLocal()
+        try:
+            vectors = EmbeddingStore.embed_and_save(db, EmbeddingStore.CHAT_MESSAGE, missing)
+        finally:
+            db.close()
+        self.index.add(list(vectors.keys()), list(vectors.values()))
+
+    def get_history(self):
+        """
+        用户最近100条聊天记录（列式），同一个 Rag 对象内只查询一次，问题与答案检索共用
+        """
+        if self._history is None:
+            self._history = self.cybersql.load_user_history(self.user_id, limit=100)
+        return self._history
+
+    def get_history_pairs(self):
+        """
+        获取历史问答对 [(用户消息id, 问题, 答案)]
+        """
+        return self.get_history().pairs()
 
-        return history_query
+    def get_history_query(self):
+        return list(self.get_history().queries)
 
     def get_history_answer(self):
         try:
-            history_chat = self.cybersql.get_user_chat_history_json(self.user_id, limit=100)  # 获取历史对话数据
-
-            latest_conversations = history_chat["latest_conversations"]
-            history_query = []
-            for talks in latest_conversations:
-                for conversations in talks['conversations']:
-                    history_query.append(conversations["assistant_answer"]["content"])
+            return list(self.get_history().answers)
         finally:
             self.cybersql.close()
-        return history_query
-
-
-
-
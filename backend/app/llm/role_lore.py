@@ -0,0 +1,140 @@
+"""
+
+角色设定检索：role_settings 切片只向量化一次（持久化在 content_embeddings），
+进程内按角色维护向量索引与倒排索引，对话时混合检索，只把与当前提问最相关的 top-k 切片放入上下文
+
+"""
+import asyncio
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from app.db.session import SessionLocal
+from .embedding_api import Embedding
+from .embedding_index import EmbeddingIndex
+from .embedding_store import EmbeddingStore
+from .lexical_index import BM25Index, HybridSearch
+
+logger = logging.getLogger(__name__)
+
+
+class RoleLore():
+    # 切片数不超过该值的角色直接把全部设定放入系统提示词，不做检索
+    FULL_CONTEXT_CLIPS = int(os.getenv("ROLE_LORE_FULL_CLIPS", "8"))
+    TOP_K = int(os.getenv("ROLE_LORE_TOP_K", "4"))
+    MIN_SCORE = float(os.getenv("ROLE_LORE_MIN_SCORE", "0.3"))
+
+    max_roles = 256
+    # role_id -> (clip_ids, 向量索引, {clip_id: 切片文本}, 倒排索引)；clip_ids 变化（角色设定被修改）时重建
+    _indexes = OrderedDict()
+    _lock = threading.Lock()
+
+    @classmethod
+    def needs_retrieval(cls, clips) -> bool:
+        return len(clips) > cls.FULL_CONTEXT_CLIPS
+
+    @classmethod
+    def _cached(cls, role_id: int, clip_ids):
+        with cls._lock:
+            cached = cls._indexes.get(role_id)
+            if cached is None or cached[0] != clip_ids:
+                return None
+            cls._indexes.move_to_end(role_id)
+            return cached
+
+    @classmethod
+    def build(cls, role_id: int, clip_ids, clips):
+        """
+        构建角色的切片索引：已保存的向量直接读取，缺失的切片批量向量化后保存
+        """
+        cached = cls._cached(role_id, clip_ids)
+        if cached is not None:
+            return cached
+        texts = dict(zip(clip_ids, clips))
+        db = SessionLocal()
+        try:
+            vectors = EmbeddingStore.embed_and_save(
+                db, EmbeddingStore.ROLE_SETTING, [(clip_id, text) for clip_id, text in texts.items() if text]
+            )
+        finally:
+            db.close()
+        index = EmbeddingIndex()
+        if vectors:
+            index.add(list(vectors.keys()), list(vectors.values()))
+        lexical = BM25Index()
+        lexical.add(list(texts.keys()), list(texts.values()))
+        entry = (tuple(clip_ids), index, texts, lexical)
+        with cls._lock:
+            cls._indexes[role_id] = entry
+            cls._indexes.move_to_end(role_id)
+            while len(cls._indexes) > cls.max_roles:
+                cls._indexes.popitem(last=False)
+        logger.info(f"角色 {role_id} 设定索引已构建，共 {len(index)} 条切片")
+        return entry
+
+    @classmethod
+    def _lexical(cls, entry, query: str, top_k: int = None):
+        """
+        词面检索切片
+        :return: (切片id列表, 是否足够确定可以跳过向量检索)
+        """
+        clip_ids, confident = HybridSearch.lexical(entry[3], query)
+        return (clip_ids[:top_k or cls.TOP_K], True) if confident else (clip_ids, False)
+
+    @classmethod
+    def _fuse(cls, entry, lexical_ids, query_vector, top_k: int = None):
+        """与向量检索结果做倒数排名融合"""
+        semantic_ids = HybridSearch.semantic(entry[1], query_vector, min_score=cls.MIN_SCORE)
+        return HybridSearch.fuse(lexical_ids, semantic_ids, top_k or cls.TOP_K)
+
+    @classmethod
+    def _select(cls, entry, clip_ids):
+        """
+        按检索名次取切片文本；长度由 ContextBuilder 与历史对话一起按 token 预算裁剪
+        """
+        texts = entry[2]
+        return [texts[int(clip_id)] for clip_id in clip_ids if texts.get(int(clip_id))]
+
+    @classmethod
+    def _fallback(cls, clips, top_k: int = None):
+        """检索失败时退回到 clip_index 最靠前的切片"""
+        return [clip for clip in clips[:top_k or cls.TOP_K] if clip]
+
+    @classmethod
+    def retrieve(cls, role_id: int, clip_ids, clips, query: str, top_k: int = None):
+        """
+        检索与提问最相关的角色设定切片，词面命中足够确定时不调用向量化接口
+        :return: 切片文本列表，按相关度降序
+        """
+        try:
+            entry = cls.build(role_id, clip_ids, clips)
+            ranked, confident = cls._lexical(entry, query, top_k)
+            if not confident:
+                ranked = cls._fuse(entry, ranked, Embedding.embedding(query), top_k)
+            return cls._select(entry, ranked)
+        except Exception as e:
+            logger.warning(f"角色设定检索失败，使用前 {top_k or cls.TOP_K} 条切片: {e}")
+            return cls._fallback(clips, top_k)
+
+    @classmethod
+    async def aretrieve(cls, role_id: int, clip_ids, clips, query: str, top_k: int = None):
+        """
+        检索与提问最相关的角色设定切片（异步），首次构建索引在线程池中执行
+        """
+        try:
+            entry = cls._cached(role_id, clip_ids)
+            if entry is None:
+                entry = await asyncio.to_thread(cls.build, role_id, clip_ids, clips)
+            ranked, confident = cls._lexical(entry, query, top_k)
+            if not confident:
+                ranked = cls._fuse(entry, ranked, await Embedding.aembedding(query), top_k)
+            return cls._select(entry, ranked)
+        except Exception as e:
+            logger.warning(f"角色设定检索失败，使用前 {top_k or cls.TOP_K} 条切片: {e}")
+            return cls._fallback(clips, top_k)
+
+    @classmethod
+    def drop(cls, role_id: int):
+        with cls._lock:
+            cls._indexes.pop(role_id, None)
@@ -0,0 +1,53 @@
+"""
+
+流式文本断句，用于LLM增量输出与TTS的流水线衔接
+
+"""
+
+
+class SentenceSplitter():
+    # 句末标点，遇到即可切分
+    SENTENCE_ENDINGS = "。！？!?；;…\n"
+    # 句子过长时的次级切分点
+    SOFT_BREAKS = "，,、：:"
+
+    def __init__(self, min_chars: int = 6, max_chars: int = 120):
+        """
+        :param min_chars: 最短片段长度，过短的句子会与下一句合并，避免产生大量零碎的TTS请求
+        :param max_chars: 最长片段长度，超过后在逗号等次级标点处强制切分
+        """
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.buffer = ''
+
+    def feed(self, text: str):
+        """
+        追加增量文本，返回本次已完整的句子列表
+        """
+        self.buffer += text
+        sentences = []
+        start = 0
+        for i, char in enumerate(self.buffer):
+            if char in self.SENTENCE_ENDINGS:
+                cut = i + 1
+            elif i + 1 - start >= self.max_chars and char in self.SOFT_BREAKS:
+                cut = i + 1
+            else:
+                continue
+            # 连续的标点（如"！？"、"……"）归入同一句；位于末尾的标点等待下一个片段再判断
+            if cut == len(self.buffer) or self.buffer[cut] in self.SENTENCE_ENDINGS:
+                continue
+            if len(self.buffer[start:cut].strip()) < self.min_chars:
+                continue
+            sentences.append(self.buffer[start:cut].strip())
+            start = cut
+        self.buffer = self.buffer[start:]
+        return sentences
+
+    def flush(self):
+        """
+        输出缓冲区中剩余的文本（LLM生成结束时调用）
+        """
+        rest = self.buffer.strip()
+        self.buffer = ''
+        return [rest] if rest else []
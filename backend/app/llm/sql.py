@@ -1,110 +1,180 @@
-import pymysql
-import pandas as pd
-import json
-from datetime import datetime
+"""
+
+RAG 聊天记录数据访问
+
+连接复用基准测试（每次查询新建连接 vs 共享连接池）：
+    python -m app.llm.sql --bench --iterations 200 --user-id 1
+
+"""
+import argparse
+import time
+
+from sqlalchemy import TIMESTAMP, create_engine, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import NullPool
+
+from app.db import session as db_session
+
+
+class ChatHistory(object):
+    """
+    用户最近聊天记录的列式结果（按时间正序），各列表下标一一对应
+    """
+    __slots__ = ("message_ids", "session_ids", "queries", "answers", "message_types", "created_at",
+                 "role_names", "username")
+
+    def __init__(self, rows):
+        columns = list(zip(*rows)) if rows else [()] * 8
+        self.message_ids = [int(message_id) for message_id in columns[0]]
+        self.session_ids = [int(session_id) for session_id in columns[1]]
+        self.queries = list(columns[2])
+        self.answers = list(columns[3])
+        self.message_types = list(columns[4])
+        self.created_at = list(columns[5])
+        self.role_names = list(columns[6])
+        # 所有行属于同一用户
+        self.username = columns[7][0] if rows else None
+
+    def __len__(self):
+        return len(self.message_ids)
+
+    def pairs(self):
+        """
+        历史问答对 [(用户消息id, 问题, 答案)]
+        兼容两种存储方式：同一行包含一问一答，或用户消息与助手回复分两行保存（按会话配对）
+        """
+        pairs = []
+        pending = {}
+        for message_id, session_id, query, answer in zip(self.message_ids, self.session_ids, self.queries, self.answers):
+            if query and answer:
+                pairs.append((message_id, query, answer))
+                pending.pop(session_id, None)
+            elif query:
+                pending[session_id] = (message_id, query)
+            elif answer and session_id in pending:
+                query_id, query = pending.pop(session_id)
+                pairs.append((query_id, query, answer))
+        return pairs
+
 
 class CyberSQL(object):
-    def __init__(self):
-        self.DB_CONFIG = {
-            'host': 'localhost',
-            'database': 'cyber',
-            'user': 'root',
-            'password': '991211',
-            'port': 3306,
-            'charset': 'utf8mb4'
-        }
-        """建立数据库连接"""
-        try:
-            self.connection = pymysql.connect(**self.DB_CONFIG)
-            print("数据库连接成功！")
-        except pymysql.Error as e:
-            print(f"数据库连接失败: {e}")
+    def __init__(self, bind: Engine = None):
+        """
+        RAG 数据访问层，每次查询从连接池借用连接、用完归还，不再单独建立数据库连接
+        :param bind: 使用的引擎，默认为 app.db.session 的共享引擎（连接池与账号配置同主应用）
+        """
+        self.bind = bind if bind is not None else db_session.engine
 
-    def get_user_chat_history_json(self, user_id, limit=10):
-        """获取特定用户的聊天历史，拼接成JSON格式，只取最近N个对话"""
-        query = """
-        SELECT 
-            u.username,
-            r.name as role_name,
-            cs.id as session_id,
+    # 用户最近N条聊天记录（即 migrations.HOT_QUERIES 中的 user_chat_history），
+    # 角色名与用户名按主键关联取回，不再额外查询
+    HISTORY_QUERY = text("""
+        SELECT
+            cm.id,
+            cm.session_id,
             cm.query_content,
             cm.answer_content,
             cm.message_type,
-            cm.created_at
+            cm.created_at,
+            r.name,
+            u.username
         FROM chat_sessions cs
-        JOIN user u ON cs.user_id = u.id
-        JOIN role r ON cs.role_id = r.id
         JOIN chat_messages cm ON cs.id = cm.session_id
-        WHERE u.id = %s
-        ORDER BY cm.created_at DESC
-        LIMIT %s
-        """
+        LEFT JOIN role r ON r.id = cs.role_id
+        LEFT JOIN user u ON u.id = cs.user_id
+        WHERE cs.user_id = :user_id
+        ORDER BY cm.created_at DESC, cm.id DESC
+        LIMIT :limit
+    """).columns(created_at=TIMESTAMP)
 
-        df = pd.read_sql(query, self.connection, params=(user_id, limit))
+    def load_user_history(self, user_id, limit=100):
+        """
+        一次查询取回用户最近N条聊天记录，返回按时间正序的列式结果
+        使用 app.db.session 的共享连接池，不经过 pandas
+        """
+        with self.bind.connect() as conn:
+            rows = conn.execute(self.HISTORY_QUERY, {"user_id": user_id, "limit": limit}).all()
+        rows.reverse()
+        return ChatHistory(rows)
 
-        # 反转顺序，让最早的对话在前
-        df = df.iloc[::-1].reset_index(drop=True)
+    def get_user_chat_history_json(self, user_id, limit=10):
+        """获取特定用户的聊天历史，拼接成JSON格式，只取最近N个对话"""
+        history = self.load_user_history(user_id, limit)
 
         # 转换为JSON格式
         chat_history = {
             "user_id": user_id,
-            "username": df.iloc[0]['username'] if len(df) > 0 else "Unknown",
-            "total_messages": len(df),
+            "username": history.username or "Unknown",
+            "total_messages": len(history),
             "latest_conversations": []
         }
 
         # 按会话分组处理
         sessions = {}
-        for _, row in df.iterrows():
-            session_id = row['session_id']
+        for message_id, session_id, query, answer, message_type, created_at, role_name in zip(
+                history.message_ids, history.session_ids, history.queries, history.answers,
+                history.message_types, history.created_at, history.role_names):
             if session_id not in sessions:
                 sessions[session_id] = {
                     "session_id": session_id,
-                    "role_name": row['role_name'],
+                    "role_name": role_name,
                     "conversations": []
                 }
 
             # 每个消息记录包含一问一答
-            conversation = {
-                "user_query": {
-                    "content": row['query_content'],
-                    "message_type": row['message_type'],
-                    "created_at": row['created_at'].strftime('%Y-%m-%d %H:%M:%S') if pd.notna(
-                        row['created_at']) else None
-                },
-                "assistant_answer": {
-                    "content": row['answer_content'],
-                    "message_type": row['message_type'],
-                    "created_at": row['created_at'].strftime('%Y-%m-%d %H:%M:%S') if pd.notna(
-                        row['created_at']) else None
-                }
-            }
-
-            sessions[session_id]["conversations"].append(conversation)
+            created = created_at.strftime('%Y-%m-%d %H:%M:%S') if created_at else None
+            sessions[session_id]["conversations"].append({
+                "message_id": message_id,
+                "user_query": {"content": query, "message_type": message_type, "created_at": created},
+                "assistant_answer": {"content": answer, "message_type": message_type, "created_at": created}
+            })
 
         # 将会话添加到结果中
-        for session in sessions.values():
-            chat_history["latest_conversations"].append(session)
-        #print(type(chat_history))
-        #print(f"\n=== 用户ID {user_id} 的最近{limit}条对话记录(JSON格式) ===")
-        #print(json.dumps(chat_history, ensure_ascii=False, indent=2))
-        #print(type(chat_history))
+        chat_history["latest_conversations"].extend(sessions.values())
         return chat_history
 
     def close(self):
-        """关闭数据库连接"""
-        if hasattr(self, 'connection'):
-            self.connection.close()
-            print("数据库连接已关闭")
-
-# # 使用示例
-# if __name__ == "__main__":
-#     cyber_sql = CyberSQL()
-#
-#     try:
-#         # 获取用户1的对话记录（按会话分组）
-#         chat_history_grouped = cyber_sql.get_user_chat_history_json(user_id=1, limit=10)
-#
-#
-#     finally:
-#         cyber_sql.close()
\ No newline at end of file
+        """连接在每次查询后已归还连接池，保留该方法兼容旧的调用方"""
+
+
+def bench_connection_churn(iterations: int = 200, user_id: int = 1, limit: int = 100, bind: Engine = None):
+    """
+    对比两种连接方式下加载聊天记录的耗时：
+    per_call_connect 每次查询新建连接（TCP + 认证握手，即原先每个 Rag 对象 pymysql.connect 的开销），
+    pooled 从共享连接池借用连接
+    :return: {方式: {"total_ms", "avg_ms", "p95_ms"}}
+    """
+    bind = bind if bind is not None else db_session.engine
+    unpooled = create_engine(bind.url, poolclass=NullPool)
+    results = {}
+    try:
+        for name, engine in (("per_call_connect", unpooled), ("pooled", bind)):
+            cyber_sql = CyberSQL(engine)
+            cyber_sql.load_user_history(user_id, limit)  # 预热：建立连接池中的连接
+            timings = []
+            for _ in range(iterations):
+                start = time.perf_counter()
+                cyber_sql.load_user_history(user_id, limit)
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            results[name] = {
+                "total_ms": round(sum(timings), 2),
+                "avg_ms": round(sum(timings) / len(timings), 3),
+                "p95_ms": round(timings[int(len(timings) * 0.95) - 1], 3)
+            }
+    finally:
+        unpooled.dispose()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="RAG 聊天记录数据访问")
+    parser.add_argument("--bench", action="store_true", help="运行连接复用基准测试")
+    parser.add_argument("--iterations", type=int, default=200, help="每种方式的查询次数")
+    parser.add_argument("--user-id", type=int, default=1, help="查询的用户ID")
+    args = parser.parse_args()
+
+    if args.bench:
+        for name, stats in bench_connection_churn(args.iterations, args.user_id).items():
+            print(f"{name}: 总计 {stats['total_ms']} ms, 平均 {stats['avg_ms']} ms, p95 {stats['p95_ms']} ms")
+    else:
+        print(CyberSQL().get_user_chat_history_json(args.user_id))
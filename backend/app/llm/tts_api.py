@@ -1,28 +1,57 @@
 #  DashScope SDK 版本不低于 1.24.6
+import logging
 import os
 import dashscope
 import json
 from pathlib import Path
+from .clients import ProviderClients
+from .tts_cache import tts_cache
+from .audio_store import AudioStore
+
+logger = logging.getLogger(__name__)
 
 class TTS():
+    MODEL = "qwen3-tts-flash"
+
     def __init__(self, voice: str, language: str):
         self.voice = voice
         self.language = language
     
     def _load_config(self):
-        """加载API配置"""
-        config_path = Path(__file__).parent / "api_keys.json"
-        with open(config_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        """加载API配置（进程内缓存，文件修改后自动重新加载）"""
+        return ProviderClients.get_config()
     
+    def cache_key(self, text: str):
+        return tts_cache.make_key(text, self.voice, self.language, self.MODEL)
+
+    @staticmethod
+    def _get_cached(cache_key: str):
+        cached = tts_cache.get(cache_key)
+        # 本地文件可能已被存储清理删除，此时视为未命中
+        if cached is not None and AudioStore.is_local_url(cached) and not AudioStore.exists(cached):
+            return None
+        return cached
+
+    @staticmethod
+    def _cache_audio(cache_key: str, audio_url: str):
+        # 本地文件长期有效，缓存期与存储保留期一致；服务商临时URL使用默认有效期
+        ttl = AudioStore.MAX_AGE_SECONDS if AudioStore.is_local_url(audio_url) else None
+        tts_cache.put(cache_key, audio_url, ttl=ttl)
+
     def generate_audio(self,text:str):
+        # 相同文本/音色/语种的音频直接复用缓存，不再调用合成接口
+        cache_key = self.cache_key(text)
+        cached = self._get_cached(cache_key)
+        if cached is not None:
+            return cached
+
         config = self._load_config()
         response = dashscope.MultiModalConversation.call(
-            model="qwen3-tts-flash",
+            model=self.MODEL,
             api_key=config["api_key"],
             text=text,
-            voice="Cherry",
-            language_type="Chinese",  # 建议与文本语种一致，以获得正确的发音和自然的语调。
+            voice=self.voice,
+            language_type=self.language,  # 建议与文本语种一致，以获得正确的发音和自然的语调。
             stream=False
         )
 
@@ -36,7 +65,59 @@ class TTS():
         if not hasattr(response.output, 'audio') or response.output.audio is None:
             raise Exception(f"TTS API未返回音频数据: {response.output}")
 
-        return response.output.audio.url    # 返回音频url
+        # 服务商返回的URL会过期，下载到本地存储后返回本地URL；下载失败时退回临时URL
+        audio_url = response.output.audio.url
+        try:
+            audio_url = AudioStore.save_from_url(audio_url)
+        except Exception as e:
+            logger.warning(f"音频保存到本地失败，使用临时URL: {e}")
+        self._cache_audio(cache_key, audio_url)
+        return audio_url    # 返回音频url
+
+class AsyncTTS(TTS):
+    """
+    异步版本：直接调用 DashScope HTTP 接口，不占用线程池
+    """
+    GENERATION_URL = ProviderClients.DASHSCOPE_HTTP_URL + "services/aigc/multimodal-generation/generation"
+
+    async def agenerate_audio(self, text: str):
+        cache_key = self.cache_key(text)
+        cached = self._get_cached(cache_key)
+        if cached is not None:
+            return cached
+
+        config = self._load_config()
+        payload = {
+            "model": self.MODEL,
+            "input": {
+                "text": text,
+                "voice": self.voice,
+                "language_type": self.language  # 建议与文本语种一致，以获得正确的发音和自然的语调。
+            }
+        }
+        headers = {
+            "Authorization": f"Bearer {config['api_key']}",
+            "Content-Type": "application/json"
+        }
+        client = ProviderClients.async_http_client()
+        async with ProviderClients.provider_limit("tts"):
+            response = await client.post(self.GENERATION_URL, json=payload, headers=headers)
+
+        if response.status_code != 200:
+            raise Exception(f"TTS API调用失败！状态码: {response.status_code}, 错误信息: {response.text}")
+
+        output = response.json().get("output") or {}
+        audio = output.get("audio") or {}
+        if not audio.get("url"):
+            raise Exception(f"TTS API未返回音频数据: {output}")
+
+        audio_url = audio["url"]
+        try:
+            audio_url = await AudioStore.asave_from_url(audio_url)
+        except Exception as e:
+            logger.warning(f"音频保存到本地失败，使用临时URL: {e}")
+        self._cache_audio(cache_key, audio_url)
+        return audio_url    # 返回音频url
 
 # 测试代码已移除，避免在导入时执行
 # if __name__ == "__main__":
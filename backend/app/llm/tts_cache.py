@@ -0,0 +1,71 @@
+"""
+
+TTS 音频内容寻址缓存：相同的 (文本, 音色, 语种, 模型) 直接复用已合成的音频
+
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTSCache():
+    def __init__(self, max_entries: int = 2048, ttl: float = 12 * 3600):
+        """
+        :param max_entries: 最大缓存条数，超出后淘汰最久未使用的条目
+        :param ttl: 条目有效期（秒）。服务商返回的音频URL约24小时后失效，默认取12小时
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(text: str, voice: str, language: str, model: str) -> str:
+        raw = "\x1f".join([model, voice, language, text])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value, ttl: float = None):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0
+            }
+
+
+tts_cache = TTSCache()
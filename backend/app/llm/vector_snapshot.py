@@ -0,0 +1,213 @@
+"""
+
+向量快照：content_embeddings 按来源类型导出为内存映射的矩阵文件 + id 边车文件
+各 worker 进程以只读 mmap 打开同一份文件，共享操作系统页缓存；打开快照与向量数量无关，启动不需要逐条读取数据库
+
+目录结构（EMBEDDING_SNAPSHOT_DIR/<来源类型>/）：
+    CURRENT                  当前版本目录名，通过临时文件 + os.replace 原子切换
+    v<时间戳>/vectors.npy    float16 / float32 矩阵，行顺序与 ids.npy 一致
+    v<时间戳>/ids.npy        int64 来源id，升序
+    v<时间戳>/meta.json      向量模型、维度、数量、精度
+
+新版本在临时目录中完整写好后才切换 CURRENT，读取方要么看到旧版本、要么看到新版本；
+旧版本目录保留 KEEP_VERSIONS 个，已经映射旧文件的进程在下次检查 CURRENT 时切换
+
+快照不会随消息删除更新：删除消息或会话时只删除 content_embeddings 中的记录，
+已删除消息的向量留在当前快照中，直到下一次重建（建议定时执行下面的命令）
+
+构建并切换到新快照：
+    python -m app.llm.vector_snapshot --source chat_message --dtype float16
+
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.db.session import SessionLocal
+from app.models.content_embeddings import ContentEmbeddings
+from .embedding_api import Embedding
+
+logger = logging.getLogger(__name__)
+
+
+class VectorSnapshot():
+    root = Path(os.getenv("EMBEDDING_SNAPSHOT_DIR", Path(__file__).resolve().parents[2] / "storage" / "embedding_snapshots"))
+    DTYPES = ("float16", "float32")
+    KEEP_VERSIONS = 2
+    # 检查 CURRENT 是否被其他进程切换的间隔（秒）
+    CHECK_INTERVAL = float(os.getenv("EMBEDDING_SNAPSHOT_CHECK_SECONDS", "10"))
+
+    # 来源类型 -> {"version", "ids", "vectors", "meta", "checked_at"}
+    _opened = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def _source_dir(cls, source_type: str) -> Path:
+        return cls.root / source_type
+
+    @classmethod
+    def current_version(cls, source_type: str):
+        try:
+            return (cls._source_dir(source_type) / "CURRENT").read_text(encoding="utf-8").strip() or None
+        except FileNotFoundError:
+            return None
+
+    @classmethod
+    def open(cls, source_type: str):
+        """
+        以只读 mmap 打开当前版本的快照，没有快照时返回 None
+        :return: {"version", "ids", "vectors", "meta", "checked_at"}
+        """
+        now = time.monotonic()
+        with cls._lock:
+            opened = cls._opened.get(source_type)
+            if opened is not None and now - opened["checked_at"] < cls.CHECK_INTERVAL:
+                return opened
+        version = cls.current_version(source_type)
+        if version is None:
+            with cls._lock:
+                cls._opened.pop(source_type, None)
+            return None
+        if opened is not None and opened["version"] == version:
+            opened["checked_at"] = now
+            return opened
+
+        version_dir = cls._source_dir(source_type) / version
+        opened = {
+            "version": version,
+            "ids": np.load(version_dir / "ids.npy", mmap_mode="r"),
+            "vectors": np.load(version_dir / "vectors.npy", mmap_mode="r"),
+            "meta": json.loads((version_dir / "meta.json").read_text(encoding="utf-8")),
+            "checked_at": now
+        }
+        with cls._lock:
+            cls._opened[source_type] = opened
+        logger.info(f"已映射向量快照 {source_type}/{version}，共 {opened['meta']['count']} 条")
+        return opened
+
+    @classmethod
+    def lookup(cls, source_type: str, source_ids, model: str = None):
+        """
+        从快照中按来源id查找向量（二分查找 id 边车文件，只读取命中的行）
+        :return: {source_id: np.ndarray(float32)}，快照中没有的id不在结果中
+        """
+        opened = cls.open(source_type)
+        if opened is None or opened["meta"]["model"] != (model or Embedding.MODEL) or not len(opened["ids"]):
+            return {}
+        ids = opened["ids"]
+        wanted = np.asarray(sorted({int(i) for i in source_ids}), dtype=np.int64)
+        positions = np.minimum(np.searchsorted(ids, wanted), len(ids) - 1)
+        found = ids[positions] == wanted
+        rows = np.asarray(opened["vectors"][positions[found]], dtype=np.float32)
+        return {int(source_id): row for source_id, row in zip(wanted[found], rows)}
+
+    @classmethod
+    def build(cls, db: Session, source_type: str, dtype: str = "float32", batch_size: int = 1000, model: str = None):
+        """
+        从 content_embeddings 流式导出新版本快照并原子切换，内存占用与批大小有关、与总量无关
+        :return: 新版本号
+        """
+        if dtype not in cls.DTYPES:
+            raise ValueError(f"不支持的精度: {dtype}，可选 {', '.join(cls.DTYPES)}")
+        model = model or Embedding.MODEL
+        base = db.query(ContentEmbeddings).filter(
+            ContentEmbeddings.source_type == source_type,
+            ContentEmbeddings.model == model
+        )
+        total = base.with_entities(func.count(ContentEmbeddings.id)).scalar() or 0
+        dim = base.with_entities(ContentEmbeddings.dim).limit(1).scalar() or 0
+
+        source_dir = cls._source_dir(source_type)
+        source_dir.mkdir(parents=True, exist_ok=True)
+        version = f"v{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
+        building = source_dir / f".building-{version}"
+        building.mkdir()
+        try:
+            ids = np.lib.format.open_memmap(building / "ids.npy", mode="w+", dtype=np.int64, shape=(total,))
+            vectors = np.lib.format.open_memmap(building / "vectors.npy", mode="w+", dtype=dtype, shape=(total, dim))
+            count = 0
+            last_id = -1
+            while count < total:
+                rows = base.with_entities(ContentEmbeddings.source_id, ContentEmbeddings.vector).filter(
+                    ContentEmbeddings.source_id > last_id
+                ).order_by(ContentEmbeddings.source_id).limit(min(batch_size, total - count)).all()
+                if not rows:
+                    break
+                for offset, row in enumerate(rows):
+                    ids[count + offset] = row.source_id
+                    vectors[count + offset] = np.frombuffer(row.vector, dtype='<f4')
+                count += len(rows)
+                last_id = rows[-1].source_id
+            ids.flush()
+            vectors.flush()
+            del ids, vectors
+            if count < total:
+                # 导出期间有记录被删除，截断到实际数量
+                for name in ("ids.npy", "vectors.npy"):
+                    data = np.load(building / name, mmap_mode="r")[:count]
+                    np.save(building / f"{name}.tmp", data)
+                    del data
+                    os.replace(building / f"{name}.tmp.npy", building / name)
+            meta = {"source_type": source_type, "model": model, "dim": dim, "count": count, "dtype": dtype,
+                    "created_at": time.strftime("%Y-%m-%d %H:%M:%S")}
+            (building / "meta.json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+            for name in ("ids.npy", "vectors.npy", "meta.json"):
+                cls._fsync(building / name)
+            os.replace(building, source_dir / version)
+        except BaseException:
+            shutil.rmtree(building, ignore_errors=True)
+            raise
+        cls.swap(source_type, version)
+        return version
+
+    @staticmethod
+    def _fsync(path: Path):
+        with open(path, "rb") as f:
+            os.fsync(f.fileno())
+
+    @classmethod
+    def swap(cls, source_type: str, version: str):
+        """
+        原子切换当前版本：写临时文件后 os.replace 覆盖 CURRENT，并清理多余的旧版本
+        """
+        source_dir = cls._source_dir(source_type)
+        if not (source_dir / version / "meta.json").exists():
+            raise FileNotFoundError(f"快照版本不存在: {source_type}/{version}")
+        pointer = source_dir / "CURRENT.tmp"
+        with open(pointer, "w", encoding="utf-8") as f:
+            f.write(version)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(pointer, source_dir / "CURRENT")
+        with cls._lock:
+            cls._opened.pop(source_type, None)
+
+        versions = sorted(path.name for path in source_dir.glob("v*") if path.is_dir())
+        for old in versions[:-cls.KEEP_VERSIONS]:
+            if old != version:
+                shutil.rmtree(source_dir / old, ignore_errors=True)
+        logger.info(f"向量快照 {source_type} 已切换到 {version}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="导出向量快照并原子切换")
+    parser.add_argument("--source", default="chat_message", help="来源类型 chat_message / role_setting")
+    parser.add_argument("--dtype", default="float32", choices=VectorSnapshot.DTYPES, help="矩阵精度，float16 文件与页缓存占用减半")
+    parser.add_argument("--batch-size", type=int, default=1000, help="每批读取的记录数")
+    args = parser.parse_args()
+
+    session = SessionLocal()
+    try:
+        print(VectorSnapshot.build(session, args.source, args.dtype, args.batch_size))
+    finally:
+        session.close()
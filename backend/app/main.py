@@ -1,8 +1,18 @@
 from fastapi import FastAPI
+import asyncio
+import logging
 from fastapi.middleware.cors import CORSMiddleware
 import json
 
-from app.api import role, session, message, user, database
+from app.api import role, session, message, user, database, audio
+from app.llm.audio_store import AudioStore
+from app.llm.tts_cache import tts_cache
+from app.services.conversation_cache import conversation_cache
+from app.services.role_catalog import role_catalog
+from app.services.prompt_engine import prompt_engine
+from app.db.async_session import STICKY_HEADER, ReplicaStickinessMiddleware, db_router
+from app.llm.ann_index import EmbeddingIndexRegistry
+from app.llm.clients import ProviderClients
 
 # 自定义JSON编码器，确保中文字符正确处理
 class CustomJSONResponse:
@@ -27,7 +37,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[STICKY_HEADER],
 )
+# 读写分离时按客户端最近写入时间把读请求留在主库
+app.add_middleware(ReplicaStickinessMiddleware)
 
 # 注册API路由
 app.include_router(database.router, prefix="/api/database", tags=["数据库管理"])
@@ -35,6 +48,30 @@ app.include_router(role.router, prefix="/api/roles", tags=["角色管理"])
 app.include_router(session.router, prefix="/api/sessions", tags=["会话管理"])
 app.include_router(message.router, prefix="/api/messages", tags=["消息管理"])
 app.include_router(user.router, prefix="/api/users", tags=["用户管理"])
+app.include_router(audio.router, prefix="/api/audio", tags=["音频"])
+
+logger = logging.getLogger(__name__)
+
+async def _audio_gc_loop():
+    """定期清理本地音频存储"""
+    while True:
+        try:
+            await asyncio.to_thread(AudioStore.gc)
+        except Exception as e:
+            logger.error(f"音频存储清理失败: {str(e)}")
+        await asyncio.sleep(AudioStore.GC_INTERVAL_SECONDS)
+
+@app.on_event("startup")
+async def start_background_tasks():
+    app.state.audio_gc_task = asyncio.create_task(_audio_gc_loop())
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    app.state.audio_gc_task.cancel()
+    # 保存已加载的向量索引快照，重启后直接恢复
+    await asyncio.to_thread(EmbeddingIndexRegistry.save_all)
+    await db_router.dispose()
+    await ProviderClients.aclose()
 
 @app.get("/")
 def read_root():
@@ -58,3 +95,17 @@ def health_check():
         "status": "healthy",
         "service": "ai-roleplay-api"
     }
+
+
+@app.get("/metrics")
+def metrics():
+    """
+    运行时缓存与数据库连接池指标
+    """
+    return {
+        "tts_cache": tts_cache.stats(),
+        "conversation_cache": conversation_cache.stats(),
+        "role_catalog": role_catalog.stats(),
+        "prompt_engine": prompt_engine.stats(),
+        "database": db_router.pool_stats()
+    }
@@ -1,9 +1,13 @@
-from sqlalchemy import JSON, TIMESTAMP, Column, Integer, String, Text, func
+from sqlalchemy import JSON, TIMESTAMP, Column, Index, Integer, String, Text, func
 from app.db.session import Base
 
 class ChatMessages(Base):
     # 聊天消息表
     __tablename__ = "chat_messages"
+    __table_args__ = (
+        # 按会话分页 / 取最近消息：WHERE session_id = ? ORDER BY created_at DESC
+        Index("ix_chat_messages_session_created", "session_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True, comment="消息id")
     session_id = Column(Integer, nullable=False, comment="会话id")
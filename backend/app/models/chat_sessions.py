@@ -1,12 +1,21 @@
-from sqlalchemy import TIMESTAMP, Column, Integer, func
+from sqlalchemy import TIMESTAMP, BigInteger, Column, Index, Integer, Text, func
 from app.db.session import Base
 
 class ChatSessions(Base):
     # 聊天会话表
     __tablename__ = "chat_sessions"
+    __table_args__ = (
+        # 按用户+角色查找会话；POST /sessions 允许同一角色建多个会话，因此不设唯一约束
+        Index("ix_chat_sessions_user_role", "user_id", "role_id"),
+        # 用户会话列表：WHERE user_id = ? ORDER BY created_at DESC
+        Index("ix_chat_sessions_user_created", "user_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True, comment="会话id")
     user_id = Column(Integer, nullable=False, comment="用户id")
     role_id = Column(Integer, nullable=False, comment="角色id")
     last_message_at = Column(TIMESTAMP, nullable=True, comment="最近一次对话时间")
+    summary = Column(Text, nullable=True, comment="早期对话的滚动摘要")
+    summary_message_id = Column(Integer, nullable=True, comment="摘要已覆盖到的最后一条消息id")
+    version = Column(BigInteger, nullable=True, comment="会话内容版本号，写入/删除消息或刷新摘要时更新")
     created_at = Column(TIMESTAMP,nullable=False,server_default=func.now(), comment="创建时间")
\ No newline at end of file
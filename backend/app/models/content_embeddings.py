@@ -0,0 +1,17 @@
+from sqlalchemy import TIMESTAMP, Column, Integer, LargeBinary, String, UniqueConstraint, func
+from app.db.session import Base
+
+class ContentEmbeddings(Base):
+    # 文本向量表（聊天消息 / 角色设定切片）
+    __tablename__ = "content_embeddings"
+    __table_args__ = (
+        UniqueConstraint("source_type", "source_id", "model", name="uq_content_embeddings_source_model"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True, comment="id")
+    source_type = Column(String(20), nullable=False, comment="来源类型 chat_message-聊天消息 role_setting-角色设定切片")
+    source_id = Column(Integer, nullable=False, comment="来源id, chat_messages.id 或 role_settings.id")
+    model = Column(String(50), nullable=False, comment="向量模型版本")
+    dim = Column(Integer, nullable=False, comment="向量维度")
+    vector = Column(LargeBinary, nullable=False, comment="float32 小端序向量字节")
+    created_at = Column(TIMESTAMP, nullable=False, server_default=func.now(), comment="创建时间")
@@ -0,0 +1,111 @@
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import threading
+import time
+
+_version_lock = threading.Lock()
+_last_version = 0
+
+
+def next_version() -> int:
+    """
+    生成会话内容版本号（微秒时间戳），同一进程内严格递增
+    写入消息、删除消息、刷新摘要时都要在同一事务里更新 ChatSessions.version
+    """
+    global _last_version
+    with _version_lock:
+        _last_version = max(time.time_ns() // 1000, _last_version + 1)
+        return _last_version
+
+
+class ConversationState:
+    """
+    一个会话的热状态：摘要未覆盖的历史消息行 [(提问, 回答)]，按时间正序
+    与缓存未命中时从数据库重建的内容完全一致；系统提示词、角色切片和摘要每轮按最新值拼装，不进入缓存
+    """
+
+    __slots__ = ("session_id", "version", "rows", "expires_at")
+
+    def __init__(
+        self,
+        session_id: int,
+        version: int,
+        rows: List[Tuple[str, str]],
+        expires_at: float
+    ):
+        self.session_id = session_id
+        self.version = version
+        self.rows = rows
+        self.expires_at = expires_at
+
+
+class ConversationCache:
+    """
+    进程内会话状态缓存（LRU + TTL）
+
+    以 ChatSessions.version 作为版本号：任何进程写入/删除消息或刷新摘要时都会更新版本，
+    本进程的缓存随之失效，因此多 worker 部署下也不会读到过期的上下文
+    """
+
+    def __init__(self, max_sessions: int = 1024, ttl: float = 1800):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, session_id: int, version: int) -> Optional[ConversationState]:
+        with self._lock:
+            state = self._states.get(session_id)
+            if state is None or state.expires_at < time.monotonic() or state.version != version:
+                if state is not None:
+                    del self._states[session_id]
+                self.misses += 1
+                return None
+            self._states.move_to_end(session_id)
+            self.hits += 1
+            return state
+
+    def peek(self, session_id: int) -> Optional[ConversationState]:
+        """不校验版本、不计入命中统计，供写入后在旧状态基础上追加新消息"""
+        with self._lock:
+            state = self._states.get(session_id)
+            if state is None or state.expires_at < time.monotonic():
+                return None
+            return state
+
+    def put(self, session_id: int, version: int, rows: List[Tuple[str, str]]):
+        state = ConversationState(
+            session_id=session_id,
+            version=version,
+            rows=list(rows),
+            expires_at=time.monotonic() + self.ttl
+        )
+        with self._lock:
+            self._states[session_id] = state
+            self._states.move_to_end(session_id)
+            while len(self._states) > self.max_sessions:
+                self._states.popitem(last=False)
+
+    def invalidate(self, session_id: int):
+        with self._lock:
+            self._states.pop(session_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._states.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "sessions": len(self._states),
+                "max_sessions": self.max_sessions,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0
+            }
+
+
+conversation_cache = ConversationCache()
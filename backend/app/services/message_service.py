@@ -1,17 +1,33 @@
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
 from fastapi import HTTPException, status
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, AsyncIterator, Tuple
+from collections import OrderedDict
 from datetime import datetime
+from sqlalchemy import Select, Update, and_, func, or_, select, update
+import base64
 import logging
 import asyncio
+import json
+import threading
 
+from app.db.async_session import AsyncSessionLocal, mark_written, use_replica
 from app.models.chat_messages import ChatMessages
 from app.models.chat_sessions import ChatSessions
+from app.models.role import Role
 from app.schemas.message import MessageCreate, MessageResponse
-from app.llm.llm_api import LLM
-from app.llm.tts_api import TTS
-from app.llm.prompt import Prompt
+from app.llm.llm_api import LLM, AsyncLLM
+from app.llm.tts_api import TTS, AsyncTTS
+from app.llm.sentence_splitter import SentenceSplitter
+from app.llm.context_builder import ContextBuilder
+from app.llm.role_lore import RoleLore
+from app.services.summary_service import SummaryService
+from app.services.conversation_cache import conversation_cache, next_version
+from app.services.prompt_engine import CompiledPrompt, prompt_engine
+from app.llm.embedding_store import EmbeddingStore
+from app.llm.ann_index import EmbeddingIndexRegistry
+from app.llm.lexical_index import LexicalIndexRegistry
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -19,15 +35,73 @@ logger = logging.getLogger(__name__)
 class MessageService:
     """消息服务类"""
     
+    # LLM 消息条数上限：系统提示词 + 摘要未覆盖的历史 + 本轮问答，更早的内容由摘要和 token 预算控制
+    MAX_TURNS = SummaryService.MAX_CONTEXT_MESSAGES + 3
+    
+    # 游标分页的会话消息总数缓存 {session_id: (version, total)}，任何进程写入或删除消息后版本变化即失效
+    MAX_CACHED_TOTALS = 4096
+    _total_counts = OrderedDict()
+    _total_counts_lock = threading.Lock()
+    
+    @staticmethod
+    def _now() -> datetime:
+        """
+        消息时间统一由应用生成（created_at / response_at / last_message_at），不混用数据库的 NOW()
+        MySQL TIMESTAMP 只精确到秒，提前截断，保证返回值与库中一致；同一秒内的先后顺序由 id 决定
+        """
+        return datetime.now().replace(microsecond=0)
+    
+    # 以下查询构建方法由同步与异步两个服务共用，保证两边的过滤、排序和权限校验一致
+    
+    @staticmethod
+    def _session_statement(user_id: int, session_id: int) -> Select:
+        """用户自己的会话，同时完成权限校验"""
+        return select(ChatSessions).where(ChatSessions.id == session_id, ChatSessions.user_id == user_id)
+    
+    @staticmethod
+    def _message_statement(user_id: int, message_id: int) -> Select:
+        """用户会话中的消息，同时完成权限校验"""
+        return (
+            select(ChatMessages)
+            .join(ChatSessions, ChatSessions.id == ChatMessages.session_id)
+            .where(ChatMessages.id == message_id, ChatSessions.user_id == user_id)
+        )
+    
+    @staticmethod
+    def _touch_session_statement(user_id: int, session_id: int, now: datetime, version: int) -> Update:
+        """写入消息时更新会话最后消息时间与内容版本，带 user_id 条件同时完成权限校验"""
+        return (
+            update(ChatSessions)
+            .where(ChatSessions.id == session_id, ChatSessions.user_id == user_id)
+            .values(last_message_at=now, version=version)
+        )
+    
+    @staticmethod
+    def _bump_version_statement(session_id: int) -> Update:
+        """删除消息时更新会话内容版本，需与删除在同一事务中执行"""
+        return update(ChatSessions).where(ChatSessions.id == session_id).values(version=next_version())
+    
+    @staticmethod
+    def _count_statement(session_id: int) -> Select:
+        return select(func.count(ChatMessages.id)).where(ChatMessages.session_id == session_id)
+    
+    @staticmethod
+    def _page_statement(session_id: int, page: int, page_size: int) -> Select:
+        """按页码分页，按时间倒序（最新的在前），同一秒内按 id 区分先后"""
+        return (
+            select(ChatMessages)
+            .where(ChatMessages.session_id == session_id)
+            .order_by(ChatMessages.created_at.desc(), ChatMessages.id.desc())
+            .offset((page - 1) * page_size)
+            .limit(page_size)
+        )
+    
     @staticmethod
     def create_message(db: Session, user_id: int, message_data: MessageCreate) -> MessageResponse:
         """创建新消息"""
         try:
             # 验证会话是否存在且用户有权限访问
-            session = db.query(ChatSessions).filter(
-                ChatSessions.id == message_data.session_id,
-                ChatSessions.user_id == user_id
-            ).first()
+            session = db.execute(MessageService._session_statement(user_id, message_data.session_id)).scalars().first()
             
             if not session:
                 logger.warning(f"用户 {user_id} 尝试在不存在或无权限的会话 {message_data.session_id} 中创建消息")
@@ -36,31 +110,18 @@ class MessageService:
                     detail="会话不存在或您没有权限访问"
                 )
             
-            # 根据角色创建消息
-            if message_data.role == 1:  # 用户消息
-                db_message = ChatMessages(
-                    session_id=message_data.session_id,
-                    query_content=message_data.content,
-                    answer_content="",  # 用户消息时答案为空
-                    message_type=message_data.message_type,
-                    message_metadata=message_data.metadata or {}
-                )
-            else:  # 助手消息 (role == 0)
-                db_message = ChatMessages(
-                    session_id=message_data.session_id,
-                    query_content="",  # 助手消息时问题为空
-                    answer_content=message_data.content,
-                    message_type=message_data.message_type,
-                    message_metadata=message_data.metadata or {}
-                )
-            
+            now = MessageService._now()
+            db_message = MessageService._new_message(message_data, now)
             db.add(db_message)
+            # 消息与会话最后消息时间、内容版本在同一事务中提交
+            session.last_message_at = now
+            session.version = next_version()
             db.commit()
             db.refresh(db_message)
             
-            # 更新会话的最后消息时间
-            session.last_message_at = db_message.created_at
-            db.commit()
+            # 用户消息在后台向量化并持久保存，供RAG检索复用
+            if message_data.role == 1 and message_data.content:
+                EmbeddingStore.schedule_message(db_message.id, message_data.content)
             
             logger.info(f"用户 {user_id} 在会话 {message_data.session_id} 中成功创建消息 {db_message.id}")
             
@@ -91,6 +152,113 @@ class MessageService:
                 detail="创建消息失败"
             )
     
+    @staticmethod
+    def _new_message(message_data: MessageCreate, created_at: datetime) -> ChatMessages:
+        """构建单条消息：用户消息（role == 1）只有提问，助手消息（role == 0）只有回答"""
+        is_user = message_data.role == 1
+        return ChatMessages(
+            session_id=message_data.session_id,
+            query_content=message_data.content if is_user else "",
+            answer_content="" if is_user else message_data.content,
+            message_type=message_data.message_type,
+            message_metadata=message_data.metadata or {},
+            created_at=created_at,
+            response_at=created_at
+        )
+    
+    @staticmethod
+    def _new_turn(
+        session_id: int,
+        user_content: str,
+        assistant_content: str,
+        user_metadata: Optional[Dict[str, Any]],
+        assistant_metadata: Optional[Dict[str, Any]],
+        message_type: str,
+        created_at: datetime
+    ) -> Tuple[ChatMessages, ChatMessages]:
+        """构建一轮对话的用户消息和助手消息"""
+        user_msg = ChatMessages(
+            session_id=session_id,
+            query_content=user_content,
+            answer_content="",
+            message_type=message_type,
+            message_metadata=user_metadata or {},
+            created_at=created_at,
+            response_at=created_at
+        )
+        assistant_msg = ChatMessages(
+            session_id=session_id,
+            query_content="",
+            answer_content=assistant_content,
+            message_type=message_type,
+            message_metadata=assistant_metadata or {},
+            created_at=created_at,
+            response_at=created_at
+        )
+        return user_msg, assistant_msg
+    
+    @staticmethod
+    def save_turn(
+        db: Session,
+        user_id: int,
+        session_id: int,
+        user_content: str,
+        assistant_content: str,
+        user_metadata: Optional[Dict[str, Any]] = None,
+        assistant_metadata: Optional[Dict[str, Any]] = None,
+        message_type: str = "text"
+    ) -> Dict[str, Any]:
+        """
+        在一个事务内保存一轮对话（用户消息 + 助手消息）并更新会话最后消息时间与内容版本
+        带 user_id 条件的 UPDATE 同时完成权限校验，整轮只提交一次
+        返回 {"user_message_id", "assistant_message_id", "last_message_at", "version"}
+        """
+        try:
+            now = MessageService._now()
+            version = next_version()
+            updated = db.execute(MessageService._touch_session_statement(user_id, session_id, now, version)).rowcount
+
+            if not updated:
+                db.rollback()
+                logger.warning(f"用户 {user_id} 尝试在不存在或无权限的会话 {session_id} 中保存对话")
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="会话不存在或您没有权限访问"
+                )
+
+            user_msg, assistant_msg = MessageService._new_turn(
+                session_id, user_content, assistant_content, user_metadata, assistant_metadata, message_type, now
+            )
+            db.add_all([user_msg, assistant_msg])
+            db.flush()
+            # 提交后对象会过期，先取出自增id，避免再次查询
+            saved = {
+                "user_message_id": user_msg.id,
+                "assistant_message_id": assistant_msg.id,
+                "last_message_at": now,
+                "version": version
+            }
+            db.commit()
+
+            if user_content:
+                EmbeddingStore.schedule_message(saved["user_message_id"], user_content)
+
+            logger.info(
+                f"用户 {user_id} 在会话 {session_id} 中保存对话: "
+                f"{saved['user_message_id']}, {saved['assistant_message_id']}"
+            )
+            return saved
+
+        except HTTPException:
+            raise
+        except SQLAlchemyError as e:
+            db.rollback()
+            logger.error(f"保存对话时数据库错误: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="保存对话失败"
+            )
+
     @staticmethod
     def get_messages_by_session(
         db: Session, 
@@ -102,10 +270,7 @@ class MessageService:
         """获取会话的消息列表（分页）"""
         try:
             # 验证会话是否存在且用户有权限访问
-            session = db.query(ChatSessions).filter(
-                ChatSessions.id == session_id,
-                ChatSessions.user_id == user_id
-            ).first()
+            session = db.execute(MessageService._session_statement(user_id, session_id)).scalars().first()
             
             if not session:
                 logger.warning(f"用户 {user_id} 尝试访问不存在或无权限的会话 {session_id}")
@@ -114,39 +279,14 @@ class MessageService:
                     detail="会话不存在或您没有权限访问"
                 )
             
-            # 计算偏移量
-            offset = (page - 1) * page_size
-            
             # 获取消息总数
-            total_count = db.query(ChatMessages).filter(
-                ChatMessages.session_id == session_id
-            ).count()
+            total_count = MessageService._get_total_count(db, session)
             
             # 获取分页消息（按时间倒序，最新的在前）
-            messages = db.query(ChatMessages).filter(
-                ChatMessages.session_id == session_id
-            ).order_by(ChatMessages.created_at.desc()).offset(offset).limit(page_size).all()
+            messages = db.execute(MessageService._page_statement(session_id, page, page_size)).scalars()
             
             # 转换为响应格式
-            message_responses = []
-            for msg in messages:
-                # 根据内容判断角色和获取内容
-                if msg.query_content:
-                    role = 1  # 用户消息
-                    content = msg.query_content
-                else:
-                    role = 0  # 助手消息
-                    content = msg.answer_content
-                
-                message_responses.append(MessageResponse(
-                    id=msg.id,
-                    session_id=msg.session_id,
-                    role=role,
-                    content=content,
-                    message_type=msg.message_type,
-                    metadata=msg.message_metadata or {},
-                    created_at=msg.created_at
-                ))
+            message_responses = [MessageService._message_to_response(msg) for msg in messages]
             
             # 计算分页信息
             total_pages = (total_count + page_size - 1) // page_size
@@ -182,15 +322,167 @@ class MessageService:
                 detail="获取消息列表失败"
             )
     
+    @staticmethod
+    def _encode_cursor(msg: ChatMessages) -> str:
+        raw = f"{msg.created_at.isoformat()}|{msg.id}"
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+    
+    @staticmethod
+    def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+            created_at, message_id = raw.rsplit("|", 1)
+            return datetime.fromisoformat(created_at), int(message_id)
+        except (ValueError, UnicodeDecodeError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="无效的分页游标"
+            )
+    
+    @staticmethod
+    def _message_to_response(msg: ChatMessages) -> MessageResponse:
+        # 根据内容判断角色和获取内容
+        if msg.query_content:
+            role, content = 1, msg.query_content  # 用户消息
+        else:
+            role, content = 0, msg.answer_content  # 助手消息
+        return MessageResponse(
+            id=msg.id,
+            session_id=msg.session_id,
+            role=role,
+            content=content,
+            message_type=msg.message_type,
+            metadata=msg.message_metadata or {},
+            created_at=msg.created_at
+        )
+    
+    @staticmethod
+    def _cached_total(session: ChatSessions) -> Optional[int]:
+        """会话消息总数缓存，按会话版本号校验，避免每次翻页都 COUNT 整个会话"""
+        with MessageService._total_counts_lock:
+            cached = MessageService._total_counts.get(session.id)
+            if cached and cached[0] == (session.version or 0):
+                MessageService._total_counts.move_to_end(session.id)
+                return cached[1]
+        return None
+    
+    @staticmethod
+    def _remember_total(session: ChatSessions, total: int):
+        with MessageService._total_counts_lock:
+            MessageService._total_counts[session.id] = (session.version or 0, total)
+            MessageService._total_counts.move_to_end(session.id)
+            while len(MessageService._total_counts) > MessageService.MAX_CACHED_TOTALS:
+                MessageService._total_counts.popitem(last=False)
+    
+    @staticmethod
+    def _forget_session(session_id: int):
+        """会话消息被删除后立即清理本进程的缓存（其他进程依靠版本号失效）"""
+        conversation_cache.invalidate(session_id)
+        with MessageService._total_counts_lock:
+            MessageService._total_counts.pop(session_id, None)
+    
+    @staticmethod
+    def _get_total_count(db: Session, session: ChatSessions) -> int:
+        total = MessageService._cached_total(session)
+        if total is None:
+            total = db.execute(MessageService._count_statement(session.id)).scalar_one()
+            MessageService._remember_total(session, total)
+        return total
+    
+    @staticmethod
+    def _cursor_statement(session_id: int, cursor: Optional[str], direction: str, page_size: int) -> Select:
+        """构建游标分页查询，多取一条用于判断是否还有更多"""
+        stmt = select(ChatMessages).where(ChatMessages.session_id == session_id)
+        if cursor:
+            cursor_time, cursor_id = MessageService._decode_cursor(cursor)
+            # 先用 created_at 的范围条件走 (session_id, created_at) 索引，再按 id 排除同一时刻的已读消息
+            if direction == "after":
+                stmt = stmt.where(and_(
+                    ChatMessages.created_at >= cursor_time,
+                    or_(ChatMessages.created_at > cursor_time, ChatMessages.id > cursor_id)
+                ))
+            else:
+                stmt = stmt.where(and_(
+                    ChatMessages.created_at <= cursor_time,
+                    or_(ChatMessages.created_at < cursor_time, ChatMessages.id < cursor_id)
+                ))
+        
+        if direction == "after":
+            order = (ChatMessages.created_at.asc(), ChatMessages.id.asc())
+        else:
+            order = (ChatMessages.created_at.desc(), ChatMessages.id.desc())
+        return stmt.order_by(*order).limit(page_size + 1)
+    
+    @staticmethod
+    def _cursor_page(messages: List[ChatMessages], cursor: Optional[str], direction: str, page_size: int) -> Dict[str, Any]:
+        """将游标查询结果整理为响应格式（始终按时间倒序）"""
+        has_more = len(messages) > page_size
+        messages = messages[:page_size]
+        if direction == "after":
+            messages.reverse()
+        
+        return {
+            "messages": [MessageService._message_to_response(msg) for msg in messages],
+            "pagination": {
+                "page_size": page_size,
+                "direction": direction,
+                "has_more": has_more,
+                # 最早一条的游标，用于继续向前翻（direction=before）
+                "before_cursor": MessageService._encode_cursor(messages[-1]) if messages else None,
+                # 最新一条的游标，用于拉取新消息（direction=after）
+                "after_cursor": MessageService._encode_cursor(messages[0]) if messages else cursor
+            }
+        }
+    
+    @staticmethod
+    def get_messages_by_cursor(
+        db: Session,
+        user_id: int,
+        session_id: int,
+        cursor: Optional[str] = None,
+        direction: str = "before",
+        page_size: int = 50,
+        with_total: bool = False
+    ) -> Dict[str, Any]:
+        """
+        基于 (created_at, id) 游标获取会话消息，翻到任意位置的开销都与第一页相同
+        direction=before 取游标之前（更早）的消息，after 取游标之后（更新）的消息；
+        不传游标时返回最新的一页。结果始终按时间倒序（最新的在前）
+        """
+        try:
+            # 验证会话是否存在且用户有权限访问
+            session = db.execute(MessageService._session_statement(user_id, session_id)).scalars().first()
+            
+            if not session:
+                logger.warning(f"用户 {user_id} 尝试访问不存在或无权限的会话 {session_id}")
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="会话不存在或您没有权限访问"
+                )
+            
+            stmt = MessageService._cursor_statement(session_id, cursor, direction, page_size)
+            result = MessageService._cursor_page(list(db.execute(stmt).scalars()), cursor, direction, page_size)
+            if with_total:
+                result["pagination"]["total_count"] = MessageService._get_total_count(db, session)
+            
+            logger.info(f"用户 {user_id} 按游标获取会话 {session_id} 的消息列表，方向 {direction}，共 {len(result['messages'])} 条")
+            return result
+            
+        except HTTPException:
+            raise
+        except SQLAlchemyError as e:
+            logger.error(f"获取消息列表时数据库错误: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="获取消息列表失败"
+            )
+    
     @staticmethod
     def get_message_by_id(db: Session, user_id: int, message_id: int) -> MessageResponse:
         """根据ID获取消息详情"""
         try:
             # 通过消息ID和用户权限查询消息
-            message = db.query(ChatMessages).join(ChatSessions).filter(
-                ChatMessages.id == message_id,
-                ChatSessions.user_id == user_id
-            ).first()
+            message = db.execute(MessageService._message_statement(user_id, message_id)).scalars().first()
             
             if not message:
                 logger.warning(f"用户 {user_id} 尝试访问不存在或无权限的消息 {message_id}")
@@ -199,25 +491,8 @@ class MessageService:
                     detail="消息不存在或您没有权限访问"
                 )
             
-            # 根据内容判断角色和获取内容
-            if message.query_content:
-                role = 1  # 用户消息
-                content = message.query_content
-            else:
-                role = 0  # 助手消息
-                content = message.answer_content
-            
             logger.info(f"用户 {user_id} 成功获取消息 {message_id}")
-            
-            return MessageResponse(
-                id=message.id,
-                session_id=message.session_id,
-                role=role,
-                content=content,
-                message_type=message.message_type,
-                metadata=message.message_metadata or {},
-                created_at=message.created_at
-            )
+            return MessageService._message_to_response(message)
             
         except HTTPException:
             raise
@@ -239,10 +514,7 @@ class MessageService:
         """删除消息"""
         try:
             # 通过消息ID和用户权限查询消息
-            message = db.query(ChatMessages).join(ChatSessions).filter(
-                ChatMessages.id == message_id,
-                ChatSessions.user_id == user_id
-            ).first()
+            message = db.execute(MessageService._message_statement(user_id, message_id)).scalars().first()
             
             if not message:
                 logger.warning(f"用户 {user_id} 尝试删除不存在或无权限的消息 {message_id}")
@@ -251,8 +523,15 @@ class MessageService:
                     detail="消息不存在或您没有权限删除"
                 )
             
+            session_id = message.session_id
             db.delete(message)
+            db.execute(EmbeddingStore.delete_statement(EmbeddingStore.CHAT_MESSAGE, [message_id]))
+            # 在同一事务中更新会话版本，其他进程的缓存随之失效
+            db.execute(MessageService._bump_version_statement(session_id))
             db.commit()
+            MessageService._forget_session(session_id)
+            EmbeddingIndexRegistry.remove(user_id, message_id)
+            LexicalIndexRegistry.remove(user_id, message_id)
             
             logger.info(f"用户 {user_id} 成功删除消息 {message_id}")
             return True
@@ -271,18 +550,15 @@ class MessageService:
     def process_chat_message(db: Session, user_id: int, session_id: int, query: str, role_name: str = "哈利波特") -> Dict[str, Any]:
         """
         完整的聊天消息处理流程
-        1. 保存用户消息
+        1. 获取历史消息
         2. 调用LLM生成回复
-        3. 保存助手回复
-        4. 调用TTS生成音频
+        3. 调用TTS生成音频
+        4. 在一个事务内保存用户消息和助手回复
         5. 返回完整结果
         """
         try:
             # 验证会话是否存在且用户有权限访问
-            session = db.query(ChatSessions).filter(
-                ChatSessions.id == session_id,
-                ChatSessions.user_id == user_id
-            ).first()
+            session = db.execute(MessageService._session_statement(user_id, session_id)).scalars().first()
             
             if not session:
                 logger.warning(f"用户 {user_id} 尝试在不存在或无权限的会话 {session_id} 中发送消息")
@@ -291,66 +567,64 @@ class MessageService:
                     detail="会话不存在或您没有权限访问"
                 )
             
-            # 1. 保存用户消息
-            user_message_data = MessageCreate(
-                session_id=session_id,
-                role=1,  # 用户消息
-                content=query,
-                message_type="text",
-                metadata={}
-            )
-            
-            user_message = MessageService.create_message(db, user_id, user_message_data)
-            logger.info(f"用户消息已保存: {user_message.id}")
+            # 使用会话关联角色编译好的提示词，而不是传入的角色名
+            prompt = prompt_engine.for_role(db, session.role_id)
+            if not prompt:
+                logger.warning(f"会话 {session_id} 关联的角色 {session.role_id} 不存在")
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="会话关联的角色不存在"
+                )
+            role_name = prompt.role_name
             
-            # 2. 获取历史消息用于上下文
-            history_messages = MessageService._get_recent_messages(db, session_id, limit=10)
+            # 1. 获取历史消息用于上下文
+            history_messages = MessageService._get_context_messages(db, session)
             
             # 3. 调用LLM生成回复
-            system_prompt = MessageService._get_system_prompt_by_role(role_name)
-            llm = LLM(role_name, system_prompt, max_turns=20)
+            llm = LLM(role_name, prompt.system_prompt, max_turns=MessageService.MAX_TURNS, max_context_tokens=ContextBuilder.DEFAULT_TOKEN_BUDGET)
             
-            # 添加历史消息到LLM上下文
-            MessageService._add_history_to_llm(llm, history_messages)
+            # 切片较多的角色按本轮提问检索相关切片，与历史消息一起按 token 预算放入LLM上下文
+            role_clips = RoleLore.retrieve(prompt.role_id, prompt.clip_ids, prompt.clips, query) if prompt.retrieve_clips else None
+            MessageService._add_history_to_llm(llm, MessageService._history_rows(history_messages), session.summary, prompt, role_clips)
             
             # 生成LLM回复
             llm_response = llm.generate_output(query)
             logger.info(f"LLM回复已生成，长度: {len(llm_response)}")
             
-            # 4. 调用TTS生成音频
+            # 3. 调用TTS生成音频
             tts = TTS(voice="Cherry", language="Chinese")
             audio_url = tts.generate_audio(llm_response)
             logger.info(f"TTS音频已生成: {audio_url}")
             
-            # 5. 保存助手回复（包含音频信息）
-            assistant_message_data = MessageCreate(
-                session_id=session_id,
-                role=0,  # 助手消息
-                content=llm_response,
-                message_type="text",
-                metadata={
+            # 4. 保存用户消息和助手回复（包含音频信息）
+            saved = MessageService.save_turn(
+                db,
+                user_id,
+                session_id,
+                user_content=query,
+                assistant_content=llm_response,
+                assistant_metadata={
                     "audio_url": audio_url,
                     "voice": "Cherry",
                     "language": "Chinese",
                     "role_name": role_name
                 }
             )
+            logger.info(f"对话已保存: {saved['user_message_id']}, {saved['assistant_message_id']}")
+            SummaryService.schedule_refresh(session_id, role_name)
             
-            assistant_message = MessageService.create_message(db, user_id, assistant_message_data)
-            logger.info(f"助手消息已保存: {assistant_message.id}")
-            
-            # 6. 返回完整结果
+            # 5. 返回完整结果
             return {
                 "user_message": {
-                    "id": user_message.id,
-                    "content": user_message.content,
-                    "created_at": user_message.created_at
+                    "id": saved["user_message_id"],
+                    "content": query,
+                    "created_at": saved["last_message_at"]
                 },
                 "assistant_message": {
-                    "id": assistant_message.id,
-                    "content": assistant_message.content,
+                    "id": saved["assistant_message_id"],
+                    "content": llm_response,
                     "audio_url": audio_url,
-                    "created_at": assistant_message.created_at
+                    "created_at": saved["last_message_at"]
                 },
                 "session_id": session_id
             }
@@ -366,94 +640,435 @@ class MessageService:
             )
     
     @staticmethod
-    def _get_recent_messages(db: Session, session_id: int, limit: int = 10) -> List[ChatMessages]:
-        """获取最近的消息用于上下文"""
-        return db.query(ChatMessages).filter(
-            ChatMessages.session_id == session_id
-        ).order_by(ChatMessages.created_at.desc()).limit(limit).all()
+    def _context_statement(session: ChatSessions) -> Select:
+        """
+        上下文历史查询：摘要尚未覆盖的消息（最新的在前）
+        从 summary_message_id 之后开始取，等待合并进摘要的消息也以原文进入上下文
+        """
+        return (
+            select(ChatMessages)
+            .where(ChatMessages.session_id == session.id, ChatMessages.id > (session.summary_message_id or 0))
+            .order_by(ChatMessages.created_at.desc(), ChatMessages.id.desc())
+            .limit(SummaryService.MAX_CONTEXT_MESSAGES)
+        )
     
     @staticmethod
-    def _get_system_prompt_by_role(role_name: str) -> str:
-        """根据角色名获取系统提示词"""
-        role_prompts = {
-            "哈利波特": Prompt.harry_potter,
-            "哈姆雷特": Prompt.Hamlet,
-            "苏格拉底": Prompt.Socrates
-        }
-        # 如果找不到对应的角色提示词，使用哈利波特作为默认值
-        prompt = role_prompts.get(role_name, Prompt.harry_potter)
-        logger.info(f"为角色 '{role_name}' 获取系统提示词，使用: {list(role_prompts.keys())[list(role_prompts.values()).index(prompt)] if prompt in role_prompts.values() else '默认(哈利波特)'}")
-        return prompt
+    def _get_context_messages(db: Session, session: ChatSessions) -> List[ChatMessages]:
+        """获取摘要未覆盖的历史消息用于上下文"""
+        return list(db.execute(MessageService._context_statement(session)).scalars())
+    
+    @staticmethod
+    def _history_rows(history_messages: List[ChatMessages]) -> List[Tuple[str, str]]:
+        """将最新在前的历史消息转换为按时间正序的 [(提问, 回答)]，即会话状态缓存保存的内容"""
+        return [(msg.query_content, msg.answer_content) for msg in reversed(history_messages)]
     
     @staticmethod
-    def _add_history_to_llm(llm: LLM, history_messages: List[ChatMessages]):
-        """将历史消息添加到LLM的上下文中"""
-        # 按时间正序排列历史消息
-        history_messages.reverse()
+    def _add_history_to_llm(
+        llm: LLM,
+        rows: List[Tuple[str, str]],
+        summary: Optional[str] = None,
+        prompt: Optional[CompiledPrompt] = None,
+        role_clips: Optional[List[str]] = None
+    ):
+        """
+        将历史消息按 token 预算添加到LLM的上下文中，超出预算时丢弃最早的对话
+        更早的对话以会话摘要的形式放入系统提示词，角色设定切片按剩余预算放入
+        :param rows: 按时间正序的 [(提问, 回答)]
+        :param role_clips: 按本轮提问检索到的角色设定切片（按相关度降序），切片较多的角色使用
+        """
+        history = []
+        for query_content, answer_content in rows:
+            if query_content:  # 用户消息
+                history.append({"role": "user", "content": query_content})
+            if answer_content:  # 助手消息
+                history.append({"role": "assistant", "content": answer_content})
         
-        for msg in history_messages:
-            if msg.query_content:  # 用户消息
-                llm.message.append({"role": "user", "content": msg.query_content})
-            if msg.answer_content:  # 助手消息
-                llm.message.append({"role": "assistant", "content": msg.answer_content})
+        if prompt is not None:
+            builder = ContextBuilder(prompt.system_prompt, token_budget=llm.max_context_tokens, system_tokens=prompt.system_tokens)
+            # 切片较多的角色不放全部切片，改为放入按本轮提问检索到的切片
+            if not prompt.retrieve_clips:
+                builder.add_role_clips(prompt.clips, prompt.clip_tokens)
+            elif role_clips:
+                builder.add_role_clips(role_clips)
+        else:
+            builder = ContextBuilder(llm.system_prompt, token_budget=llm.max_context_tokens)
+        llm.message = builder.set_summary(summary).add_history(history).build()
+
+
+class AsyncMessageService:
+    """
+    消息服务类（异步版本）
+    基于 AsyncSession，供 async 路由使用，数据库 I/O 不阻塞事件循环
+    """
+    
+    @staticmethod
+    async def _get_user_session(db: AsyncSession, user_id: int, session_id: int) -> Optional[ChatSessions]:
+        result = await db.execute(MessageService._session_statement(user_id, session_id))
+        return result.scalars().first()
+    
+    @staticmethod
+    async def _get_user_message(db: AsyncSession, user_id: int, message_id: int) -> Optional[ChatMessages]:
+        result = await db.execute(MessageService._message_statement(user_id, message_id))
+        return result.scalars().first()
     
     @staticmethod
-    async def process_voice_message(db: Session, user_id: int, session_id: int, user_text: str, role_name: str = "哈利波特") -> Dict[str, Any]:
+    async def _get_total_count(db: AsyncSession, session: ChatSessions) -> int:
+        total = MessageService._cached_total(session)
+        if total is None:
+            total = (await db.execute(MessageService._count_statement(session.id))).scalar_one()
+            MessageService._remember_total(session, total)
+        return total
+    
+    @staticmethod
+    async def create_message(db: AsyncSession, user_id: int, message_data: MessageCreate) -> MessageResponse:
+        """创建新消息"""
+        try:
+            # 验证会话是否存在且用户有权限访问
+            session = await AsyncMessageService._get_user_session(db, user_id, message_data.session_id)
+            if not session:
+                logger.warning(f"用户 {user_id} 尝试在不存在或无权限的会话 {message_data.session_id} 中创建消息")
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="会话不存在或您没有权限访问"
+                )
+            
+            now = MessageService._now()
+            db_message = MessageService._new_message(message_data, now)
+            db.add(db_message)
+            # 消息与会话最后消息时间、内容版本在同一事务中提交
+            session.last_message_at = now
+            session.version = next_version()
+            await db.commit()
+            mark_written()
+            
+            # 用户消息在后台向量化并持久保存，供RAG检索复用
+            if message_data.role == 1 and message_data.content:
+                EmbeddingStore.schedule_message(db_message.id, message_data.content)
+            
+            logger.info(f"用户 {user_id} 在会话 {message_data.session_id} 中成功创建消息 {db_message.id}")
+            
+            return MessageResponse(
+                id=db_message.id,
+                session_id=db_message.session_id,
+                role=message_data.role,
+                content=message_data.content,
+                message_type=db_message.message_type,
+                metadata=db_message.message_metadata,
+                created_at=db_message.created_at
+            )
+            
+        except HTTPException:
+            raise
+        except SQLAlchemyError as e:
+            await db.rollback()
+            logger.error(f"创建消息时数据库错误: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="创建消息失败"
+            )
+    
+    @staticmethod
+    async def save_turn(
+        db: AsyncSession,
+        user_id: int,
+        session_id: int,
+        user_content: str,
+        assistant_content: str,
+        user_metadata: Optional[Dict[str, Any]] = None,
+        assistant_metadata: Optional[Dict[str, Any]] = None,
+        message_type: str = "text",
+        expected_version: Optional[int] = None
+    ) -> Dict[str, Any]:
         """
-        处理语音对话消息的异步方法
-        1. 接收用户语音转写文本
-        2. 调用LLM生成AI回复
-        3. 使用TTS生成语音文件
-        4. 保存对话记录到数据库
-        5. 返回音频URL和AI文本
+        在一个事务内保存一轮对话，语义同 MessageService.save_turn
+        传入 expected_version 时先按版本条件更新：成功说明写入前会话内容与调用方持有的版本一致，
+        调用方可以在该版本的缓存上直接追加本轮对话
+        返回 {"user_message_id", "assistant_message_id", "last_message_at", "version", "continued"}
         """
         try:
-            # 验证会话是否存在且用户有权限访问，同时获取角色信息
-            session = db.query(ChatSessions).filter(
-                ChatSessions.id == session_id,
-                ChatSessions.user_id == user_id
-            ).first()
+            now = MessageService._now()
+            version = next_version()
+            stmt = MessageService._touch_session_statement(user_id, session_id, now, version)
+            continued = False
+            if expected_version is not None:
+                result = await db.execute(stmt.where(func.coalesce(ChatSessions.version, 0) == expected_version))
+                continued = bool(result.rowcount)
+            if not continued:
+                result = await db.execute(stmt)
             
+            if not result.rowcount:
+                await db.rollback()
+                logger.warning(f"用户 {user_id} 尝试在不存在或无权限的会话 {session_id} 中保存对话")
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="会话不存在或您没有权限访问"
+                )
+            
+            user_msg, assistant_msg = MessageService._new_turn(
+                session_id, user_content, assistant_content, user_metadata, assistant_metadata, message_type, now
+            )
+            db.add_all([user_msg, assistant_msg])
+            await db.commit()
+            mark_written()
+            saved = {
+                "user_message_id": user_msg.id,
+                "assistant_message_id": assistant_msg.id,
+                "last_message_at": now,
+                "version": version,
+                "continued": continued
+            }
+            
+            if user_content:
+                EmbeddingStore.schedule_message(saved["user_message_id"], user_content)
+            
+            logger.info(
+                f"用户 {user_id} 在会话 {session_id} 中保存对话: "
+                f"{saved['user_message_id']}, {saved['assistant_message_id']}"
+            )
+            return saved
+            
+        except HTTPException:
+            raise
+        except SQLAlchemyError as e:
+            await db.rollback()
+            logger.error(f"保存对话时数据库错误: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="保存对话失败"
+            )
+    
+    @staticmethod
+    async def get_messages_by_session(
+        db: AsyncSession,
+        user_id: int,
+        session_id: int,
+        page: int = 1,
+        page_size: int = 50
+    ) -> Dict[str, Any]:
+        """获取会话的消息列表（分页）"""
+        try:
+            use_replica(db)
+            session = await AsyncMessageService._get_user_session(db, user_id, session_id)
             if not session:
-                logger.warning(f"用户 {user_id} 尝试在不存在或无权限的会话 {session_id} 中发送语音消息")
+                logger.warning(f"用户 {user_id} 尝试访问不存在或无权限的会话 {session_id}")
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail="会话不存在或您没有权限访问"
                 )
             
-            # 从会话中获取角色信息
-            from app.models.role import Role
-            role = db.query(Role).filter(Role.id == session.role_id).first()
-            if not role:
-                logger.warning(f"会话 {session_id} 关联的角色 {session.role_id} 不存在")
+            total_count = await AsyncMessageService._get_total_count(db, session)
+            
+            # 获取分页消息（按时间倒序，最新的在前）
+            result = await db.execute(MessageService._page_statement(session_id, page, page_size))
+            message_responses = [MessageService._message_to_response(msg) for msg in result.scalars()]
+            
+            total_pages = (total_count + page_size - 1) // page_size
+            logger.info(f"用户 {user_id} 获取会话 {session_id} 的消息列表，页码 {page}，共 {len(message_responses)} 条")
+            
+            return {
+                "messages": message_responses,
+                "pagination": {
+                    "page": page,
+                    "page_size": page_size,
+                    "total_count": total_count,
+                    "total_pages": total_pages,
+                    "has_next": page < total_pages,
+                    "has_prev": page > 1
+                }
+            }
+            
+        except HTTPException:
+            raise
+        except SQLAlchemyError as e:
+            logger.error(f"获取消息列表时数据库错误: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="获取消息列表失败"
+            )
+    
+    @staticmethod
+    async def get_messages_by_cursor(
+        db: AsyncSession,
+        user_id: int,
+        session_id: int,
+        cursor: Optional[str] = None,
+        direction: str = "before",
+        page_size: int = 50,
+        with_total: bool = False
+    ) -> Dict[str, Any]:
+        """基于 (created_at, id) 游标获取会话消息，语义同 MessageService.get_messages_by_cursor"""
+        try:
+            use_replica(db)
+            session = await AsyncMessageService._get_user_session(db, user_id, session_id)
+            if not session:
+                logger.warning(f"用户 {user_id} 尝试访问不存在或无权限的会话 {session_id}")
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
-                    detail="会话关联的角色不存在"
+                    detail="会话不存在或您没有权限访问"
+                )
+            
+            stmt = MessageService._cursor_statement(session_id, cursor, direction, page_size)
+            messages = list((await db.execute(stmt)).scalars())
+            result = MessageService._cursor_page(messages, cursor, direction, page_size)
+            if with_total:
+                result["pagination"]["total_count"] = await AsyncMessageService._get_total_count(db, session)
+            
+            logger.info(f"用户 {user_id} 按游标获取会话 {session_id} 的消息列表，方向 {direction}，共 {len(result['messages'])} 条")
+            return result
+            
+        except HTTPException:
+            raise
+        except SQLAlchemyError as e:
+            logger.error(f"获取消息列表时数据库错误: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="获取消息列表失败"
+            )
+    
+    @staticmethod
+    async def get_message_by_id(db: AsyncSession, user_id: int, message_id: int) -> MessageResponse:
+        """根据ID获取消息详情"""
+        try:
+            use_replica(db)
+            message = await AsyncMessageService._get_user_message(db, user_id, message_id)
+            if not message:
+                logger.warning(f"用户 {user_id} 尝试访问不存在或无权限的消息 {message_id}")
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="消息不存在或您没有权限访问"
+                )
+            
+            logger.info(f"用户 {user_id} 成功获取消息 {message_id}")
+            return MessageService._message_to_response(message)
+            
+        except HTTPException:
+            raise
+        except SQLAlchemyError as e:
+            logger.error(f"获取消息详情时数据库错误: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="获取消息详情失败"
+            )
+    
+    @staticmethod
+    async def delete_message(db: AsyncSession, user_id: int, message_id: int) -> bool:
+        """删除消息"""
+        try:
+            message = await AsyncMessageService._get_user_message(db, user_id, message_id)
+            if not message:
+                logger.warning(f"用户 {user_id} 尝试删除不存在或无权限的消息 {message_id}")
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="消息不存在或您没有权限删除"
                 )
             
-            # 使用会话中的角色名称，而不是传入的参数
-            actual_role_name = role.name
-            logger.info(f"使用会话中的角色: {actual_role_name} (角色ID: {role.id})")
+            session_id = message.session_id
+            await db.delete(message)
+            await db.execute(EmbeddingStore.delete_statement(EmbeddingStore.CHAT_MESSAGE, [message_id]))
+            # 在同一事务中更新会话版本，其他进程的缓存随之失效
+            await db.execute(MessageService._bump_version_statement(session_id))
+            await db.commit()
+            mark_written()
+            MessageService._forget_session(session_id)
+            # 向量索引可能需要从磁盘快照加载，放到线程中执行
+            await asyncio.to_thread(EmbeddingIndexRegistry.remove, user_id, message_id)
+            LexicalIndexRegistry.remove(user_id, message_id)
             
-            # 获取历史消息用于上下文
-            history_messages = MessageService._get_recent_messages(db, session_id, limit=10)
+            logger.info(f"用户 {user_id} 成功删除消息 {message_id}")
+            return True
             
-            # 初始化LLM并添加历史上下文，使用实际的角色名称
-            system_prompt = MessageService._get_system_prompt_by_role(actual_role_name)
-            llm = LLM(actual_role_name, system_prompt, max_turns=20)
-            MessageService._add_history_to_llm(llm, history_messages)
+        except HTTPException:
+            raise
+        except SQLAlchemyError as e:
+            await db.rollback()
+            logger.error(f"删除消息时数据库错误: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="删除消息失败"
+            )
+    
+    @staticmethod
+    async def _get_context_messages(db: AsyncSession, session: ChatSessions) -> List[ChatMessages]:
+        """获取摘要未覆盖的历史消息用于上下文"""
+        result = await db.execute(MessageService._context_statement(session))
+        return list(result.scalars())
+    
+    @staticmethod
+    async def prepare_voice_llm(db: AsyncSession, user_id: int, session_id: int, query: Optional[str] = None) -> Tuple[AsyncLLM, str]:
+        """
+        校验会话权限，并根据会话角色和历史消息构建LLM上下文
+        传入本轮提问时，为设定切片较多的角色检索相关切片
+        返回 (llm, 实际角色名)
+        """
+        # 验证会话是否存在且用户有权限访问，同时获取角色信息
+        session = await AsyncMessageService._get_user_session(db, user_id, session_id)
+        if not session:
+            logger.warning(f"用户 {user_id} 尝试在不存在或无权限的会话 {session_id} 中发送语音消息")
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="会话不存在或您没有权限访问"
+            )
+        
+        # 从角色目录获取会话角色编译好的提示词（缓存命中时只是字典查找）
+        prompt = await prompt_engine.afor_role(db, session.role_id)
+        if not prompt:
+            logger.warning(f"会话 {session_id} 关联的角色 {session.role_id} 不存在")
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="会话关联的角色不存在"
+            )
+        
+        # 使用会话中的角色名称，而不是传入的参数
+        actual_role_name = prompt.role_name
+        logger.info(f"使用会话中的角色: {actual_role_name} (角色ID: {prompt.role_id})")
+        
+        # 会话版本未变化时复用缓存的历史消息，跳过历史消息查询；提示词和摘要每轮按最新值拼装
+        version = session.version or 0
+        state = conversation_cache.get(session_id, version)
+        if state is not None:
+            rows = state.rows
+            logger.info(f"会话 {session_id} 命中上下文缓存")
+        else:
+            rows = MessageService._history_rows(await AsyncMessageService._get_context_messages(db, session))
+            conversation_cache.put(session_id, version, rows)
+        
+        # 初始化LLM并添加历史上下文，使用实际的角色名称
+        llm = AsyncLLM(actual_role_name, prompt.system_prompt, max_turns=MessageService.MAX_TURNS, max_context_tokens=ContextBuilder.DEFAULT_TOKEN_BUDGET)
+        role_clips = await AsyncMessageService._retrieve_role_clips(prompt, query)
+        MessageService._add_history_to_llm(llm, rows, session.summary, prompt, role_clips)
+        return llm, actual_role_name
+    
+    @staticmethod
+    async def _retrieve_role_clips(prompt: CompiledPrompt, query: Optional[str]) -> Optional[List[str]]:
+        """检索与本轮提问相关的角色设定切片，与历史消息共用上下文 token 预算"""
+        if not query or not prompt.retrieve_clips:
+            return None
+        return await RoleLore.aretrieve(prompt.role_id, prompt.clip_ids, prompt.clips, query)
+    
+    @staticmethod
+    async def process_voice_message(db: AsyncSession, user_id: int, session_id: int, user_text: str, role_name: str = "哈利波特") -> Dict[str, Any]:
+        """
+        处理语音对话消息的异步方法
+        1. 接收用户语音转写文本
+        2. 调用LLM生成AI回复
+        3. 使用TTS生成语音文件
+        4. 保存对话记录到数据库
+        5. 返回音频URL和AI文本
+        """
+        try:
+            llm, actual_role_name = await AsyncMessageService.prepare_voice_llm(db, user_id, session_id, user_text)
             
             # 异步调用LLM生成回复
-            ai_response = await asyncio.to_thread(llm.generate_output, user_text)
+            ai_response = await llm.agenerate_output(user_text)
             logger.info(f"LLM异步生成回复完成，长度: {len(ai_response)}")
             
             # 异步调用TTS生成语音文件
-            tts = TTS(voice="Cherry", language="Chinese")
-            audio_url = await asyncio.to_thread(tts.generate_audio, ai_response)
+            tts = AsyncTTS(voice="Cherry", language="Chinese")
+            audio_url = await tts.agenerate_audio(ai_response)
             logger.info(f"TTS异步生成音频完成: {audio_url}")
             
             # 保存对话记录
-            await MessageService._save_conversation(
+            await AsyncMessageService._save_conversation(
                 db=db,
                 user_id=user_id,
                 session_id=session_id,
@@ -473,7 +1088,7 @@ class MessageService:
         except HTTPException:
             raise
         except Exception as e:
-            db.rollback()
+            await db.rollback()
             logger.error(f"处理语音消息时发生错误: {str(e)}")
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -481,58 +1096,146 @@ class MessageService:
             )
     
     @staticmethod
-    async def _save_conversation(
-        db: Session, 
-        user_id: int, 
-        session_id: int, 
-        user_message: str, 
-        ai_message: str, 
-        audio_url: str,
+    def _format_sse(payload: Dict[str, Any]) -> str:
+        """将事件数据编码为 SSE 格式"""
+        return f"data: {json.dumps(payload, ensure_ascii=False, default=str)}\n\n"
+    
+    @staticmethod
+    async def stream_voice_message(
+        user_id: int,
+        session_id: int,
+        user_text: str,
+        llm: AsyncLLM,
         role_name: str
-    ) -> Dict[str, int]:
+    ) -> AsyncIterator[str]:
         """
-        异步保存对话记录到数据库
+        流式处理语音对话消息（SSE），LLM生成与TTS合成流水线并行
+        1. 逐个推送LLM增量文本（type=delta）
+        2. 按句切分增量文本，每句生成后立即并发提交TTS
+        3. 按句子顺序推送已完成的音频片段（type=audio）
+        4. 生成结束后保存对话记录，推送完成事件（type=done），出错时推送 type=error
+        
+        llm 需由 prepare_voice_llm 预先构建，以便在开始推流前完成权限校验。
+        流式响应期间请求级数据库会话可能已被释放，因此持久化使用独立会话。
         """
+        answer_chunks: List[str] = []
+        splitter = SentenceSplitter()
+        tts = AsyncTTS(voice="Cherry", language="Chinese")
+        tts_tasks: List[Tuple[str, asyncio.Task]] = []
+        audio_segments: List[str] = []
+        
+        def submit_tts(sentences: List[str]):
+            for sentence in sentences:
+                task = asyncio.create_task(tts.agenerate_audio(sentence))
+                tts_tasks.append((sentence, task))
+        
+        def audio_event(index: int) -> str:
+            sentence, task = tts_tasks[index]
+            audio_url = task.result()
+            audio_segments.append(audio_url)
+            return AsyncMessageService._format_sse({
+                "type": "audio",
+                "index": index,
+                "text": sentence,
+                "audio_url": audio_url
+            })
+        
         try:
-            # 保存用户消息 (role=1)
-            user_message_data = MessageCreate(
-                session_id=session_id,
-                role=1,  # 用户消息
-                content=user_message,
-                message_type="text",
-                metadata={"source": "voice_input"}
-            )
-            
-            user_msg = MessageService.create_message(db, user_id, user_message_data)
-            logger.info(f"用户语音消息已保存: {user_msg.id}")
+            async for delta in llm.astream_output(user_text):
+                answer_chunks.append(delta)
+                yield AsyncMessageService._format_sse({"type": "delta", "content": delta})
+                submit_tts(splitter.feed(delta))
+                
+                # 按顺序推送已完成的音频片段，保证播放顺序与文本一致
+                while len(audio_segments) < len(tts_tasks) and tts_tasks[len(audio_segments)][1].done():
+                    yield audio_event(len(audio_segments))
             
-            # 保存助手消息 (role=0)
-            assistant_message_data = MessageCreate(
-                session_id=session_id,
-                role=0,  # 助手消息
-                content=ai_message,
-                message_type="text",
-                metadata={
-                    "audio_url": audio_url,
-                    "voice": "Cherry",
-                    "language": "Chinese",
-                    "role_name": role_name,
-                    "source": "voice_output"
-                }
-            )
+            ai_response = "".join(answer_chunks)
+            logger.info(f"LLM流式生成回复完成，长度: {len(ai_response)}")
+            submit_tts(splitter.flush())
             
-            assistant_msg = MessageService.create_message(db, user_id, assistant_message_data)
-            logger.info(f"助手语音回复已保存: {assistant_msg.id}")
+            while len(audio_segments) < len(tts_tasks):
+                await tts_tasks[len(audio_segments)][1]
+                yield audio_event(len(audio_segments))
+            logger.info(f"TTS分句合成完成，共 {len(audio_segments)} 段")
             
-            return {
-                "user_message_id": user_msg.id,
-                "assistant_message_id": assistant_msg.id
-            }
+            async with AsyncSessionLocal() as db:
+                saved = await AsyncMessageService._save_conversation(
+                    db=db,
+                    user_id=user_id,
+                    session_id=session_id,
+                    user_message=user_text,
+                    ai_message=ai_response,
+                    audio_url=audio_segments[0] if audio_segments else None,
+                    role_name=role_name,
+                    audio_segments=audio_segments
+                )
             
+            yield AsyncMessageService._format_sse({
+                "type": "done",
+                "ai_text": ai_response,
+                "audio_segments": audio_segments,
+                "session_id": session_id,
+                "user_message_id": saved["user_message_id"],
+                "assistant_message_id": saved["assistant_message_id"],
+                "status": "success"
+            })
         except Exception as e:
-            db.rollback()
-            logger.error(f"保存对话记录时发生错误: {str(e)}")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="保存对话记录失败"
-            )
\ No newline at end of file
+            logger.error(f"流式处理语音消息时发生错误: {str(e)}")
+            detail = e.detail if isinstance(e, HTTPException) else "处理语音消息失败"
+            yield AsyncMessageService._format_sse({"type": "error", "detail": detail})
+        finally:
+            # 客户端断开或出错时取消尚未完成的TTS任务
+            for _, task in tts_tasks:
+                if not task.done():
+                    task.cancel()
+    
+    @staticmethod
+    async def _save_conversation(
+        db: AsyncSession,
+        user_id: int,
+        session_id: int,
+        user_message: str,
+        ai_message: str,
+        audio_url: Optional[str],
+        role_name: str,
+        audio_segments: Optional[List[str]] = None
+    ) -> Dict[str, int]:
+        """
+        异步保存对话记录到数据库
+        写入前会话内容与缓存版本一致时，把本轮对话追加到缓存，下一轮可直接复用
+        """
+        state = conversation_cache.peek(session_id)
+        saved = await AsyncMessageService.save_turn(
+            db,
+            user_id,
+            session_id,
+            user_content=user_message,
+            assistant_content=ai_message,
+            user_metadata={"source": "voice_input"},
+            assistant_metadata={
+                "audio_url": audio_url,
+                "voice": "Cherry",
+                "language": "Chinese",
+                "role_name": role_name,
+                "source": "voice_output",
+                **({"audio_segments": audio_segments} if audio_segments else {})
+            },
+            expected_version=state.version if state is not None else None
+        )
+        logger.info(f"语音对话已保存: {saved['user_message_id']}, {saved['assistant_message_id']}")
+        
+        # 旧消息累计到阈值后在后台合并进会话摘要
+        SummaryService.schedule_refresh(session_id, role_name)
+        
+        if state is not None and saved["continued"]:
+            # 与缓存未命中时的查询一致：只保留最近 MAX_CONTEXT_MESSAGES 条
+            rows = state.rows + [(user_message, ""), ("", ai_message)]
+            conversation_cache.put(session_id, saved["version"], rows[-SummaryService.MAX_CONTEXT_MESSAGES:])
+        else:
+            conversation_cache.invalidate(session_id)
+        
+        return {
+            "user_message_id": saved["user_message_id"],
+            "assistant_message_id": saved["assistant_message_id"]
+        }
@@ -0,0 +1,118 @@
+from collections import OrderedDict
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, Dict, Optional, Tuple
+import logging
+import threading
+
+from app.llm.context_builder import estimate_tokens
+from app.llm.prompt import Prompt
+from app.llm.role_lore import RoleLore
+from app.services.role_catalog import RoleEntry, role_catalog
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 内置系统角色的精编提示词，优先于数据库中的 preset_prompt
+BUILTIN_PROMPTS = {
+    "哈利波特": Prompt.harry_potter,
+    "哈姆雷特": Prompt.Hamlet,
+    "苏格拉底": Prompt.Socrates
+}
+
+# 既没有内置提示词也没有 preset_prompt 的角色使用的通用模板
+GENERIC_TEMPLATE = (
+    "**角色设定**：\n你现在扮演「{name}」。请始终以{name}的身份、语气和性格与用户对话，"
+    "知识范围符合该角色的背景。\n**禁止行为**：\n* 不能扮演其他角色。\n* 不能打破第四面墙，声称自己是一个AI程序。"
+)
+
+
+class CompiledPrompt:
+    """
+    编译后的角色提示词：系统提示词、角色设定切片以及预先估算的 token 数
+    切片较多的角色（retrieve_clips）不把切片放入系统提示词，而是每轮按提问检索 top-k
+    """
+
+    __slots__ = ("role_id", "role_name", "system_prompt", "system_tokens", "clips", "clip_ids", "clip_tokens", "retrieve_clips")
+
+    def __init__(
+        self,
+        role_id: Optional[int],
+        role_name: str,
+        system_prompt: str,
+        clips: Tuple[str, ...] = (),
+        clip_ids: Tuple[int, ...] = ()
+    ):
+        self.role_id = role_id
+        self.role_name = role_name
+        self.system_prompt = system_prompt
+        self.system_tokens = estimate_tokens(system_prompt)
+        self.clips = clips
+        self.clip_ids = clip_ids
+        self.clip_tokens = tuple(estimate_tokens(clip) for clip in clips)
+        self.retrieve_clips = RoleLore.needs_retrieval(clips)
+
+
+class PromptEngine:
+    """
+    角色提示词编译缓存
+    由角色目录中的 RoleEntry 编译：基础提示词（内置 > preset_prompt > 通用模板）+ 按 clip_index 排序的 role_settings 切片，
+    角色被修改后角色目录返回新的 RoleEntry，对应的编译结果随之重建；否则每轮对话只是一次字典查找
+    """
+
+    def __init__(self, max_prompts: int = 4096):
+        self.max_prompts = max_prompts
+        self._compiled = OrderedDict()
+        self._lock = threading.Lock()
+        self.compiles = 0
+
+    @staticmethod
+    def _base_prompt(entry: RoleEntry) -> str:
+        if entry.user_id == 0 and entry.name in BUILTIN_PROMPTS:
+            return BUILTIN_PROMPTS[entry.name]
+        if entry.preset_prompt and entry.preset_prompt.strip():
+            return entry.preset_prompt.strip()
+        return GENERIC_TEMPLATE.format(name=entry.name)
+
+    def compile(self, entry: RoleEntry) -> CompiledPrompt:
+        """获取角色的编译结果，角色数据未变化时直接复用"""
+        with self._lock:
+            cached = self._compiled.get(entry.id)
+            if cached is not None and cached[0] is entry:
+                self._compiled.move_to_end(entry.id)
+                return cached[1]
+
+        compiled = CompiledPrompt(entry.id, entry.name, self._base_prompt(entry), entry.clips, entry.clip_ids)
+        with self._lock:
+            self._compiled[entry.id] = (entry, compiled)
+            self._compiled.move_to_end(entry.id)
+            while len(self._compiled) > self.max_prompts:
+                self._compiled.popitem(last=False)
+            self.compiles += 1
+        logger.info(f"编译角色 '{entry.name}' 的提示词，约 {compiled.system_tokens} tokens，设定切片 {len(compiled.clips)} 条")
+        return compiled
+
+    def for_role(self, db: Session, role_id: int) -> Optional[CompiledPrompt]:
+        """按角色id获取编译后的提示词，角色不存在时返回None"""
+        entry = role_catalog.get(db, role_id)
+        return self.compile(entry) if entry is not None else None
+
+    async def afor_role(self, db: AsyncSession, role_id: int) -> Optional[CompiledPrompt]:
+        """按角色id获取编译后的提示词（异步）"""
+        entry = await role_catalog.aget(db, role_id)
+        return self.compile(entry) if entry is not None else None
+
+    def clear(self):
+        with self._lock:
+            self._compiled.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "prompts": len(self._compiled),
+                "max_prompts": self.max_prompts,
+                "compiles": self.compiles
+            }
+
+
+prompt_engine = PromptEngine()
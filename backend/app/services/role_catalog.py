@@ -0,0 +1,209 @@
+from collections import OrderedDict
+from datetime import datetime
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, Dict, List, Optional, Tuple
+import os
+import threading
+import time
+
+from app.models.role import Role
+from app.models.role_settings import RoleSettings
+
+
+class RoleEntry:
+    """角色目录中的一条只读记录：角色基本信息、设定提示词和按 clip_index 排序的设定切片（及其 role_settings id）"""
+
+    __slots__ = ("id", "user_id", "name", "avatar_url", "preset_prompt", "created_at", "clips", "clip_ids")
+
+    def __init__(
+        self,
+        id: int,
+        user_id: int,
+        name: str,
+        avatar_url: Optional[str],
+        preset_prompt: Optional[str],
+        created_at: Optional[datetime],
+        clips: Tuple[str, ...],
+        clip_ids: Tuple[int, ...] = ()
+    ):
+        self.id = id
+        self.user_id = user_id
+        self.name = name
+        self.avatar_url = avatar_url
+        self.preset_prompt = preset_prompt
+        self.created_at = created_at
+        self.clips = clips
+        self.clip_ids = clip_ids
+
+    @classmethod
+    def from_rows(cls, role: Role, settings: List[RoleSettings]) -> "RoleEntry":
+        settings = sorted(settings, key=lambda s: s.clip_index)
+        return cls(
+            id=role.id,
+            user_id=role.user_id,
+            name=role.name,
+            avatar_url=role.avatar_url,
+            preset_prompt=role.preset_prompt,
+            created_at=role.created_at,
+            clips=tuple(setting.setting_text for setting in settings),
+            clip_ids=tuple(setting.id for setting in settings)
+        )
+
+
+class RoleCatalog:
+    """
+    进程内角色目录缓存（LRU + TTL），按角色id和角色名查找
+    角色数据极少变化，命中时角色解析只是一次字典查找；
+    本进程内的修改会立即失效对应条目，其他进程的修改最迟在 TTL 后生效
+    """
+
+    def __init__(self, max_roles: int = 4096, ttl: float = float(os.getenv("ROLE_CATALOG_TTL_SECONDS", "300"))):
+        self.max_roles = max_roles
+        self.ttl = ttl
+        self._by_id = OrderedDict()
+        self._id_by_name: Dict[str, int] = {}
+        self._system_ids: Optional[Tuple[Tuple[int, ...], float]] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, role_id: Optional[int]) -> Optional[RoleEntry]:
+        with self._lock:
+            cached = self._by_id.get(role_id)
+            if cached is None or cached[1] < time.monotonic():
+                self.misses += 1
+                return None
+            self._by_id.move_to_end(role_id)
+            self.hits += 1
+            return cached[0]
+
+    def _store(self, entry: RoleEntry) -> RoleEntry:
+        with self._lock:
+            self._by_id[entry.id] = (entry, time.monotonic() + self.ttl)
+            self._by_id.move_to_end(entry.id)
+            self._id_by_name[entry.name] = entry.id
+            while len(self._by_id) > self.max_roles:
+                _, (evicted, _) = self._by_id.popitem(last=False)
+                if self._id_by_name.get(evicted.name) == evicted.id:
+                    del self._id_by_name[evicted.name]
+        return entry
+
+    def _cached_system_ids(self) -> Optional[Tuple[int, ...]]:
+        with self._lock:
+            if self._system_ids is None or self._system_ids[1] < time.monotonic():
+                return None
+            return self._system_ids[0]
+
+    def _store_system_ids(self, ids: List[int]):
+        with self._lock:
+            self._system_ids = (tuple(ids), time.monotonic() + self.ttl)
+
+    @staticmethod
+    def _settings_statement(role_ids: List[int]):
+        return select(RoleSettings).where(RoleSettings.role_id.in_(role_ids))
+
+    @staticmethod
+    def _group_settings(settings: List[RoleSettings]) -> Dict[int, List[RoleSettings]]:
+        grouped: Dict[int, List[RoleSettings]] = {}
+        for setting in settings:
+            grouped.setdefault(setting.role_id, []).append(setting)
+        return grouped
+
+    def get(self, db: Session, role_id: int) -> Optional[RoleEntry]:
+        """按id获取角色，未命中时从数据库加载"""
+        entry = self._lookup(role_id)
+        if entry is not None:
+            return entry
+        role = db.get(Role, role_id)
+        if role is None:
+            return None
+        settings = list(db.execute(self._settings_statement([role_id])).scalars())
+        return self._store(RoleEntry.from_rows(role, settings))
+
+    def get_by_name(self, db: Session, name: str) -> Optional[RoleEntry]:
+        """按角色名获取角色"""
+        role_id = self._id_by_name.get(name)
+        entry = self._lookup(role_id) if role_id is not None else None
+        if entry is not None and entry.name == name:
+            return entry
+        role = db.execute(select(Role).where(Role.name == name).limit(1)).scalars().first()
+        return self.get(db, role.id) if role is not None else None
+
+    def system_roles(self, db: Session) -> List[RoleEntry]:
+        """系统预设角色（user_id=0）"""
+        ids = self._cached_system_ids()
+        if ids is not None:
+            entries = [self._lookup(role_id) for role_id in ids]
+            if all(entries):
+                return entries
+        roles = list(db.execute(select(Role).where(Role.user_id == 0)).scalars())
+        grouped = self._group_settings(list(db.execute(self._settings_statement([r.id for r in roles])).scalars()))
+        entries = [self._store(RoleEntry.from_rows(role, grouped.get(role.id, []))) for role in roles]
+        self._store_system_ids([entry.id for entry in entries])
+        return entries
+
+    async def aget(self, db: AsyncSession, role_id: int) -> Optional[RoleEntry]:
+        """按id获取角色（异步），未命中时从数据库加载"""
+        entry = self._lookup(role_id)
+        if entry is not None:
+            return entry
+        role = await db.get(Role, role_id)
+        if role is None:
+            return None
+        settings = list((await db.execute(self._settings_statement([role_id]))).scalars())
+        return self._store(RoleEntry.from_rows(role, settings))
+
+    async def aget_by_name(self, db: AsyncSession, name: str) -> Optional[RoleEntry]:
+        """按角色名获取角色（异步）"""
+        role_id = self._id_by_name.get(name)
+        entry = self._lookup(role_id) if role_id is not None else None
+        if entry is not None and entry.name == name:
+            return entry
+        role = (await db.execute(select(Role).where(Role.name == name).limit(1))).scalars().first()
+        return await self.aget(db, role.id) if role is not None else None
+
+    async def asystem_roles(self, db: AsyncSession) -> List[RoleEntry]:
+        """系统预设角色（异步）"""
+        ids = self._cached_system_ids()
+        if ids is not None:
+            entries = [self._lookup(role_id) for role_id in ids]
+            if all(entries):
+                return entries
+        roles = list((await db.execute(select(Role).where(Role.user_id == 0))).scalars())
+        settings = (await db.execute(self._settings_statement([r.id for r in roles]))).scalars()
+        grouped = self._group_settings(list(settings))
+        entries = [self._store(RoleEntry.from_rows(role, grouped.get(role.id, []))) for role in roles]
+        self._store_system_ids([entry.id for entry in entries])
+        return entries
+
+    def invalidate(self, role_id: Optional[int] = None):
+        """角色被创建、修改或删除后调用；不传id时清空整个目录"""
+        with self._lock:
+            if role_id is None:
+                self._by_id.clear()
+                self._id_by_name.clear()
+            else:
+                cached = self._by_id.pop(role_id, None)
+                if cached and self._id_by_name.get(cached[0].name) == role_id:
+                    del self._id_by_name[cached[0].name]
+            # 系统角色列表可能受影响
+            self._system_ids = None
+
+    def clear(self):
+        self.invalidate()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "roles": len(self._by_id),
+                "max_roles": self.max_roles,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0
+            }
+
+
+role_catalog = RoleCatalog()
@@ -1,4 +1,6 @@
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
 from typing import List, Optional
 from datetime import datetime
@@ -6,6 +8,8 @@ from datetime import datetime
 from app.models.role import Role
 from app.schemas.role import RoleCreate, RoleUpdate
 from app.db.session import get_db
+from app.db.async_session import mark_written, use_replica
+from app.services.role_catalog import RoleEntry, role_catalog
 
 
 class RoleService:
@@ -47,6 +51,7 @@ class RoleService:
             self.db.add(db_role)
             self.db.commit()
             self.db.refresh(db_role)
+            role_catalog.invalidate(db_role.id)
             
             return db_role
             
@@ -54,18 +59,18 @@ class RoleService:
             self.db.rollback()
             raise SQLAlchemyError(f"创建角色失败: {str(e)}")
     
-    def get_role_by_id(self, role_id: int) -> Optional[Role]:
+    def get_role_by_id(self, role_id: int) -> Optional[RoleEntry]:
         """
-        根据ID获取角色
+        根据ID获取角色（经角色目录缓存）
         
         Args:
             role_id: 角色ID
             
         Returns:
-            角色对象或None
+            角色只读记录或None
         """
         try:
-            return self.db.query(Role).filter(Role.id == role_id).first()
+            return role_catalog.get(self.db, role_id)
         except SQLAlchemyError as e:
             raise SQLAlchemyError(f"获取角色失败: {str(e)}")
     
@@ -110,8 +115,8 @@ class RoleService:
             SQLAlchemyError: 数据库操作异常
         """
         try:
-            # 获取现有角色
-            db_role = self.get_role_by_id(role_id)
+            # 获取现有角色（需要可修改的ORM对象，不走缓存）
+            db_role = self.db.get(Role, role_id)
             if not db_role:
                 raise ValueError(f"角色ID {role_id} 不存在")
             
@@ -140,6 +145,7 @@ class RoleService:
             
             self.db.commit()
             self.db.refresh(db_role)
+            role_catalog.invalidate(role_id)
             
             return db_role
             
@@ -163,8 +169,8 @@ class RoleService:
             SQLAlchemyError: 数据库操作异常
         """
         try:
-            # 获取现有角色
-            db_role = self.get_role_by_id(role_id)
+            # 获取现有角色（需要可删除的ORM对象，不走缓存）
+            db_role = self.db.get(Role, role_id)
             if not db_role:
                 return False
             
@@ -177,6 +183,7 @@ class RoleService:
             
             self.db.delete(db_role)
             self.db.commit()
+            role_catalog.invalidate(role_id)
             
             return True
             
@@ -184,15 +191,15 @@ class RoleService:
             self.db.rollback()
             raise SQLAlchemyError(f"删除角色失败: {str(e)}")
     
-    def get_system_roles(self) -> List[Role]:
+    def get_system_roles(self) -> List[RoleEntry]:
         """
-        获取系统预设角色（user_id=0）
+        获取系统预设角色（user_id=0，经角色目录缓存）
         
         Returns:
             系统角色列表
         """
         try:
-            return self.db.query(Role).filter(Role.user_id == 0).all()
+            return role_catalog.system_roles(self.db)
         except SQLAlchemyError as e:
             raise SQLAlchemyError(f"获取系统角色失败: {str(e)}")
     
@@ -221,4 +228,156 @@ def get_role_service(db: Session = None) -> RoleService:
     """
     if db is None:
         db = next(get_db())
-    return RoleService(db)
\ No newline at end of file
+    return RoleService(db)
+
+class AsyncRoleService:
+    """
+    角色服务层（异步版本），基于 AsyncSession，供 async 路由使用
+    只读方法的查询路由到只读副本，当前客户端写入角色后短时间内改读主库
+    """
+    
+    def __init__(self, db: AsyncSession):
+        self.db = db
+    
+    async def _get_role_by_name(self, name: str, exclude_id: Optional[int] = None) -> Optional[Role]:
+        stmt = select(Role).where(Role.name == name)
+        if exclude_id is not None:
+            stmt = stmt.where(Role.id != exclude_id)
+        return (await self.db.execute(stmt.limit(1))).scalars().first()
+    
+    async def create_role(self, role_data: RoleCreate, user_id: int = 0) -> Role:
+        """
+        创建新角色，语义同 RoleService.create_role
+        
+        Raises:
+            ValueError: 当角色名已存在时
+            SQLAlchemyError: 数据库操作异常
+        """
+        try:
+            if await self._get_role_by_name(role_data.name):
+                raise ValueError(f"角色名 '{role_data.name}' 已存在")
+            
+            db_role = Role(
+                user_id=user_id,
+                name=role_data.name,
+                avatar_url=role_data.description,  # 注意：数据库字段与schema不完全匹配
+                preset_prompt=role_data.voice_sample_url,  # 临时映射，需要调整数据库结构
+                created_at=datetime.now()
+            )
+            
+            self.db.add(db_role)
+            await self.db.commit()
+            mark_written()
+            role_catalog.invalidate(db_role.id)
+            
+            return db_role
+            
+        except SQLAlchemyError as e:
+            await self.db.rollback()
+            raise SQLAlchemyError(f"创建角色失败: {str(e)}")
+    
+    async def get_role_by_id(self, role_id: int) -> Optional[RoleEntry]:
+        """根据ID获取角色（经角色目录缓存），不存在时返回None"""
+        try:
+            use_replica(self.db)
+            return await role_catalog.aget(self.db, role_id)
+        except SQLAlchemyError as e:
+            raise SQLAlchemyError(f"获取角色失败: {str(e)}")
+    
+    async def get_roles(self, skip: int = 0, limit: int = 100, user_id: Optional[int] = None) -> List[Role]:
+        """获取角色列表，可按用户ID筛选"""
+        try:
+            use_replica(self.db)
+            stmt = select(Role)
+            
+            # 如果指定了用户ID，则筛选该用户的角色
+            if user_id is not None:
+                stmt = stmt.where(Role.user_id == user_id)
+            
+            return list((await self.db.execute(stmt.offset(skip).limit(limit))).scalars())
+            
+        except SQLAlchemyError as e:
+            raise SQLAlchemyError(f"获取角色列表失败: {str(e)}")
+    
+    async def update_role(self, role_id: int, role_data: RoleUpdate, user_id: Optional[int] = None) -> Optional[Role]:
+        """
+        更新角色信息，语义同 RoleService.update_role
+        
+        Raises:
+            ValueError: 当角色不存在或无权限时
+            SQLAlchemyError: 数据库操作异常
+        """
+        try:
+            # 修改前从主库读取
+            db_role = await self.db.get(Role, role_id)
+            if not db_role:
+                raise ValueError(f"角色ID {role_id} 不存在")
+            
+            # 权限检查：只有角色创建者或系统管理员可以修改
+            if user_id is not None and db_role.user_id != user_id and user_id != 0:
+                raise ValueError("无权限修改此角色")
+            
+            # 检查角色名是否与其他角色冲突
+            if role_data.name and role_data.name != db_role.name:
+                if await self._get_role_by_name(role_data.name, exclude_id=role_id):
+                    raise ValueError(f"角色名 '{role_data.name}' 已存在")
+            
+            # 更新字段
+            update_data = role_data.dict(exclude_unset=True)
+            for field, value in update_data.items():
+                if field == "name":
+                    db_role.name = value
+                elif field == "description":
+                    db_role.avatar_url = value  # 临时映射
+                elif field == "voice_sample_url":
+                    db_role.preset_prompt = value  # 临时映射
+            
+            await self.db.commit()
+            mark_written()
+            role_catalog.invalidate(role_id)
+            
+            return db_role
+            
+        except SQLAlchemyError as e:
+            await self.db.rollback()
+            raise SQLAlchemyError(f"更新角色失败: {str(e)}")
+    
+    async def delete_role(self, role_id: int, user_id: Optional[int] = None) -> bool:
+        """
+        删除角色，角色不存在返回False
+        
+        Raises:
+            ValueError: 当无权限删除时
+            SQLAlchemyError: 数据库操作异常
+        """
+        try:
+            db_role = await self.db.get(Role, role_id)
+            if not db_role:
+                return False
+            
+            # 权限检查：只有角色创建者或系统管理员可以删除
+            if user_id is not None and db_role.user_id != user_id and user_id != 0:
+                raise ValueError("无权限删除此角色")
+            
+            await self.db.delete(db_role)
+            await self.db.commit()
+            mark_written()
+            role_catalog.invalidate(role_id)
+            
+            return True
+            
+        except SQLAlchemyError as e:
+            await self.db.rollback()
+            raise SQLAlchemyError(f"删除角色失败: {str(e)}")
+    
+    async def get_system_roles(self) -> List[RoleEntry]:
+        """获取系统预设角色（user_id=0，经角色目录缓存）"""
+        try:
+            use_replica(self.db)
+            return await role_catalog.asystem_roles(self.db)
+        except SQLAlchemyError as e:
+            raise SQLAlchemyError(f"获取系统角色失败: {str(e)}")
+    
+    async def validate_role_exists(self, role_id: int) -> bool:
+        """验证角色是否存在"""
+        return await self.get_role_by_id(role_id) is not None
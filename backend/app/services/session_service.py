@@ -1,13 +1,22 @@
+from sqlalchemy import delete, select, update
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
 from fastapi import HTTPException, status
 from typing import List, Optional
 from datetime import datetime
+import asyncio
 import logging
 
+from app.models.chat_messages import ChatMessages
 from app.models.chat_sessions import ChatSessions
-from app.models.role import Role
 from app.schemas.session import SessionCreate
+from app.db.async_session import mark_written, use_replica
+from app.llm.ann_index import EmbeddingIndexRegistry
+from app.llm.embedding_store import EmbeddingStore
+from app.llm.lexical_index import LexicalIndexRegistry
+from app.services.conversation_cache import conversation_cache
+from app.services.role_catalog import RoleEntry, role_catalog
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -15,12 +24,36 @@ logger = logging.getLogger(__name__)
 class SessionService:
     """会话服务类"""
     
+    @staticmethod
+    def _session_messages_statement(session_id: int, user_id: Optional[int] = None):
+        """会话所属用户及其全部消息id，删除会话前取出，用于清理检索索引；会话没有消息时消息id为 None"""
+        stmt = select(ChatSessions.user_id, ChatMessages.id).outerjoin(
+            ChatMessages, ChatMessages.session_id == ChatSessions.id
+        ).where(ChatSessions.id == session_id)
+        if user_id is not None:
+            stmt = stmt.where(ChatSessions.user_id == user_id)
+        return stmt
+    
+    @staticmethod
+    def _delete_embeddings_statement(rows):
+        """删除会话消息已保存的向量，与删除会话放在同一事务中执行"""
+        message_ids = [message_id for _, message_id in rows if message_id is not None]
+        return EmbeddingStore.delete_statement(EmbeddingStore.CHAT_MESSAGE, message_ids) if message_ids else None
+    
+    @staticmethod
+    def _forget_messages(rows):
+        """会话删除后从所属用户的向量索引和倒排索引中移除该会话的消息"""
+        for owner_id, message_id in rows:
+            if message_id is not None:
+                EmbeddingIndexRegistry.remove(owner_id, message_id)
+                LexicalIndexRegistry.remove(owner_id, message_id)
+    
     @staticmethod
     def create_session(db: Session, user_id: int, session_data: SessionCreate) -> ChatSessions:
         """创建新会话"""
         try:
             # 验证角色是否存在
-            role = db.query(Role).filter(Role.id == session_data.role_id).first()
+            role = role_catalog.get(db, session_data.role_id)
             if not role:
                 logger.warning(f"尝试创建会话时角色不存在: role_id={session_data.role_id}")
                 raise HTTPException(
@@ -153,8 +186,14 @@ class SessionService:
                     detail="会话不存在或您没有权限删除"
                 )
             
+            messages = db.execute(SessionService._session_messages_statement(session_id)).all()
             db.delete(session)
+            delete_embeddings = SessionService._delete_embeddings_statement(messages)
+            if delete_embeddings is not None:
+                db.execute(delete_embeddings)
             db.commit()
+            conversation_cache.invalidate(session_id)
+            SessionService._forget_messages(messages)
             
             logger.info(f"成功删除会话: session_id={session_id}, user_id={user_id}")
             return True
@@ -181,7 +220,7 @@ class SessionService:
         """获取或创建用户与特定角色的会话（每个用户与每个角色只有一个会话）"""
         try:
             # 首先验证角色是否存在
-            role = db.query(Role).filter(Role.id == role_id).first()
+            role = role_catalog.get(db, role_id)
             if not role:
                 logger.warning(f"尝试获取会话时角色不存在: role_id={role_id}")
                 raise HTTPException(
@@ -261,4 +300,216 @@ class SessionService:
         except Exception as e:
             db.rollback()
             logger.error(f"更新会话最后消息时间时未知错误: {str(e)}")
-            return False
\ No newline at end of file
+            return False
+
+class AsyncSessionService:
+    """会话服务类（异步版本），基于 AsyncSession，供 async 路由使用"""
+    
+    @staticmethod
+    async def _check_role(db: AsyncSession, user_id: int, role_id: int) -> RoleEntry:
+        """验证角色是否存在且用户有权限使用"""
+        role = await role_catalog.aget(db, role_id)
+        if not role:
+            logger.warning(f"角色不存在: role_id={role_id}")
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="指定的角色不存在"
+            )
+        
+        if role.user_id != 0 and role.user_id != user_id:
+            logger.warning(f"用户 {user_id} 尝试使用无权限的角色 {role_id}")
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="您没有权限使用该角色"
+            )
+        return role
+    
+    @staticmethod
+    async def create_session(db: AsyncSession, user_id: int, session_data: SessionCreate) -> ChatSessions:
+        """创建新会话"""
+        try:
+            await AsyncSessionService._check_role(db, user_id, session_data.role_id)
+            
+            db_session = ChatSessions(
+                user_id=user_id,
+                role_id=session_data.role_id,
+                created_at=datetime.now()
+            )
+            db.add(db_session)
+            await db.commit()
+            mark_written()
+            
+            logger.info(f"用户 {user_id} 成功创建会话 {db_session.id}，角色 {session_data.role_id}")
+            return db_session
+            
+        except HTTPException:
+            raise
+        except SQLAlchemyError as e:
+            await db.rollback()
+            logger.error(f"创建会话时数据库错误: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="创建会话失败"
+            )
+    
+    @staticmethod
+    async def get_sessions_by_user(db: AsyncSession, user_id: int, skip: int = 0, limit: int = 100) -> List[ChatSessions]:
+        """获取用户的会话列表"""
+        try:
+            use_replica(db)
+            result = await db.execute(
+                select(ChatSessions)
+                .where(ChatSessions.user_id == user_id)
+                .order_by(ChatSessions.created_at.desc())
+                .offset(skip)
+                .limit(limit)
+            )
+            sessions = list(result.scalars())
+            
+            logger.info(f"获取用户 {user_id} 的会话列表，共 {len(sessions)} 个会话")
+            return sessions
+            
+        except SQLAlchemyError as e:
+            logger.error(f"获取用户会话列表时数据库错误: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="获取会话列表失败"
+            )
+    
+    @staticmethod
+    async def get_session_by_id(db: AsyncSession, session_id: int, user_id: Optional[int] = None) -> ChatSessions:
+        """根据ID获取会话详情"""
+        try:
+            use_replica(db)
+            stmt = select(ChatSessions).where(ChatSessions.id == session_id)
+            
+            # 如果指定了用户ID，则只能获取该用户的会话
+            if user_id is not None:
+                stmt = stmt.where(ChatSessions.user_id == user_id)
+            
+            session = (await db.execute(stmt)).scalars().first()
+            
+            if not session:
+                logger.warning(f"会话不存在或无权限访问: session_id={session_id}, user_id={user_id}")
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="会话不存在或您没有权限访问"
+                )
+            
+            logger.info(f"成功获取会话详情: session_id={session_id}")
+            return session
+            
+        except HTTPException:
+            raise
+        except SQLAlchemyError as e:
+            logger.error(f"获取会话详情时数据库错误: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="获取会话详情失败"
+            )
+    
+    @staticmethod
+    async def delete_session(db: AsyncSession, session_id: int, user_id: Optional[int] = None) -> bool:
+        """删除会话"""
+        try:
+            stmt = delete(ChatSessions).where(ChatSessions.id == session_id)
+            
+            # 如果指定了用户ID，则只能删除该用户的会话
+            if user_id is not None:
+                stmt = stmt.where(ChatSessions.user_id == user_id)
+            
+            messages = (await db.execute(SessionService._session_messages_statement(session_id, user_id))).all()
+            result = await db.execute(stmt)
+            if not result.rowcount:
+                await db.rollback()
+                logger.warning(f"尝试删除不存在的会话或无权限: session_id={session_id}, user_id={user_id}")
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="会话不存在或您没有权限删除"
+                )
+            delete_embeddings = SessionService._delete_embeddings_statement(messages)
+            if delete_embeddings is not None:
+                await db.execute(delete_embeddings)
+            
+            await db.commit()
+            mark_written()
+            conversation_cache.invalidate(session_id)
+            # 向量索引可能需要从磁盘快照加载，放到线程中执行
+            await asyncio.to_thread(SessionService._forget_messages, messages)
+            
+            logger.info(f"成功删除会话: session_id={session_id}, user_id={user_id}")
+            return True
+            
+        except HTTPException:
+            raise
+        except SQLAlchemyError as e:
+            await db.rollback()
+            logger.error(f"删除会话时数据库错误: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="删除会话失败"
+            )
+    
+    @staticmethod
+    async def get_or_create_user_role_session(db: AsyncSession, user_id: int, role_id: int) -> ChatSessions:
+        """获取或创建用户与特定角色的会话（每个用户与每个角色只有一个会话）"""
+        try:
+            await AsyncSessionService._check_role(db, user_id, role_id)
+            
+            # 查找是否已存在该用户与该角色的会话
+            result = await db.execute(
+                select(ChatSessions)
+                .where(ChatSessions.user_id == user_id, ChatSessions.role_id == role_id)
+                .limit(1)
+            )
+            existing_session = result.scalars().first()
+            
+            if existing_session:
+                logger.info(f"找到用户 {user_id} 与角色 {role_id} 的现有会话: {existing_session.id}")
+                return existing_session
+            
+            # 如果不存在，创建新会话
+            new_session = ChatSessions(
+                user_id=user_id,
+                role_id=role_id,
+                created_at=datetime.now()
+            )
+            db.add(new_session)
+            await db.commit()
+            mark_written()
+            
+            logger.info(f"为用户 {user_id} 与角色 {role_id} 创建新会话: {new_session.id}")
+            return new_session
+            
+        except HTTPException:
+            raise
+        except SQLAlchemyError as e:
+            await db.rollback()
+            logger.error(f"获取或创建用户角色会话时数据库错误: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="获取或创建会话失败"
+            )
+    
+    @staticmethod
+    async def update_last_message_time(db: AsyncSession, session_id: int, message_time: Optional[datetime] = None) -> bool:
+        """更新会话的最后消息时间"""
+        try:
+            result = await db.execute(
+                update(ChatSessions)
+                .where(ChatSessions.id == session_id)
+                .values(last_message_at=message_time or datetime.now())
+            )
+            if not result.rowcount:
+                await db.rollback()
+                logger.warning(f"尝试更新不存在的会话时间: session_id={session_id}")
+                return False
+            
+            await db.commit()
+            logger.info(f"成功更新会话最后消息时间: session_id={session_id}")
+            return True
+            
+        except SQLAlchemyError as e:
+            await db.rollback()
+            logger.error(f"更新会话最后消息时间时数据库错误: {str(e)}")
+            return False
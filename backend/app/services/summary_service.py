@@ -0,0 +1,115 @@
+from sqlalchemy.orm import Session
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+import logging
+import threading
+
+from app.db.session import SessionLocal
+from app.models.chat_messages import ChatMessages
+from app.models.chat_sessions import ChatSessions
+from app.llm.llm_api import LLM
+from app.llm.prompt import Prompt
+from app.services.conversation_cache import conversation_cache, next_version
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+class SummaryService:
+    """
+    会话滚动摘要服务
+
+    最近 RECENT_WINDOW 条消息以原文进入上下文，更早的消息每累计 REFRESH_EVERY 条
+    就在后台合并进会话摘要，长会话的提示词长度因此保持稳定。
+    摘要尚未覆盖的消息全部以原文进入上下文（最多 MAX_CONTEXT_MESSAGES 条），
+    因此等待合并的消息不会既不在摘要里、也不在原文窗口里
+    """
+
+    RECENT_WINDOW = 10
+    REFRESH_EVERY = 20
+    # 刷新在后台执行，留出一次刷新的余量
+    MAX_CONTEXT_MESSAGES = RECENT_WINDOW + 2 * REFRESH_EVERY
+    MAX_TRANSCRIPT_MESSAGES = 200
+
+    _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="session-summary")
+    _in_flight = set()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _pending_messages(db: Session, session: ChatSessions) -> List[ChatMessages]:
+        """获取尚未并入摘要、且已移出最近窗口的消息（按时间正序）"""
+        recent_ids = [row.id for row in db.query(ChatMessages.id).filter(
+            ChatMessages.session_id == session.id
+        ).order_by(ChatMessages.created_at.desc(), ChatMessages.id.desc()).limit(SummaryService.RECENT_WINDOW).all()]
+        if len(recent_ids) < SummaryService.RECENT_WINDOW:
+            return []
+
+        return db.query(ChatMessages).filter(
+            ChatMessages.session_id == session.id,
+            ChatMessages.id > (session.summary_message_id or 0),
+            ChatMessages.id < min(recent_ids)
+        ).order_by(ChatMessages.id).limit(SummaryService.MAX_TRANSCRIPT_MESSAGES).all()
+
+    @staticmethod
+    def _format_transcript(messages: List[ChatMessages], role_name: str) -> str:
+        lines = []
+        for msg in messages:
+            if msg.query_content:
+                lines.append(f"用户：{msg.query_content}")
+            if msg.answer_content:
+                lines.append(f"{role_name}：{msg.answer_content}")
+        return "\n".join(lines)
+
+    @staticmethod
+    def refresh_summary(db: Session, session_id: int, role_name: str = "角色") -> Optional[str]:
+        """
+        将移出最近窗口的旧消息合并进会话摘要
+        未达到刷新阈值时不做任何事，返回 None
+        """
+        session = db.query(ChatSessions).filter(ChatSessions.id == session_id).first()
+        if not session:
+            return None
+
+        pending = SummaryService._pending_messages(db, session)
+        if len(pending) < SummaryService.REFRESH_EVERY:
+            return None
+
+        query = ""
+        if session.summary:
+            query += f"已有摘要：\n{session.summary}\n\n"
+        query += f"新的对话内容：\n{SummaryService._format_transcript(pending, role_name)}"
+
+        llm = LLM(role_name, Prompt.conversation_summary, max_turns=3)
+        summary = llm.generate_output(query).strip()
+        if not summary:
+            return None
+
+        session.summary = summary
+        session.summary_message_id = pending[-1].id
+        # 摘要覆盖的消息不再以原文进入上下文，更新版本使所有进程的缓存失效
+        session.version = next_version()
+        db.commit()
+        conversation_cache.invalidate(session_id)
+        logger.info(f"会话 {session_id} 摘要已更新，覆盖到消息 {pending[-1].id}，本次合并 {len(pending)} 条")
+        return summary
+
+    @staticmethod
+    def schedule_refresh(session_id: int, role_name: str = "角色"):
+        """在后台刷新会话摘要；同一会话同时只会有一个刷新任务"""
+        with SummaryService._lock:
+            if session_id in SummaryService._in_flight:
+                return None
+            SummaryService._in_flight.add(session_id)
+        return SummaryService._executor.submit(SummaryService._refresh_in_background, session_id, role_name)
+
+    @staticmethod
+    def _refresh_in_background(session_id: int, role_name: str):
+        db = SessionLocal()
+        try:
+            SummaryService.refresh_summary(db, session_id, role_name)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"刷新会话 {session_id} 摘要失败: {str(e)}")
+        finally:
+            db.close()
+            with SummaryService._lock:
+                SummaryService._in_flight.discard(session_id)
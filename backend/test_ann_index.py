@@ -0,0 +1,128 @@
+"""
+测试 HNSW 近似向量索引与按用户的索引注册表
+验证写入、删除、压缩重建、快照读写，以及删除会话、修剪历史窗口后索引中不再保留对应消息
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from app.db.migrations import run_migrations
+from app.llm.ann_index import EmbeddingIndexRegistry, HNSWIndex, load_index
+from app.llm.embedding_index import EmbeddingIndex
+from app.llm.lexical_index import BM25Index, LexicalIndexRegistry
+from app.llm.rag import Rag
+from app.services.session_service import SessionService
+
+
+def _vectors(size: int, dim: int = 16, seed: int = 0):
+    return np.random.default_rng(seed).standard_normal((size, dim)).astype(np.float32)
+
+
+def test_insert_and_search():
+    """写入的向量能以自身为查询找回，结果按相似度降序"""
+    vectors = _vectors(300)
+    index = HNSWIndex(seed=0)
+    index.add(range(300), vectors)
+    assert len(index) == 300 and 42 in index
+    for item_id in (0, 42, 299):
+        ids, scores = index.search(vectors[item_id], k=5)
+        assert ids[0] == item_id
+        assert list(scores) == sorted(scores, reverse=True)
+
+    # 重复写入同一id时替换旧向量
+    index.add([42], vectors[7:8])
+    assert len(index) == 300
+    assert index.search(vectors[7], k=2)[0].tolist() in ([7, 42], [42, 7])
+
+
+def test_remove_and_compaction():
+    """删除的向量不再出现在结果中；已删除节点多于有效节点时整体重建"""
+    vectors = _vectors(200)
+    index = HNSWIndex(seed=0)
+    index.add(range(200), vectors)
+    assert index.remove(5) and not index.remove(5)
+    assert 5 not in index.search(vectors[5], k=10)[0]
+
+    for item_id in range(6, 150):
+        index.remove(item_id)
+    # 已删除节点超过半数时重建过一次，图中只保留重建后新删除的少量节点
+    assert len(index) == 55
+    assert index._count < 200 and index._count - len(index) < 64
+    assert sorted(index.ids.tolist()) == list(range(5)) + list(range(150, 200))
+    assert index.search(vectors[170], k=1)[0][0] == 170
+
+
+def test_snapshot_round_trip():
+    """快照恢复后检索结果一致，已删除的向量仍不可见，且不留下临时文件"""
+    vectors = _vectors(120)
+    index = HNSWIndex(seed=0)
+    index.add(range(120), vectors)
+    index.remove(3)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "user_1.npz"
+        index.save(path)
+        assert [p.name for p in Path(tmp).iterdir()] == ["user_1.npz"]
+        restored = load_index(path)
+    assert isinstance(restored, HNSWIndex)
+    assert len(restored) == 119 and 3 not in restored
+    for item_id in (0, 60, 119):
+        assert restored.search(vectors[item_id], k=5)[0].tolist() == index.search(vectors[item_id], k=5)[0].tolist()
+    # 恢复后可以继续写入
+    restored.add([500], vectors[3:4])
+    assert restored.search(vectors[3], k=1)[0][0] == 500
+
+
+def test_delete_session_removes_messages_from_indexes():
+    """删除会话时从所属用户的向量索引和倒排索引中移除该会话的消息"""
+    engine = create_engine("sqlite://", echo=False)
+    run_migrations(engine)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO chat_sessions (id, user_id, role_id, created_at) VALUES (1, 7, 1, CURRENT_TIMESTAMP), (2, 7, 2, CURRENT_TIMESTAMP)"))
+        conn.execute(text(
+            "INSERT INTO chat_messages (id, session_id, query_content, answer_content, message_type, created_at, response_at) "
+            "VALUES (1, 1, 'q', 'a', 'text', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP), "
+            "(2, 1, 'q', 'a', 'text', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP), "
+            "(3, 2, 'q', 'a', 'text', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)"
+        ))
+    snapshot_dir = EmbeddingIndexRegistry.snapshot_dir
+    with tempfile.TemporaryDirectory() as tmp:
+        EmbeddingIndexRegistry.snapshot_dir = Path(tmp)
+        try:
+            EmbeddingIndexRegistry.get(7).add([1, 2, 3], _vectors(3))
+            LexicalIndexRegistry.get(7).add([1, 2, 3], ["魔杖", "扫帚", "飞路粉"])
+            with Session(engine) as db:
+                assert SessionService.delete_session(db, 1, user_id=7)
+            assert EmbeddingIndexRegistry.get(7).ids.tolist() == [3]
+            assert 1 not in LexicalIndexRegistry.get(7) and 3 in LexicalIndexRegistry.get(7)
+        finally:
+            EmbeddingIndexRegistry.drop(7)
+            LexicalIndexRegistry.drop(7)
+            EmbeddingIndexRegistry.snapshot_dir = snapshot_dir
+
+
+def test_rag_trims_index_to_history_window():
+    """检索前从两种索引中移除不在历史窗口内的消息（例如来自其他进程较旧快照中已删除的消息）"""
+    rag = Rag.__new__(Rag)
+    rag.index = EmbeddingIndex()
+    rag.index.add([1, 2, 3, 4], _vectors(4))
+    rag.lexical = BM25Index()
+    rag.lexical.add([1, 2, 3, 4], ["魔杖", "扫帚", "飞路粉", "隐形衣"])
+    rag.trim_index({2: "a", 4: "b"})
+    assert sorted(rag.index.ids.tolist()) == [2, 4]
+    assert sorted(rag.lexical.ids) == [2, 4]
+
+
+if __name__ == "__main__":
+    test_insert_and_search()
+    test_remove_and_compaction()
+    test_snapshot_round_trip()
+    test_delete_session_removes_messages_from_indexes()
+    test_rag_trims_index_to_history_window()
+    print("✅ 向量索引测试通过")
@@ -0,0 +1,75 @@
+"""
+测试本地音频存储清理
+验证只清理聊天记录不再引用的音频，被引用的文件超过保留期或容量上限时仍然保留
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import time
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.llm.audio_store import AudioStore
+from app.models.chat_messages import ChatMessages
+
+
+def _save(data: bytes, age_seconds: float = 0):
+    url = AudioStore.save_bytes(data)
+    path = AudioStore.path_for(*AudioStore.parse_filename(url.rsplit("/", 1)[-1]))
+    if age_seconds:
+        old = time.time() - age_seconds
+        os.utime(path, (old, old))
+    return url, path
+
+
+def test_gc_keeps_referenced_files(tmp_path):
+    """超过保留期的文件只有在未被引用时才删除"""
+    AudioStore.ROOT = tmp_path / "audio"
+    referenced_url, referenced_path = _save(b"referenced", age_seconds=7200)
+    orphan_url, orphan_path = _save(b"orphan", age_seconds=7200)
+
+    stats = AudioStore.gc(max_age_seconds=3600, referenced={referenced_url.rsplit("/", 1)[-1]})
+    assert stats["removed"] == 1
+    assert referenced_path.exists() and not orphan_path.exists()
+
+
+def test_gc_size_limit_skips_referenced_and_recent(tmp_path):
+    """容量清理只删除未引用且已过宽限期的文件"""
+    AudioStore.ROOT = tmp_path / "audio"
+    referenced_url, referenced_path = _save(b"a" * 100, age_seconds=7200)
+    _, old_path = _save(b"b" * 100, age_seconds=7200)
+    _, recent_path = _save(b"c" * 100)
+
+    stats = AudioStore.gc(max_total_bytes=0, referenced={referenced_url.rsplit("/", 1)[-1]})
+    assert stats["removed"] == 1 and stats["remaining_bytes"] == 200
+    assert referenced_path.exists() and recent_path.exists() and not old_path.exists()
+
+
+def test_referenced_filenames_from_metadata(tmp_path):
+    """从消息元数据的 audio_url 与 audio_segments 中收集本地文件名"""
+    engine = create_engine("sqlite://", echo=False)
+    ChatMessages.__table__.create(bind=engine)
+    db = sessionmaker(bind=engine)()
+    a = "0" * 64 + ".wav"
+    b = "1" * 64 + ".wav"
+    db.add_all([
+        ChatMessages(session_id=1, query_content="", answer_content="", message_metadata={"audio_url": f"/api/audio/{a}"}),
+        ChatMessages(session_id=1, query_content="", answer_content="", message_metadata={"audio_segments": [f"http://host/api/audio/{b}"]}),
+        ChatMessages(session_id=1, query_content="", answer_content="", message_metadata={"audio_url": "https://oss.example.com/x.wav"}),
+        ChatMessages(session_id=1, query_content="", answer_content="", message_metadata=None),
+    ])
+    db.commit()
+
+    AudioStore.REFERENCE_SCAN_BATCH = 1
+    assert AudioStore.referenced_filenames(db) == {a, b}
+    db.close()
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+    for test in (test_gc_keeps_referenced_files, test_gc_size_limit_skips_referenced_and_recent,
+                 test_referenced_filenames_from_metadata):
+        with tempfile.TemporaryDirectory() as tmp:
+            test(Path(tmp))
+    print("✅ 音频存储清理测试通过")
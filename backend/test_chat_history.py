@@ -0,0 +1,71 @@
+"""
+测试 RAG 聊天记录加载
+验证用户最近聊天记录、角色名与用户名由一次查询取回，列式结果与 JSON 拼装正确
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, event, text
+from app.db.migrations import run_migrations
+from app.llm.sql import CyberSQL
+
+
+def _make_engine():
+    engine = create_engine("sqlite://", echo=False)
+    run_migrations(engine)
+    base = datetime(2026, 1, 1, 12, 0, 0)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO user (id, username, password) VALUES (1, 'harry', 'x')"))
+        conn.execute(text("INSERT INTO role (id, user_id, name) VALUES (1, 0, '赫敏'), (2, 0, '罗恩')"))
+        conn.execute(text("INSERT INTO chat_sessions (id, user_id, role_id, created_at) VALUES (1, 1, 1, :t), (2, 1, 2, :t)"), {"t": base})
+        for i in range(4):
+            conn.execute(text(
+                "INSERT INTO chat_messages (session_id, query_content, answer_content, message_type, created_at, response_at) "
+                "VALUES (:session_id, :query, :answer, 'text', :t, :t)"
+            ), {"session_id": 1 + i % 2, "query": f"问题{i}", "answer": f"回答{i}", "t": base + timedelta(minutes=i)})
+    return engine
+
+
+def test_history_json_uses_one_query():
+    """角色名与用户名随聊天记录一次查询取回"""
+    engine = _make_engine()
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    history = CyberSQL(engine).get_user_chat_history_json(1, limit=3)
+    assert len(statements) == 1
+    assert history["username"] == "harry" and history["total_messages"] == 3
+    conversations = {s["session_id"]: s for s in history["latest_conversations"]}
+    assert conversations[1]["role_name"] == "赫敏" and conversations[2]["role_name"] == "罗恩"
+    # 只取最近 3 条，按时间正序
+    assert [c["user_query"]["content"] for c in conversations[2]["conversations"]] == ["问题1", "问题3"]
+    assert [c["user_query"]["content"] for c in conversations[1]["conversations"]] == ["问题2"]
+
+
+def test_empty_history():
+    """没有聊天记录的用户返回空结果"""
+    history = CyberSQL(_make_engine()).get_user_chat_history_json(2)
+    assert history["username"] == "Unknown" and history["latest_conversations"] == []
+    assert len(CyberSQL(_make_engine()).load_user_history(2)) == 0
+
+
+def test_pairs_join_split_rows():
+    """用户消息与助手回复分两行保存时按会话配对"""
+    engine = _make_engine()
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO chat_messages (id, session_id, query_content, answer_content, message_type, created_at, response_at) "
+            "VALUES (10, 1, '分开的问题', '', 'text', :t, :t), (11, 1, '', '分开的回答', 'text', :t2, :t2)"
+        ), {"t": datetime(2026, 1, 2), "t2": datetime(2026, 1, 2, 0, 1)})
+    pairs = CyberSQL(engine).load_user_history(1).pairs()
+    assert pairs[-1] == (10, "分开的问题", "分开的回答")
+    assert len(pairs) == 5
+
+
+if __name__ == "__main__":
+    test_history_json_uses_one_query()
+    test_empty_history()
+    test_pairs_join_split_rows()
+    print("✅ 聊天记录加载测试通过")
@@ -0,0 +1,138 @@
+"""
+测试会话状态缓存
+验证缓存按会话版本号校验：写入后追加的历史与缓存未命中时重建的一致，删除消息、刷新摘要后版本变化
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import asyncio
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from app.db.session import Base
+from app.llm.embedding_store import EmbeddingStore
+from app.models.chat_messages import ChatMessages
+from app.models.chat_sessions import ChatSessions
+from app.models.content_embeddings import ContentEmbeddings
+from app.services.conversation_cache import ConversationCache, conversation_cache, next_version
+from app.services.message_service import AsyncMessageService, MessageService
+from app.services.summary_service import SummaryService
+
+
+async def _make_db():
+    engine = create_async_engine("sqlite+aiosqlite://", echo=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, tables=[ChatSessions.__table__, ChatMessages.__table__, ContentEmbeddings.__table__])
+    db = async_sessionmaker(engine, expire_on_commit=False)()
+    db.add(ChatSessions(id=1, user_id=1, role_id=1))
+    await db.commit()
+    return engine, db
+
+
+async def _save(db, user_text: str, ai_text: str):
+    # 不触发后台向量化和摘要刷新
+    schedule_message, schedule_refresh = EmbeddingStore.schedule_message, SummaryService.schedule_refresh
+    EmbeddingStore.schedule_message = SummaryService.schedule_refresh = lambda *args: None
+    try:
+        await AsyncMessageService._save_conversation(db, 1, 1, user_text, ai_text, None, "角色")
+    finally:
+        EmbeddingStore.schedule_message, SummaryService.schedule_refresh = schedule_message, schedule_refresh
+    return await db.get(ChatSessions, 1, populate_existing=True)
+
+
+def test_next_version_strictly_increases():
+    """同一进程内连续生成的版本号严格递增"""
+    versions = [next_version() for _ in range(1000)]
+    assert all(a < b for a, b in zip(versions, versions[1:]))
+
+
+def test_get_requires_matching_version():
+    """版本号不一致时视为未命中并移除旧状态"""
+    cache = ConversationCache()
+    cache.put(1, 10, [("你好", ""), ("", "你好呀")])
+    assert cache.get(1, 10).rows == [("你好", ""), ("", "你好呀")]
+    assert cache.get(1, 11) is None
+    assert cache.peek(1) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_appended_rows_match_rebuild():
+    """写入后缓存中的历史与未命中时从数据库重建的完全一致，包括超出上限后的裁剪"""
+    async def run():
+        engine, db = await _make_db()
+        conversation_cache.clear()
+        conversation_cache.put(1, 0, [])
+        for i in range(SummaryService.MAX_CONTEXT_MESSAGES // 2 + 3):
+            session = await _save(db, f"问题{i}", f"回答{i}")
+            state = conversation_cache.get(1, session.version)
+            assert state is not None, "版本连续时应在缓存上追加本轮对话"
+
+        rebuilt = MessageService._history_rows(await AsyncMessageService._get_context_messages(db, session))
+        assert state.rows == rebuilt
+        assert len(rebuilt) == SummaryService.MAX_CONTEXT_MESSAGES
+        await db.close()
+        await engine.dispose()
+    asyncio.run(run())
+
+
+def test_stale_state_is_not_extended():
+    """其他进程写入后，本进程不会在旧缓存上追加，而是丢弃缓存"""
+    async def run():
+        engine, db = await _make_db()
+        conversation_cache.clear()
+        conversation_cache.put(1, 0, [])
+        await _save(db, "第一句", "回答一")
+
+        # 模拟另一个 worker 写入了消息：数据库版本前进，本进程缓存仍是旧版本
+        stale = conversation_cache.peek(1)
+        session = await db.get(ChatSessions, 1)
+        session.version = next_version()
+        await db.commit()
+        conversation_cache.put(1, stale.version, stale.rows)
+
+        await _save(db, "第二句", "回答二")
+        assert conversation_cache.peek(1) is None
+        await db.close()
+        await engine.dispose()
+    asyncio.run(run())
+
+
+def test_delete_bumps_version():
+    """删除消息在同一事务中更新会话版本，旧版本的缓存不再命中"""
+    async def run():
+        engine, db = await _make_db()
+        conversation_cache.clear()
+        conversation_cache.put(1, 0, [])
+        session = await _save(db, "问题", "回答")
+        before = session.version
+        message = await db.get(ChatMessages, 1)
+        # 测试用户没有向量索引快照，删除时不会触及磁盘
+        assert await AsyncMessageService.delete_message(db, 1, message.id)
+
+        session = await db.get(ChatSessions, 1, populate_existing=True)
+        assert session.version > before
+        assert conversation_cache.get(1, before) is None
+        await db.close()
+        await engine.dispose()
+    asyncio.run(run())
+
+
+def test_total_count_follows_version():
+    """消息总数缓存按版本号校验，其他进程删除消息后不会返回旧的总数"""
+    MessageService._total_counts.clear()
+    session = ChatSessions(id=7, user_id=1, role_id=1, version=next_version())
+    MessageService._remember_total(session, 10)
+    assert MessageService._cached_total(session) == 10
+
+    # 另一个 worker 删除了消息：last_message_at 不变，但版本号前进
+    session.version = next_version()
+    assert MessageService._cached_total(session) is None
+
+
+if __name__ == "__main__":
+    test_next_version_strictly_increases()
+    test_get_requires_matching_version()
+    test_appended_rows_match_rebuild()
+    test_stale_state_is_not_extended()
+    test_delete_bumps_version()
+    test_total_count_follows_version()
+    print("✅ 会话状态缓存测试通过")
@@ -0,0 +1,140 @@
+"""
+测试向量化请求合并器
+验证并发的单条请求合并为批量调用、批大小上限、重复文本去重、异常传递，以及请求被取消后合并器继续工作
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import asyncio
+import threading
+from app.llm.embedding_api import EmbeddingCoalescer
+
+
+class _RecordingBatch:
+    """记录每次批量调用的输入，向量取文本长度"""
+
+    def __init__(self, fail: bool = False):
+        self.calls = []
+        self.fail = fail
+        self.lock = threading.Lock()
+
+    def __call__(self, texts):
+        with self.lock:
+            self.calls.append(list(texts))
+        if self.fail:
+            raise RuntimeError("upstream down")
+        return [[float(len(text))] for text in texts]
+
+
+def test_concurrent_requests_share_one_call():
+    """等待窗口内提交的请求合并为一次批量调用，结果按文本对应"""
+    batch = _RecordingBatch()
+    coalescer = EmbeddingCoalescer(batch, max_batch_size=10, window=0.2)
+    futures = [coalescer.submit("a" * (i + 1)) for i in range(5)]
+    assert [future.result(timeout=5) for future in futures] == [[1.0], [2.0], [3.0], [4.0], [5.0]]
+    assert len(batch.calls) == 1
+
+
+def test_batch_size_limit():
+    """超过单批上限时拆分为多次调用"""
+    batch = _RecordingBatch()
+    coalescer = EmbeddingCoalescer(batch, max_batch_size=3, window=0.2)
+    futures = [coalescer.submit(str(i)) for i in range(7)]
+    for future in futures:
+        future.result(timeout=5)
+    assert all(len(call) <= 3 for call in batch.calls)
+    assert sum(len(call) for call in batch.calls) == 7
+
+
+def test_duplicate_texts_requested_once():
+    """同一批内的重复文本只请求一次，每个请求都拿到结果"""
+    batch = _RecordingBatch()
+    coalescer = EmbeddingCoalescer(batch, max_batch_size=10, window=0.2)
+    futures = [coalescer.submit("同一句话") for _ in range(4)]
+    assert all(future.result(timeout=5) == [4.0] for future in futures)
+    assert batch.calls == [["同一句话"]]
+
+
+def test_errors_propagate_to_every_request():
+    """批量调用失败时同批的所有请求都收到异常，合并器继续工作"""
+    batch = _RecordingBatch(fail=True)
+    coalescer = EmbeddingCoalescer(batch, max_batch_size=10, window=0.2)
+    futures = [coalescer.submit(text) for text in ("x", "y")]
+    for future in futures:
+        try:
+            future.result(timeout=5)
+            assert False, "批量调用失败时应抛出异常"
+        except RuntimeError as e:
+            assert str(e) == "upstream down"
+
+    batch.fail = False
+    assert coalescer.submit("zz").result(timeout=5) == [2.0]
+
+
+def test_cancelled_requests_do_not_stop_worker():
+    """等待中的请求被取消（异步等待任务被取消）后丢弃，后台线程不退出，之后的请求照常返回"""
+    release = threading.Event()
+    batch = _RecordingBatch()
+
+    def blocking_batch(texts):
+        release.wait(5)
+        return batch(texts)
+
+    coalescer = EmbeddingCoalescer(blocking_batch, max_batch_size=10, window=0.01)
+    first = coalescer.submit("a")
+
+    async def cancel_waiting():
+        task = asyncio.ensure_future(asyncio.wrap_future(coalescer.submit("bb")))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    # 后台线程正卡在第一批，第二个请求仍在队列中时被取消
+    asyncio.run(cancel_waiting())
+    cancelled = coalescer.submit("ccc")
+    assert cancelled.cancel()
+    release.set()
+
+    assert first.result(timeout=5) == [1.0]
+    assert coalescer.submit("dddd").result(timeout=5) == [4.0]
+    assert coalescer._worker.is_alive()
+    assert ["bb"] not in batch.calls and all("ccc" not in call for call in batch.calls)
+
+
+def test_short_batch_result_fails_missing_requests():
+    """批量函数返回的向量少于请求数时，缺少结果的请求收到异常，合并器继续工作"""
+    release = threading.Event()
+    short = [True]
+
+    def batch_fn(texts):
+        release.wait(5)
+        vectors = [[float(len(text))] for text in texts]
+        return vectors[:1] if short[0] else vectors
+
+    coalescer = EmbeddingCoalescer(batch_fn, max_batch_size=10, window=0.2)
+    futures = [coalescer.submit(text) for text in ("x", "yy")]
+    release.set()
+    assert futures[0].result(timeout=5) == [1.0]
+    try:
+        futures[1].result(timeout=5)
+        assert False, "缺少结果的请求应抛出异常"
+    except RuntimeError:
+        pass
+
+    short[0] = False
+    assert coalescer.submit("zzz").result(timeout=5) == [3.0]
+    assert coalescer._worker.is_alive()
+
+
+if __name__ == "__main__":
+    test_concurrent_requests_share_one_call()
+    test_batch_size_limit()
+    test_duplicate_texts_requested_once()
+    test_errors_propagate_to_every_request()
+    test_cancelled_requests_do_not_stop_worker()
+    test_short_batch_result_fails_missing_requests()
+    print("✅ 请求合并器测试通过")
@@ -0,0 +1,99 @@
+"""
+测试内存向量索引
+验证 top-k 检索与暴力计算一致、覆盖写入、删除后矩阵保持连续，以及快照读写
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+from app.llm.embedding_index import EmbeddingIndex
+
+
+def _vectors(count: int, dim: int = 16, seed: int = 0):
+    return np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+
+
+def _brute_force(vectors, query, k):
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = normalized @ (query / np.linalg.norm(query))
+    return list(np.argsort(-scores)[:k])
+
+
+def test_search_matches_brute_force():
+    """top-k 结果与逐条计算余弦相似度一致，按相似度降序"""
+    vectors = _vectors(200)
+    index = EmbeddingIndex(initial_capacity=4)
+    index.add(range(200), vectors)
+    assert len(index) == 200
+
+    query = _vectors(1, seed=1)[0]
+    ids, scores = index.search(query, k=5)
+    assert list(ids) == _brute_force(vectors, query, 5)
+    assert all(scores[i] >= scores[i + 1] for i in range(len(scores) - 1))
+
+
+def test_add_overwrites_existing_id():
+    """重复写入同一个id时覆盖向量，不新增条目"""
+    vectors = _vectors(3)
+    index = EmbeddingIndex()
+    index.add([1, 2], vectors[:2])
+    index.add([1], vectors[2:])
+    assert len(index) == 2
+    ids, scores = index.search(vectors[2], k=1)
+    assert ids[0] == 1
+    assert abs(scores[0] - 1.0) < 1e-5
+
+
+def test_remove_keeps_index_contiguous():
+    """删除后用最后一行填补空位，其余条目仍可检索"""
+    vectors = _vectors(5)
+    index = EmbeddingIndex()
+    index.add(range(5), vectors)
+    assert index.remove(1)
+    assert not index.remove(1)
+    assert 1 not in index and len(index) == 4
+    assert sorted(index.ids) == [0, 2, 3, 4]
+    for item_id in (0, 2, 3, 4):
+        assert index.search(vectors[item_id], k=1)[0][0] == item_id
+
+
+def test_empty_and_dimension_mismatch():
+    """空索引返回空结果，维度不一致时拒绝写入"""
+    index = EmbeddingIndex()
+    ids, scores = index.search(np.ones(4), k=3)
+    assert len(ids) == 0 and len(scores) == 0
+
+    index.add([1], np.ones((1, 4)))
+    try:
+        index.add([2], np.ones((1, 5)))
+        assert False, "维度不一致时应抛出 ValueError"
+    except ValueError:
+        pass
+    assert index.search(np.ones(4), k=10)[0].tolist() == [1]
+
+
+def test_snapshot_round_trip(tmp_path):
+    """保存后读取的索引与原索引检索结果一致"""
+    vectors = _vectors(50)
+    index = EmbeddingIndex()
+    index.add(range(100, 150), vectors)
+    path = tmp_path / "flat.npz"
+    index.save(path)
+
+    loaded = EmbeddingIndex.load(path)
+    assert len(loaded) == 50
+    query = _vectors(1, seed=2)[0]
+    assert list(loaded.search(query, k=5)[0]) == list(index.search(query, k=5)[0])
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+    test_search_matches_brute_force()
+    test_add_overwrites_existing_id()
+    test_remove_keeps_index_contiguous()
+    test_empty_and_dimension_mismatch()
+    with tempfile.TemporaryDirectory() as tmp:
+        test_snapshot_round_trip(Path(tmp))
+    print("✅ 向量索引测试通过")
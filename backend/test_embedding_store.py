@@ -0,0 +1,92 @@
+"""
+测试文本向量持久化
+验证批量保存时重复记录只跳过冲突的那一行，其余向量照常写入，删除消息或会话时一并删除其向量
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+from sqlalchemy import create_engine, func, text
+from sqlalchemy.orm import sessionmaker
+from app.db.migrations import run_migrations
+from app.llm.embedding_store import EmbeddingStore
+from app.llm.vector_snapshot import VectorSnapshot
+from app.models.content_embeddings import ContentEmbeddings
+from app.services.message_service import MessageService
+from app.services.session_service import SessionService
+
+
+def _make_session(tmp_path):
+    # 快照目录指向空目录，只验证数据库读写
+    VectorSnapshot.root = tmp_path / "snapshots"
+    VectorSnapshot._opened.clear()
+    engine = create_engine("sqlite://", echo=False)
+    ContentEmbeddings.__table__.create(bind=engine)
+    return sessionmaker(bind=engine)()
+
+
+def test_save_skips_only_duplicates(tmp_path):
+    """同一批中已存在的记录被跳过，新的向量全部保存"""
+    db = _make_session(tmp_path)
+    vectors = np.random.default_rng(0).standard_normal((4, 8)).astype(np.float32)
+    EmbeddingStore.save(db, EmbeddingStore.CHAT_MESSAGE, [(1, vectors[0])])
+
+    # id=1 已存在（另一个 worker 抢先写入），其余三条必须照常写入
+    EmbeddingStore.save(db, EmbeddingStore.CHAT_MESSAGE, [(1, vectors[3]), (2, vectors[1]), (3, vectors[2])])
+    assert db.query(func.count(ContentEmbeddings.id)).scalar() == 3
+
+    loaded = EmbeddingStore.load(db, EmbeddingStore.CHAT_MESSAGE, [1, 2, 3, 4])
+    assert sorted(loaded) == [1, 2, 3]
+    # 已存在的记录保持原值
+    assert np.allclose(loaded[1], vectors[0])
+    assert np.allclose(loaded[3], vectors[2])
+    db.close()
+
+
+def test_load_filters_by_source_type_and_model(tmp_path):
+    """不同来源类型、不同模型的向量互不混用"""
+    db = _make_session(tmp_path)
+    vector = np.ones(4, dtype=np.float32)
+    EmbeddingStore.save(db, EmbeddingStore.ROLE_SETTING, [(7, vector)])
+    EmbeddingStore.save(db, EmbeddingStore.ROLE_SETTING, [(8, vector)], model="other-model")
+
+    assert sorted(EmbeddingStore.load(db, EmbeddingStore.ROLE_SETTING, [7, 8])) == [7]
+    assert EmbeddingStore.load(db, EmbeddingStore.CHAT_MESSAGE, [7]) == {}
+    db.close()
+
+
+def test_deleting_messages_removes_embeddings(tmp_path):
+    """删除消息、删除会话时在同一事务中删除对应的向量，其他来源的向量不受影响"""
+    VectorSnapshot.root = tmp_path / "snapshots"
+    VectorSnapshot._opened.clear()
+    engine = create_engine("sqlite://", echo=False)
+    run_migrations(engine)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO chat_sessions (id, user_id, role_id, created_at) VALUES (1, 7, 1, CURRENT_TIMESTAMP), (2, 7, 1, CURRENT_TIMESTAMP)"))
+        for message_id, session_id in ((1, 1), (2, 1), (3, 2)):
+            conn.execute(text(
+                "INSERT INTO chat_messages (id, session_id, query_content, answer_content, message_type, created_at, response_at) "
+                "VALUES (:id, :session_id, 'q', 'a', 'text', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)"
+            ), {"id": message_id, "session_id": session_id})
+    db = sessionmaker(bind=engine)()
+    vector = np.ones(4, dtype=np.float32)
+    EmbeddingStore.save(db, EmbeddingStore.CHAT_MESSAGE, [(1, vector), (2, vector), (3, vector)])
+    EmbeddingStore.save(db, EmbeddingStore.ROLE_SETTING, [(3, vector)])
+
+    assert MessageService.delete_message(db, 7, 3)
+    assert sorted(EmbeddingStore.load(db, EmbeddingStore.CHAT_MESSAGE, [1, 2, 3])) == [1, 2]
+    assert SessionService.delete_session(db, 1, user_id=7)
+    assert EmbeddingStore.load(db, EmbeddingStore.CHAT_MESSAGE, [1, 2, 3]) == {}
+    assert sorted(EmbeddingStore.load(db, EmbeddingStore.ROLE_SETTING, [3])) == [3]
+    db.close()
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+    with tempfile.TemporaryDirectory() as tmp:
+        test_save_skips_only_duplicates(Path(tmp))
+        test_load_filters_by_source_type_and_model(Path(tmp))
+        test_deleting_messages_removes_embeddings(Path(tmp))
+    print("✅ 向量持久化测试通过")
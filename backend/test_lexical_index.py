@@ -0,0 +1,89 @@
+"""
+测试倒排索引与混合检索
+验证中英文切词、BM25 排序、打分时按可返回集合过滤、跳过向量检索的条件与倒数排名融合
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.llm.lexical_index import BM25Index, HybridSearch, reciprocal_rank_fusion, tokenize
+
+
+def test_tokenize():
+    """汉字段切为 bigram，单字成段时保留单字，英文转小写后按词切分"""
+    assert tokenize("守护神咒") == ["守护", "护神", "神咒"]
+    assert tokenize("我 Expecto Patronum 2024") == ["我", "expecto", "patronum", "2024"]
+    assert tokenize("魔杖，扫帚！") == ["魔杖", "扫帚"]
+    assert tokenize("") == [] and tokenize(None) == []
+
+
+def test_bm25_ranking():
+    """命中更多、更稀有的查询词的文档排在前面；删除后不再返回"""
+    index = BM25Index()
+    index.add([1, 2, 3], ["我会守护神咒", "今天天气很好", "守护神咒需要快乐的回忆"])
+    ids, scores, coverages = index.search("守护神咒", k=10)
+    assert set(ids.tolist()) == {1, 3}
+    assert list(scores) == sorted(scores, reverse=True)
+    assert all(coverage == 1.0 for coverage in coverages)
+    # 较短的文档在词频相同时得分更高
+    assert ids[0] == 1
+
+    ids, _, _ = index.search("守护神咒 回忆", k=10)
+    assert ids[0] == 3
+    # 覆盖率下限过滤只命中个别查询词的文档
+    assert index.search("天气 守护神咒 回忆", min_coverage=0.7)[0].tolist() == [3]
+
+    assert index.remove(3) and 3 not in index
+    assert index.search("回忆")[0].tolist() == []
+    assert sorted(index.ids) == [1, 2]
+
+
+def test_allowed_applied_while_scoring():
+    """可返回集合在打分时过滤：得分更高的文档再多也不会挤掉集合内的结果"""
+    index = BM25Index()
+    index.add(range(30), ["飞路粉 对角巷"] * 30)
+    index.add([100], ["飞路粉 很久以前的对话 对角巷"])
+    ids, _ = HybridSearch.lexical(index, "飞路粉", allowed={100})
+    assert ids == [100]
+    assert index.search("飞路粉", k=5, allowed={100, 3})[0].tolist() == [3, 100]
+
+
+def test_short_queries_do_not_skip_semantic_search():
+    """查询词少于 LEXICAL_ONLY_MIN_TERMS 时即使全部命中也要做向量检索"""
+    index = BM25Index()
+    index.add([1, 2], ["我的魔杖是冬青木做的", "我喜欢吃巧克力蛙"])
+    assert HybridSearch.LEXICAL_ONLY_MIN_TERMS == 3
+    ids, confident = HybridSearch.lexical(index, "魔杖")
+    assert ids == [1] and not confident
+    ids, confident = HybridSearch.lexical(index, "魔杖是冬青木")
+    assert ids == [1] and confident
+
+    calls = []
+
+    def embed(text):
+        calls.append(text)
+        raise RuntimeError("embedding service down")
+
+    # 向量化失败时退回词面结果
+    assert HybridSearch.search(index, None, "魔杖", embed) == [1]
+    assert calls == ["魔杖"]
+    assert HybridSearch.search(index, None, "魔杖是冬青木", embed) == [1]
+    assert calls == ["魔杖"]
+
+
+def test_reciprocal_rank_fusion():
+    """两路都靠前的结果融合后排第一，只出现在一路的按名次计分"""
+    fused = reciprocal_rank_fusion([[1, 2, 3], [2, 4, 1]], k=60)
+    assert [item_id for item_id, _ in fused] == [2, 1, 4, 3]
+    assert abs(dict(fused)[2] - (1 / 62 + 1 / 61)) < 1e-12
+    assert reciprocal_rank_fusion([[1, 2, 3], [2, 4, 1]], k=60, top_k=2) == fused[:2]
+    assert HybridSearch.fuse([5, 6], [], top_k=1) == [5]
+
+
+if __name__ == "__main__":
+    test_tokenize()
+    test_bm25_ranking()
+    test_allowed_applied_while_scoring()
+    test_short_queries_do_not_skip_semantic_search()
+    test_reciprocal_rank_fusion()
+    print("✅ 倒排索引与混合检索测试通过")
@@ -0,0 +1,115 @@
+"""
+测试聊天上下文的历史消息
+验证摘要未覆盖的消息全部以原文进入上下文，同一时刻写入的消息按 id 保持顺序，消息时间取自同一时钟
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from datetime import datetime
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from fastapi import HTTPException
+from app.models.chat_messages import ChatMessages
+from app.models.chat_sessions import ChatSessions
+from app.models.content_embeddings import ContentEmbeddings
+from app.services.message_service import MessageService
+from app.schemas.message import MessageCreate
+from app.services.summary_service import SummaryService
+
+
+def _make_session():
+    engine = create_engine("sqlite://", echo=False)
+    ChatSessions.__table__.create(bind=engine)
+    ChatMessages.__table__.create(bind=engine)
+    ContentEmbeddings.__table__.create(bind=engine)
+    return sessionmaker(bind=engine)()
+
+
+def _add_turns(db, session_id: int, turns: int, created_at: datetime = None):
+    created_at = created_at or datetime(2025, 1, 1, 12, 0, 0)
+    for i in range(turns):
+        db.add_all(MessageService._new_turn(session_id, f"问题{i}", f"回答{i}", None, None, "text", created_at))
+    db.commit()
+
+
+def test_pending_messages_stay_in_context():
+    """已移出最近窗口、尚未并入摘要的消息仍以原文进入上下文"""
+    db = _make_session()
+    session = ChatSessions(id=1, user_id=1, role_id=1, summary="早期摘要", summary_message_id=4)
+    db.add(session)
+    db.commit()
+    # 共 30 条消息：1-4 已并入摘要，5-30 中有 16 条已移出最近窗口但还未达到刷新阈值
+    _add_turns(db, 1, 15)
+    assert len(SummaryService._pending_messages(db, session)) == 16
+
+    context_ids = [msg.id for msg in MessageService._get_context_messages(db, session)]
+    assert sorted(context_ids) == list(range(5, 31))
+    db.close()
+
+
+def test_context_order_breaks_ties_by_id():
+    """同一时刻写入的一轮对话按 id 倒序返回，用户提问排在助手回复之前"""
+    db = _make_session()
+    session = ChatSessions(id=1, user_id=1, role_id=1)
+    db.add(session)
+    db.commit()
+    _add_turns(db, 1, 3)
+
+    context = MessageService._get_context_messages(db, session)
+    assert [msg.id for msg in context] == [6, 5, 4, 3, 2, 1]
+    db.close()
+
+
+def test_message_list_breaks_ties_by_id():
+    """分页接口同样按 id 区分同一秒写入的消息，最新的在前"""
+    db = _make_session()
+    db.add(ChatSessions(id=1, user_id=1, role_id=1))
+    db.commit()
+    _add_turns(db, 1, 2)
+
+    result = MessageService.get_messages_by_session(db, 1, 1, page=1, page_size=3)
+    assert [msg.id for msg in result["messages"]] == [4, 3, 2]
+    assert [msg.role for msg in result["messages"]] == [0, 1, 0]
+    db.close()
+
+
+def test_turn_uses_one_clock():
+    """一轮对话的 created_at / response_at 与会话 last_message_at 取自同一个应用时间"""
+    db = _make_session()
+    db.add(ChatSessions(id=1, user_id=1, role_id=1))
+    db.commit()
+    saved = MessageService.save_turn(db, 1, 1, "", "回答")
+
+    session = db.get(ChatSessions, 1)
+    messages = db.query(ChatMessages).all()
+    assert session.last_message_at == saved["last_message_at"]
+    assert {msg.created_at for msg in messages} == {msg.response_at for msg in messages} == {saved["last_message_at"]}
+    db.close()
+
+
+def test_message_permission_checks():
+    """同步接口与异步接口共用带 user_id 条件的查询：其他用户无法读取或删除消息"""
+    db = _make_session()
+    db.add(ChatSessions(id=1, user_id=1, role_id=1))
+    db.commit()
+    created = MessageService.create_message(db, 1, MessageCreate(session_id=1, role=0, content="回答"))
+    assert MessageService.get_message_by_id(db, 1, created.id).content == "回答"
+
+    for call in (MessageService.get_message_by_id, MessageService.delete_message):
+        try:
+            call(db, 2, created.id)
+            assert False, "其他用户访问时应返回 404"
+        except HTTPException as e:
+            assert e.status_code == 404
+    assert MessageService.delete_message(db, 1, created.id)
+    db.close()
+
+
+if __name__ == "__main__":
+    test_pending_messages_stay_in_context()
+    test_context_order_breaks_ties_by_id()
+    test_message_list_breaks_ties_by_id()
+    test_turn_uses_one_clock()
+    test_message_permission_checks()
+    print("✅ 上下文历史测试通过")
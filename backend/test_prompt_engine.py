@@ -0,0 +1,96 @@
+"""
+测试角色提示词编译缓存
+验证基础提示词的优先级、角色数据未变化时复用编译结果、切片较多时改为检索，以及 LRU 淘汰
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.db.session import Base
+from app.llm.context_builder import estimate_tokens
+from app.llm.prompt import Prompt
+from app.llm.role_lore import RoleLore
+from app.models.role import Role
+from app.models.role_settings import RoleSettings
+from app.services.prompt_engine import GENERIC_TEMPLATE, PromptEngine
+from app.services.role_catalog import RoleEntry, role_catalog
+
+
+def _entry(role_id: int, name: str, user_id: int = 7, preset_prompt: str = None, clips=()):
+    return RoleEntry(role_id, user_id, name, None, preset_prompt, None, tuple(clips), tuple(range(len(clips))))
+
+
+def test_base_prompt_priority():
+    """内置提示词只用于系统角色，其次是 preset_prompt，最后是通用模板"""
+    engine = PromptEngine()
+    assert engine.compile(_entry(1, "哈利波特", user_id=0, preset_prompt="库中设定")).system_prompt == Prompt.harry_potter
+    # 用户创建的同名角色不使用内置提示词
+    assert engine.compile(_entry(2, "哈利波特", preset_prompt=" 自定义设定 ")).system_prompt == "自定义设定"
+    assert engine.compile(_entry(3, "路人", preset_prompt="   ")).system_prompt == GENERIC_TEMPLATE.format(name="路人")
+
+
+def test_compile_reuses_until_entry_changes():
+    """同一个 RoleEntry 只编译一次，角色目录返回新的 RoleEntry 后重新编译"""
+    engine = PromptEngine()
+    entry = _entry(1, "角色", preset_prompt="设定", clips=["切片一", "切片二"])
+    compiled = engine.compile(entry)
+    assert engine.compile(entry) is compiled
+    assert compiled.clip_tokens == (estimate_tokens("切片一"), estimate_tokens("切片二"))
+    assert compiled.system_tokens == estimate_tokens("设定")
+
+    updated = engine.compile(_entry(1, "角色", preset_prompt="新设定"))
+    assert updated is not compiled and updated.system_prompt == "新设定"
+    assert engine.stats()["compiles"] == 2
+
+
+def test_many_clips_switch_to_retrieval():
+    """切片数超过 ROLE_LORE_FULL_CLIPS 时改为每轮检索，不全部放入上下文"""
+    engine = PromptEngine()
+    limit = RoleLore.FULL_CONTEXT_CLIPS
+    assert not engine.compile(_entry(1, "少", clips=[f"切片{i}" for i in range(limit)])).retrieve_clips
+    assert engine.compile(_entry(2, "多", clips=[f"切片{i}" for i in range(limit + 1)])).retrieve_clips
+
+
+def test_lru_eviction():
+    """超出容量时淘汰最久未使用的编译结果"""
+    engine = PromptEngine(max_prompts=2)
+    first = _entry(1, "一")
+    engine.compile(first)
+    engine.compile(_entry(2, "二"))
+    engine.compile(first)
+    engine.compile(_entry(3, "三"))
+    assert engine.stats()["prompts"] == 2
+    assert set(engine._compiled) == {1, 3}
+
+
+def test_for_role_reads_role_catalog():
+    """按角色id经角色目录编译，角色不存在时返回 None"""
+    engine = create_engine("sqlite://", echo=False)
+    Base.metadata.create_all(engine, tables=[Role.__table__, RoleSettings.__table__])
+    db = sessionmaker(bind=engine)()
+    db.add_all([
+        Role(id=1, user_id=0, name="苏格拉底"),
+        RoleSettings(role_id=1, clip_index=1, total_clips=1, setting_text="爱提问"),
+    ])
+    db.commit()
+
+    role_catalog.clear()
+    prompt_engine = PromptEngine()
+    compiled = prompt_engine.for_role(db, 1)
+    assert compiled.role_name == "苏格拉底" and compiled.system_prompt == Prompt.Socrates
+    assert compiled.clips == ("爱提问",)
+    assert prompt_engine.for_role(db, 1) is compiled
+    assert prompt_engine.for_role(db, 2) is None
+    role_catalog.clear()
+    db.close()
+
+
+if __name__ == "__main__":
+    test_base_prompt_priority()
+    test_compile_reuses_until_entry_changes()
+    test_many_clips_switch_to_retrieval()
+    test_lru_eviction()
+    test_for_role_reads_role_catalog()
+    print("✅ 提示词编译测试通过")
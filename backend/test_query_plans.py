@@ -0,0 +1,56 @@
+"""
+测试数据库迁移与热点查询执行计划
+验证迁移可重复执行，且聊天相关的热点查询都走索引而不是全表扫描
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import create_engine, text
+from app.db.migrations import MIGRATIONS, run_migrations, check_query_plans
+
+
+def _make_engine():
+    return create_engine("sqlite://", echo=False)
+
+
+def test_migrations_are_idempotent():
+    """重复执行迁移只会记录一次版本"""
+    engine = _make_engine()
+    assert run_migrations(engine) == MIGRATIONS[-1][0]
+    assert run_migrations(engine) == MIGRATIONS[-1][0]
+    with engine.connect() as conn:
+        count = conn.execute(text("SELECT COUNT(*) FROM schema_version")).scalar()
+    assert count == len(MIGRATIONS)
+
+
+def test_upgrade_existing_tables():
+    """已存在的旧表结构（无摘要列、无索引）迁移后补齐"""
+    engine = _make_engine()
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE user (id INTEGER PRIMARY KEY, username VARCHAR(50) NOT NULL)"))
+        conn.execute(text("CREATE TABLE role (id INTEGER PRIMARY KEY, name VARCHAR(50) NOT NULL)"))
+        conn.execute(text("CREATE TABLE chat_sessions (id INTEGER PRIMARY KEY, user_id INT NOT NULL, role_id INT NOT NULL, last_message_at TIMESTAMP, created_at TIMESTAMP NOT NULL)"))
+        conn.execute(text("CREATE TABLE chat_messages (id INTEGER PRIMARY KEY, session_id INT NOT NULL, query_content TEXT NOT NULL, answer_content TEXT NOT NULL, message_type VARCHAR(20) NOT NULL, message_metadata JSON, created_at TIMESTAMP NOT NULL, response_at TIMESTAMP NOT NULL)"))
+    plans = check_query_plans(engine)
+    assert plans["recent_messages"] == ["chat_messages"]
+
+    run_migrations(engine)
+    with engine.connect() as conn:
+        columns = {row[1] for row in conn.execute(text("PRAGMA table_info(chat_sessions)"))}
+    assert {"summary", "summary_message_id", "version"} <= columns
+
+
+def test_hot_queries_use_indexes():
+    """迁移后热点查询不再全表扫描"""
+    engine = _make_engine()
+    run_migrations(engine)
+    for name, tables in check_query_plans(engine).items():
+        assert not tables, f"{name} 全表扫描: {tables}"
+
+
+if __name__ == "__main__":
+    test_migrations_are_idempotent()
+    test_upgrade_existing_tables()
+    test_hot_queries_use_indexes()
+    print("✅ 迁移与执行计划检查通过")
@@ -0,0 +1,142 @@
+"""
+测试主库 / 只读副本路由
+用两个 SQLite 文件分别充当主库和副本，验证只读查询走副本、写入后该客户端的读请求回到主库，
+且读己之写只作用于写入的客户端，不会把其他客户端的读请求也留在主库
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import asyncio
+import time
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import Column, MetaData, String, Table, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from app.db import async_session
+from app.db.async_session import (
+    STICKY_COOKIE, STICKY_HEADER, DatabaseRouter, ReplicaStickinessMiddleware, RoutingSession, mark_written, use_replica
+)
+
+
+marker = Table("marker", MetaData(), Column("source", String(20)))
+
+
+def _make_router(tmp_path):
+    """主库和副本各一个 SQLite 文件，表中的 source 字段标明数据来自哪个库"""
+    router = DatabaseRouter(
+        f"sqlite+aiosqlite:///{tmp_path / 'primary.db'}",
+        [f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}"],
+        sticky_seconds=5
+    )
+
+    async def init():
+        for engine, source in ((router.primary, "primary"), (router.replicas[0], "replica")):
+            async with engine.begin() as conn:
+                await conn.run_sync(marker.metadata.create_all)
+                await conn.execute(marker.insert().values(source=source))
+    asyncio.run(init())
+    return router
+
+
+def _make_app(router):
+    session_factory = async_sessionmaker(bind=router.primary, sync_session_class=RoutingSession, expire_on_commit=False)
+
+    async def get_db():
+        async with session_factory() as db:
+            yield db
+
+    app = FastAPI()
+    app.add_middleware(ReplicaStickinessMiddleware)
+
+    @app.get("/read")
+    async def read(db: AsyncSession = Depends(get_db)):
+        use_replica(db)
+        return {"source": (await db.execute(select(marker.c.source))).scalar_one()}
+
+    @app.post("/write")
+    async def write(db: AsyncSession = Depends(get_db)):
+        await db.execute(update(marker).values(source=marker.c.source))
+        await db.commit()
+        mark_written()
+        return {"ok": True}
+
+    return app
+
+
+def _with_router(tmp_path, check):
+    router = _make_router(tmp_path)
+    original = async_session.db_router
+    async_session.db_router = router
+    try:
+        check(_make_app(router))
+    finally:
+        async_session.db_router = original
+        asyncio.run(router.dispose())
+
+
+def test_reads_go_to_replica(tmp_path):
+    """未写入过的客户端，只读查询路由到副本"""
+    def check(app):
+        with TestClient(app) as client:
+            response = client.get("/read")
+            assert response.json() == {"source": "replica"}
+            assert STICKY_COOKIE not in response.cookies
+    _with_router(tmp_path, check)
+
+
+def test_writer_reads_own_writes(tmp_path):
+    """写入后响应带上写入时间，同一客户端随后的读取走主库，其他客户端仍读副本"""
+    def check(app):
+        with TestClient(app) as writer, TestClient(app) as other:
+            response = writer.post("/write")
+            assert STICKY_HEADER in response.headers
+            assert STICKY_COOKIE in response.cookies
+            # Cookie 由客户端保存并回传，换到任意 worker 都能判断
+            assert writer.get("/read").json() == {"source": "primary"}
+            assert other.get("/read").json() == {"source": "replica"}
+    _with_router(tmp_path, check)
+
+
+def test_header_and_expiry(tmp_path):
+    """不使用 Cookie 的客户端可通过请求头回传写入时间，超过粘滞时间后重新读副本"""
+    def check(app):
+        with TestClient(app) as client:
+            assert client.get("/read", headers={STICKY_HEADER: f"{time.time():.3f}"}).json() == {"source": "primary"}
+            assert client.get("/read", headers={STICKY_HEADER: f"{time.time() - 60:.3f}"}).json() == {"source": "replica"}
+            assert client.get("/read", headers={STICKY_HEADER: "invalid"}).json() == {"source": "replica"}
+    _with_router(tmp_path, check)
+
+
+def test_session_stays_on_primary_after_write(tmp_path):
+    """同一个会话写入之后的查询走主库，不在请求上下文中时 mark_written 不报错"""
+    router = _make_router(tmp_path)
+    original = async_session.db_router
+    async_session.db_router = router
+
+    async def run():
+        session_factory = async_sessionmaker(bind=router.primary, sync_session_class=RoutingSession)
+        try:
+            async with session_factory() as db:
+                use_replica(db)
+                assert (await db.execute(select(marker.c.source))).scalar_one() == "replica"
+                await db.execute(update(marker).values(source=marker.c.source))
+                mark_written()
+                assert (await db.execute(select(marker.c.source))).scalar_one() == "primary"
+        finally:
+            await router.dispose()
+
+    try:
+        asyncio.run(run())
+    finally:
+        async_session.db_router = original
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+    for test in (test_reads_go_to_replica, test_writer_reads_own_writes, test_header_and_expiry,
+                 test_session_stays_on_primary_after_write):
+        with tempfile.TemporaryDirectory() as tmp:
+            test(Path(tmp))
+    print("✅ 读写分离路由测试通过")
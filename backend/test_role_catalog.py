@@ -0,0 +1,136 @@
+"""
+测试角色目录缓存
+验证按 id / 角色名查找、设定切片排序、系统角色列表、失效、TTL 过期与 LRU 淘汰
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import asyncio
+import time
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from app.db.session import Base
+from app.models.role import Role
+from app.models.role_settings import RoleSettings
+from app.services.role_catalog import RoleCatalog
+
+TABLES = [Role.__table__, RoleSettings.__table__]
+
+
+def _seed(db):
+    db.add_all([
+        Role(id=1, user_id=0, name="哈利波特", preset_prompt="系统角色"),
+        Role(id=2, user_id=0, name="苏格拉底"),
+        Role(id=3, user_id=7, name="用户角色", preset_prompt="用户设定"),
+        # 切片故意乱序写入
+        RoleSettings(id=10, role_id=3, clip_index=2, total_clips=2, setting_text="第二条"),
+        RoleSettings(id=11, role_id=3, clip_index=1, total_clips=2, setting_text="第一条"),
+    ])
+    db.commit()
+
+
+def _make_session():
+    engine = create_engine("sqlite://", echo=False)
+    Base.metadata.create_all(engine, tables=TABLES)
+    db = sessionmaker(bind=engine)()
+    _seed(db)
+    return db
+
+
+def test_get_orders_clips_and_caches():
+    """切片按 clip_index 排序，第二次查找命中缓存"""
+    db = _make_session()
+    catalog = RoleCatalog()
+    entry = catalog.get(db, 3)
+    assert entry.clips == ("第一条", "第二条")
+    assert entry.clip_ids == (11, 10)
+    assert catalog.get(db, 3) is entry
+    assert catalog.get(db, 99) is None
+    stats = catalog.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 2
+    db.close()
+
+
+def test_get_by_name_and_invalidate():
+    """按角色名查找；改名并失效后旧名字不再命中"""
+    db = _make_session()
+    catalog = RoleCatalog()
+    assert catalog.get_by_name(db, "苏格拉底").id == 2
+
+    db.get(Role, 2).name = "柏拉图"
+    db.commit()
+    # 未失效时仍返回缓存中的旧数据
+    assert catalog.get_by_name(db, "苏格拉底").id == 2
+    catalog.invalidate(2)
+    assert catalog.get_by_name(db, "苏格拉底") is None
+    assert catalog.get_by_name(db, "柏拉图").id == 2
+    db.close()
+
+
+def test_system_roles_cached_until_invalidated():
+    """系统角色列表只包含 user_id=0 的角色，缓存到下一次失效"""
+    db = _make_session()
+    catalog = RoleCatalog()
+    assert sorted(entry.id for entry in catalog.system_roles(db)) == [1, 2]
+
+    db.add(Role(id=4, user_id=0, name="哈姆雷特"))
+    db.commit()
+    assert sorted(entry.id for entry in catalog.system_roles(db)) == [1, 2]
+    catalog.invalidate(4)
+    assert sorted(entry.id for entry in catalog.system_roles(db)) == [1, 2, 4]
+    db.close()
+
+
+def test_ttl_expiry_reloads():
+    """超过 TTL 后重新从数据库加载，其他进程的修改因此最终生效"""
+    db = _make_session()
+    catalog = RoleCatalog(ttl=0.01)
+    assert catalog.get(db, 3).preset_prompt == "用户设定"
+    db.get(Role, 3).preset_prompt = "新的设定"
+    db.commit()
+    time.sleep(0.02)
+    assert catalog.get(db, 3).preset_prompt == "新的设定"
+    db.close()
+
+
+def test_lru_eviction_drops_name_index():
+    """超出容量时淘汰最久未使用的角色，名字索引一并清理"""
+    db = _make_session()
+    catalog = RoleCatalog(max_roles=2)
+    catalog.get(db, 1)
+    catalog.get(db, 2)
+    catalog.get(db, 1)
+    catalog.get(db, 3)
+    assert catalog.stats()["roles"] == 2
+    assert "苏格拉底" not in catalog._id_by_name
+    assert catalog._lookup(1) is not None and catalog._lookup(2) is None
+    db.close()
+
+
+def test_async_lookups():
+    """异步接口与同步接口返回相同的数据"""
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite://", echo=False)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all, tables=TABLES)
+        async with async_sessionmaker(engine)() as db:
+            await db.run_sync(lambda session: _seed(session))
+            catalog = RoleCatalog()
+            entry = await catalog.aget(db, 3)
+            assert entry.clips == ("第一条", "第二条")
+            assert (await catalog.aget_by_name(db, "用户角色")) is entry
+            assert sorted(e.id for e in await catalog.asystem_roles(db)) == [1, 2]
+        await engine.dispose()
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_get_orders_clips_and_caches()
+    test_get_by_name_and_invalidate()
+    test_system_roles_cached_until_invalidated()
+    test_ttl_expiry_reloads()
+    test_lru_eviction_drops_name_index()
+    test_async_lookups()
+    print("✅ 角色目录测试通过")
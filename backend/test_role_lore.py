@@ -0,0 +1,141 @@
+"""
+测试角色设定检索
+验证切片数超过 ROLE_LORE_FULL_CLIPS 的角色只取与提问相关的 top-k 切片，检索失败时退回到最靠前的切片，
+检索结果与历史对话共用上下文 token 预算
+向量化接口与向量持久化用确定性的假实现代替
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import asyncio
+import numpy as np
+from app.llm.context_builder import estimate_message_tokens
+from app.llm.embedding_api import Embedding
+from app.llm.embedding_store import EmbeddingStore
+from app.llm.llm_api import LLM
+from app.llm.role_lore import RoleLore
+from app.services.message_service import MessageService
+from app.services.prompt_engine import CompiledPrompt
+
+CLIPS = (
+    "我出生在女贞路四号的姨妈家",
+    "我的魔杖是冬青木和凤凰羽毛做的",
+    "我在霍格沃茨的格兰芬多学院",
+    "我最好的朋友是罗恩和赫敏",
+    "我的猫头鹰叫海德薇",
+    "我是魁地奇球队的找球手",
+    "我额头上有一道闪电形伤疤",
+    "我的教父是小天狼星布莱克",
+    "我害怕摄魂怪",
+    "我在对角巷第一次见到海格的巫师世界",
+)
+CLIP_IDS = tuple(range(100, 100 + len(CLIPS)))
+# 每条切片一个方向；提问按关键词映射到对应方向
+TOPICS = {"魔杖": 1, "棍子": 1, "猫头鹰": 4, "鸟": 4}
+
+
+def _one_hot(position: int):
+    vector = np.zeros(len(CLIPS), dtype=np.float32)
+    vector[position] = 1.0
+    return vector
+
+
+def _fake_embed_and_save(db, source_type, items):
+    return {clip_id: _one_hot(CLIP_IDS.index(clip_id)) for clip_id, _ in items}
+
+
+def _fake_embedding(text):
+    for keyword, position in TOPICS.items():
+        if keyword in text:
+            return _one_hot(position)
+    return np.ones(len(CLIPS), dtype=np.float32)
+
+
+def _failing(*args, **kwargs):
+    raise RuntimeError("embedding service down")
+
+
+def _with_stubs(check, embed_and_save=_fake_embed_and_save, embedding=_fake_embedding):
+    originals = (EmbeddingStore.embed_and_save, Embedding.embedding, Embedding.aembedding)
+
+    async def aembedding(text):
+        return embedding(text)
+
+    EmbeddingStore.embed_and_save = embed_and_save
+    Embedding.embedding = embedding
+    Embedding.aembedding = aembedding
+    RoleLore.drop(1)
+    try:
+        check()
+    finally:
+        EmbeddingStore.embed_and_save, Embedding.embedding, Embedding.aembedding = originals
+        RoleLore.drop(1)
+
+
+def test_many_clips_return_top_k():
+    """切片较多的角色只返回最相关的 top-k 条，最相关的排在第一"""
+    assert len(CLIPS) > RoleLore.FULL_CONTEXT_CLIPS and RoleLore.needs_retrieval(CLIPS)
+
+    def check():
+        clips = RoleLore.retrieve(1, CLIP_IDS, CLIPS, "你的魔杖是什么做的", top_k=3)
+        assert 0 < len(clips) <= 3
+        assert clips[0] == CLIPS[1]
+
+        # 没有词面重合时依靠向量检索找到相关切片
+        clips = RoleLore.retrieve(1, CLIP_IDS, CLIPS, "那只白色的鸟", top_k=3)
+        assert clips[0] == CLIPS[4] and len(clips) <= 3
+    _with_stubs(check)
+
+
+def test_async_retrieve_matches_sync():
+    """异步检索与同步检索结果一致"""
+    def check():
+        expected = RoleLore.retrieve(1, CLIP_IDS, CLIPS, "你的猫头鹰叫什么", top_k=2)
+        assert asyncio.run(RoleLore.aretrieve(1, CLIP_IDS, CLIPS, "你的猫头鹰叫什么", top_k=2)) == expected
+        assert expected[0] == CLIPS[4]
+    _with_stubs(check)
+
+
+def test_fallback_returns_first_clips():
+    """索引构建或向量化失败时退回到 clip_index 最靠前的切片"""
+    def check_build_failure():
+        assert RoleLore.retrieve(1, CLIP_IDS, CLIPS, "你的魔杖是什么做的", top_k=3) == list(CLIPS[:3])
+    _with_stubs(check_build_failure, embed_and_save=_failing)
+
+    def check_embedding_failure():
+        assert RoleLore.retrieve(1, CLIP_IDS, CLIPS, "那只白色的鸟") == list(CLIPS[:RoleLore.TOP_K])
+        assert asyncio.run(RoleLore.aretrieve(1, CLIP_IDS, CLIPS, "那只白色的鸟", top_k=2)) == list(CLIPS[:2])
+    _with_stubs(check_embedding_failure, embedding=_failing)
+
+
+def test_retrieved_clips_share_context_budget():
+    """检索到的切片经 ContextBuilder 放入系统提示词，与历史对话共用 token 预算"""
+    prompt = CompiledPrompt(1, "哈利", "你是哈利", CLIPS * 2, CLIP_IDS + tuple(range(200, 200 + len(CLIPS))))
+    assert prompt.retrieve_clips
+    rows = [(f"问题{i}" * 20, f"回答{i}" * 20) for i in range(10)]
+    clips = [CLIPS[1] * 5, CLIPS[4] * 20]
+    budget = 400
+
+    llm = LLM("哈利", prompt.system_prompt, max_turns=MessageService.MAX_TURNS, max_context_tokens=budget)
+    MessageService._add_history_to_llm(llm, rows, None, prompt, clips)
+    system = llm.message[0]["content"]
+    assert "角色设定补充" in system and CLIPS[1] in system
+    # 切片最多占剩余预算的一半，整体不超过预算，最早的历史对话被丢弃
+    assert sum(estimate_message_tokens(message) for message in llm.message) <= budget
+    assert CLIPS[4] * 20 not in system
+    assert llm.message[-1]["content"] == rows[-1][1]
+    assert len(llm.message) < 1 + 2 * len(rows)
+
+    # 没有检索结果时不放入全部切片
+    llm = LLM("哈利", prompt.system_prompt, max_turns=MessageService.MAX_TURNS, max_context_tokens=budget)
+    MessageService._add_history_to_llm(llm, rows, None, prompt)
+    assert "角色设定补充" not in llm.message[0]["content"]
+
+
+if __name__ == "__main__":
+    test_many_clips_return_top_k()
+    test_async_retrieve_matches_sync()
+    test_fallback_returns_first_clips()
+    test_retrieved_clips_share_context_budget()
+    print("✅ 角色设定检索测试通过")
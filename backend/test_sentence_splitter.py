@@ -0,0 +1,82 @@
+"""
+测试流式文本断句
+验证句末标点切分、过短句合并、过长句在次级标点处强制切分，以及生成结束时输出剩余文本
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.llm.sentence_splitter import SentenceSplitter
+
+
+def _split(chunks, **kwargs):
+    splitter = SentenceSplitter(**kwargs)
+    sentences = []
+    for chunk in chunks:
+        sentences.extend(splitter.feed(chunk))
+    return sentences, splitter.flush()
+
+
+def test_split_on_sentence_endings():
+    """句末标点处切分，标点保留在句尾"""
+    sentences, rest = _split(["今天天气很好。我们去公园散步吧！", "好的"])
+    assert sentences == ["今天天气很好。", "我们去公园散步吧！"]
+    assert rest == ["好的"]
+
+
+def test_trailing_punctuation_waits_for_next_chunk():
+    """片段以标点结尾时先不切分，连续标点归入同一句"""
+    splitter = SentenceSplitter()
+    assert splitter.feed("你真的这么想吗？") == []
+    assert splitter.feed("！那太好了") == ["你真的这么想吗？！"]
+    assert splitter.flush() == ["那太好了"]
+
+
+def test_short_sentences_are_merged():
+    """短于 min_chars 的句子与下一句合并"""
+    sentences, rest = _split(["嗯。好。我明白你的意思了。然后"], min_chars=6)
+    assert sentences == ["嗯。好。我明白你的意思了。"]
+    assert rest == ["然后"]
+
+
+def test_long_sentence_cut_at_soft_break():
+    """超过 max_chars 后在逗号等次级标点处强制切分"""
+    text = "一二三四五六七八九十，一二三，四五六七八九，结尾"
+    sentences, rest = _split([text], min_chars=2, max_chars=8)
+    assert sentences == ["一二三四五六七八九十，", "一二三，四五六七八九，"]
+    assert rest == ["结尾"]
+
+
+def test_soft_break_ignored_below_max_chars():
+    """未超过 max_chars 时逗号不切分"""
+    sentences, rest = _split(["你好，世界，再见"], min_chars=2, max_chars=120)
+    assert sentences == []
+    assert rest == ["你好，世界，再见"]
+
+
+def test_split_across_chunk_boundaries():
+    """句子跨多个增量片段时拼接后再切分"""
+    sentences, rest = _split(["我是哈", "利波特", "。很高兴", "认识你。", "再"])
+    assert sentences == ["我是哈利波特。", "很高兴认识你。"]
+    assert rest == ["再"]
+
+
+def test_flush_empties_buffer():
+    """flush 输出剩余文本后清空缓冲区，空白内容不输出"""
+    splitter = SentenceSplitter()
+    splitter.feed("最后一句话")
+    assert splitter.flush() == ["最后一句话"]
+    assert splitter.flush() == []
+    splitter.feed("  \n")
+    assert splitter.flush() == []
+
+
+if __name__ == "__main__":
+    test_split_on_sentence_endings()
+    test_trailing_punctuation_waits_for_next_chunk()
+    test_short_sentences_are_merged()
+    test_long_sentence_cut_at_soft_break()
+    test_soft_break_ignored_below_max_chars()
+    test_split_across_chunk_boundaries()
+    test_flush_empties_buffer()
+    print("✅ 断句测试通过")
@@ -0,0 +1,64 @@
+"""
+测试 TTS 音频内容寻址缓存
+验证缓存键区分文本/音色/语种/模型、TTL 过期、LRU 淘汰与命中统计
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import time
+from app.llm.tts_cache import TTSCache
+
+
+def test_key_covers_all_synthesis_parameters():
+    """文本、音色、语种、模型任意一项不同都得到不同的键"""
+    base = TTSCache.make_key("你好", "Cherry", "Chinese", "qwen3-tts-flash")
+    assert base == TTSCache.make_key("你好", "Cherry", "Chinese", "qwen3-tts-flash")
+    variants = [
+        TTSCache.make_key("你好！", "Cherry", "Chinese", "qwen3-tts-flash"),
+        TTSCache.make_key("你好", "Ethan", "Chinese", "qwen3-tts-flash"),
+        TTSCache.make_key("你好", "Cherry", "English", "qwen3-tts-flash"),
+        TTSCache.make_key("你好", "Cherry", "Chinese", "other-model"),
+    ]
+    assert len({base, *variants}) == 5
+
+
+def test_get_put_and_stats():
+    """命中与未命中都计入统计"""
+    cache = TTSCache()
+    assert cache.get("k") is None
+    cache.put("k", "/api/audio/a.wav")
+    assert cache.get("k") == "/api/audio/a.wav"
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1 and stats["hit_rate"] == 0.5
+
+
+def test_entries_expire_after_ttl():
+    """超过有效期的条目视为未命中并被移除，单条 ttl 优先于默认值"""
+    cache = TTSCache(ttl=60)
+    cache.put("short", "url", ttl=0.01)
+    cache.put("long", "url")
+    time.sleep(0.02)
+    assert cache.get("short") is None
+    assert cache.get("long") == "url"
+    assert cache.stats()["entries"] == 1
+
+
+def test_lru_eviction():
+    """超出容量时淘汰最久未使用的条目"""
+    cache = TTSCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # a 变为最近使用
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+if __name__ == "__main__":
+    test_key_covers_all_synthesis_parameters()
+    test_get_put_and_stats()
+    test_entries_expire_after_ttl()
+    test_lru_eviction()
+    print("✅ TTS缓存测试通过")